@@ -0,0 +1,140 @@
+import math
+import time
+import asyncio
+from collections import deque
+
+class Rejected(Exception):
+    """запрос не допущен:status_code 503(перегрузка)или 429(лимит клиента)"""
+    def __init__(self,status_code,reason,retry_after):
+        super().__init__(reason)
+        self.status_code=status_code
+        self.reason=reason
+        self.retry_after=retry_after
+
+class AdmissionController:
+    """допуск к /predict:не больше max_in_flight одновременно,до max_queue ждут
+    не дольше queue_timeout секунд,остальным сразу отказ с Retry-After.
+    per_client-сколько запросов одного клиента могут выполняться и ждать(0-без лимита).
+    работает в цикле событий:ожидание в очереди не занимает поток пула,
+    куда синхронные эндпоинты иначе выстраиваются без ограничений"""
+    def __init__(self,max_in_flight=8,max_queue=16,per_client=0,queue_timeout=1.0):
+        self.enabled=max_in_flight>0
+        self.max_in_flight=max_in_flight
+        self.max_queue=max_queue
+        self.per_client=per_client
+        self.queue_timeout=queue_timeout
+        self.in_flight=0
+        self.waiters=deque()
+        self.clients={}
+        #скользящее среднее времени обработки для Retry-After
+        self.service_time=0.01
+        self.stats={
+            'admitted':0,
+            'admitted_after_wait':0,
+            'rejected_queue_full':0,
+            'rejected_timeout':0,
+            'rejected_client':0,
+            'max_queue_depth':0,
+            'queue_wait_seconds':0.0,
+            #деградация под нагрузкой(считает вызывающий код)
+            'served_from_cache':0,
+            'history_skipped':0
+        }
+
+    def retry_after(self):
+        """секунд до того,как очередь успеет разойтись(не меньше 1)"""
+        return max(1,math.ceil((len(self.waiters)+1)*self.service_time/max(self.max_in_flight,1)))
+
+    def _leave(self,client):
+        count=self.clients.get(client,0)-1
+        if count>0:
+            self.clients[client]=count
+        else:
+            self.clients.pop(client,None)
+
+    def _hand_over(self):
+        """освободившийся слот-первому живому ожидающему"""
+        while self.waiters:
+            waiter=self.waiters.popleft()
+            if not waiter.done():
+                self.in_flight+=1
+                waiter.set_result(True)
+                return
+
+    async def acquire(self,client=None):
+        """допуск или Rejected;True-если пришлось ждать в очереди(система под нагрузкой)"""
+        if not self.enabled:
+            return False
+        if self.per_client and self.clients.get(client,0)>=self.per_client:
+            self.stats['rejected_client']+=1
+            raise Rejected(429,'client_limit',self.retry_after())
+        self.clients[client]=self.clients.get(client,0)+1
+
+        #новый запрос не обгоняет очередь
+        if self.in_flight<self.max_in_flight and not self.waiters:
+            self.in_flight+=1
+            self.stats['admitted']+=1
+            return False
+
+        if len(self.waiters)>=self.max_queue:
+            self._leave(client)
+            self.stats['rejected_queue_full']+=1
+            raise Rejected(503,'queue_full',self.retry_after())
+
+        waiter=asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        self.stats['max_queue_depth']=max(self.stats['max_queue_depth'],len(self.waiters))
+        start=time.monotonic()
+        try:
+            await asyncio.wait_for(waiter,self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._leave(client)
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+            self.stats['rejected_timeout']+=1
+            raise Rejected(503,'queue_timeout',self.retry_after())
+        except asyncio.CancelledError:
+            #клиент ушел,пока ждал:если слот уже передан-возвращаем его
+            self._leave(client)
+            if waiter.done()and not waiter.cancelled():
+                self.in_flight-=1
+                self._hand_over()
+            elif waiter in self.waiters:
+                self.waiters.remove(waiter)
+            raise
+        self.stats['admitted']+=1
+        self.stats['admitted_after_wait']+=1
+        self.stats['queue_wait_seconds']+=time.monotonic()-start
+        return True
+
+    def release(self,client=None,seconds=None):
+        if not self.enabled:
+            return
+        self.in_flight-=1
+        self._leave(client)
+        if seconds is not None:
+            self.service_time=0.9*self.service_time+0.1*seconds
+        self._hand_over()
+
+    def record(self,name):
+        self.stats[name]+=1
+
+    def overloaded(self):
+        """есть очередь-значит,все слоты заняты"""
+        return self.enabled and bool(self.waiters)
+
+    def snapshot(self):
+        stats=dict(self.stats)
+        stats.update({
+            'in_flight':self.in_flight,
+            'queue_depth':len(self.waiters),
+            'clients':len(self.clients),
+            'service_time_ms':round(self.service_time*1000,2)
+        })
+        rejected=stats['rejected_queue_full']+stats['rejected_timeout']+stats['rejected_client']
+        total=stats['admitted']+rejected
+        stats['rejected']=rejected
+        stats['rejection_rate']=round(rejected/total,4)if total else 0.0
+        stats['avg_queue_wait_ms']=round(stats['queue_wait_seconds']/stats['admitted_after_wait']*1000,2)if stats['admitted_after_wait']else 0.0
+        stats['queue_wait_seconds']=round(stats['queue_wait_seconds'],3)
+        return stats
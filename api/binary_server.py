@@ -0,0 +1,163 @@
+import os
+import errno
+import fcntl
+import socket
+import struct
+import asyncio
+import importlib.util
+
+#кадр:4 байта длины(big-endian)+тело msgpack
+HEADER=struct.Struct('>I')
+MAX_FRAME=64*1024*1024
+
+def pack_frame(message):
+    import msgpack
+    body=msgpack.packb(message,use_bin_type=True)
+    return HEADER.pack(len(body))+body
+
+async def _serve_connection(handler,reader,writer):
+    """кадры одного соединения по очереди;клиент может слать следующие,
+    не дожидаясь ответов,ответы приходят в том же порядке"""
+    import msgpack
+    try:
+        while True:
+            try:
+                header=await reader.readexactly(HEADER.size)
+            except asyncio.IncompleteReadError:
+                break
+            (size,)=HEADER.unpack(header)
+            if size>MAX_FRAME:
+                writer.write(pack_frame({'error':f"кадр больше{MAX_FRAME}байт"}))
+                await writer.drain()
+                break
+            body=await reader.readexactly(size)
+
+            request=None
+            try:
+                request=msgpack.unpackb(body,raw=False)
+                #модель считает в потоке,цикл событий uvicorn не блокируется
+                response=await asyncio.to_thread(handler,request)
+            except Exception as e:
+                response={'error':str(e)}
+            if isinstance(request,dict)and'id'in request:
+                response['id']=request['id']
+            writer.write(pack_frame(response))
+            await writer.drain()
+    except(ConnectionError,asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+def _socket_in_use(path):
+    sock=socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        return True
+    except(ConnectionRefusedError,FileNotFoundError):
+        return False
+    finally:
+        sock.close()
+
+def _bind_unix(path):
+    """unix-сокет делить между процессами нельзя(SO_REUSEPORT для него не работает):
+    первый воркер слушает path,остальные-path.<pid>.живой сокет другого воркера
+    не удаляется,файл от прошлого запуска-удаляется.выбор под файловой блокировкой,
+    чтобы одновременно стартующие воркеры не удалили сокет друг друга"""
+    with open(f"{path}.lock",'w')as lock:
+        fcntl.flock(lock,fcntl.LOCK_EX)
+        for candidate in(path,f"{path}.{os.getpid()}"):
+            if os.path.exists(candidate)and not _socket_in_use(candidate):
+                os.unlink(candidate)
+            sock=socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+            try:
+                sock.bind(candidate)
+                return sock
+            except OSError as e:
+                sock.close()
+                if e.errno!=errno.EADDRINUSE:
+                    raise
+    raise OSError(errno.EADDRINUSE,f"{path}занят")
+
+async def start_binary_server(handler,host='127.0.0.1',port=None,path=None):
+    """TCP(port)или unix-сокет(path);handler(dict)->dict вызывается в потоке"""
+    #без msgpack сервер не стартует,а не падает на первом кадре
+    if importlib.util.find_spec('msgpack')is None:
+        raise ImportError("для бинарного протокола нужен пакет msgpack")
+    serve=lambda reader,writer:_serve_connection(handler,reader,writer)
+    if path:
+        #свой сокет:start_unix_server(path=...)сам удаляет существующий файл,даже живой
+        return await asyncio.start_unix_server(serve,sock=_bind_unix(path))
+    #несколько воркеров uvicorn делят один порт
+    return await asyncio.start_server(serve,host,port,reuse_port=hasattr(socket,'SO_REUSEPORT'))
+
+def stop_binary_server(server):
+    """закрытие;файл своего unix-сокета и файл блокировки _bind_unix удаляются"""
+    paths=[sock.getsockname()for sock in server.sockets if sock.family==socket.AF_UNIX]
+    server.close()
+    suffix=f".{os.getpid()}"
+    for path in paths:
+        base=path[:-len(suffix)]if path.endswith(suffix)else path
+        #под той же блокировкой:стартующий воркер не выбирает сокет,пока файл удаляется
+        try:
+            with open(f"{base}.lock",'a')as lock:
+                fcntl.flock(lock,fcntl.LOCK_EX)
+                for name in(path,f"{base}.lock"):
+                    try:
+                        os.unlink(name)
+                    except OSError:
+                        pass
+        except OSError:
+            pass
+
+class BinaryClient:
+    """синхронный клиент:predict для одного кадра,predict_many-конвейером"""
+    def __init__(self,host='127.0.0.1',port=None,path=None,timeout=30):
+        import msgpack
+        self.msgpack=msgpack
+        if path:
+            self.sock=socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+            self.sock.settimeout(timeout)
+            self.sock.connect(path)
+        else:
+            self.sock=socket.create_connection((host,port),timeout=timeout)
+            self.sock.setsockopt(socket.IPPROTO_TCP,socket.TCP_NODELAY,1)
+        self.stream=self.sock.makefile('rb')
+
+    def send(self,message):
+        self.sock.sendall(pack_frame(message))
+
+    def receive(self):
+        header=self.stream.read(HEADER.size)
+        if len(header)<HEADER.size:
+            raise ConnectionError("сервер закрыл соединение")
+        (size,)=HEADER.unpack(header)
+        return self.msgpack.unpackb(self.stream.read(size),raw=False)
+
+    def call(self,message):
+        self.send(message)
+        return self.receive()
+
+    def meta(self):
+        """версия модели и словари категорий:код-номер значения в classes"""
+        return self.call({'op':'meta'})
+
+    def predict(self,codes,year,power):
+        """codes-строки кодов в порядке categorical_cols,year/power-массивы той же длины"""
+        return self.call({'op':'predict','codes':codes,'year':year,'power':power})
+
+    def predict_many(self,batches,window=8):
+        """batches-[(codes,year,power)];до window кадров в полете"""
+        results=[]
+        sent=0
+        for codes,year,power in batches:
+            self.send({'op':'predict','id':sent,'codes':codes,'year':year,'power':power})
+            sent+=1
+            if sent-len(results)>=window:
+                results.append(self.receive())
+        while len(results)<sent:
+            results.append(self.receive())
+        return results
+
+    def close(self):
+        self.stream.close()
+        self.sock.close()
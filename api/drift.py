@@ -0,0 +1,320 @@
+import math
+import random
+import zlib
+import threading
+import numpy as np
+
+#простое Мерсенна для универсального хэша count-min
+_PRIME=(1<<61)-1
+
+class CountMinSketch:
+    """частоты категорий в фиксированной памяти depth x width.
+    строки хэшируются crc32,а не hash():он случайный в каждом процессе,
+    а эталон строится при обучении"""
+    def __init__(self,width=1024,depth=4,seed=1,table=None,total=0.0):
+        self.width=width
+        self.depth=depth
+        self.seed=seed
+        rng=random.Random(seed)
+        self.coef=[(rng.randrange(1,_PRIME),rng.randrange(0,_PRIME))for _ in range(depth)]
+        self.table=np.zeros((depth,width))if table is None else np.array(table,dtype=np.float64)
+        #плоский вид той же памяти:одно обновление на значение вместо depth
+        self.flat=self.table.reshape(-1)
+        self.total=float(total)
+        #индексы уже встреченных значений:в api приходят только классы словаря
+        self._cache={}
+
+    def _index(self,value):
+        idx=self._cache.get(value)
+        if idx is None:
+            h=zlib.crc32(str(value).encode('utf-8'))
+            idx=np.array([row*self.width+(a*h+b)%_PRIME%self.width for row,(a,b)in enumerate(self.coef)])
+            if len(self._cache)<100000:
+                self._cache[value]=idx
+        return idx
+
+    def add(self,value,count=1.0):
+        self.flat[self._index(value)]+=count
+        self.total+=count
+
+    def add_many(self,values):
+        idx=np.concatenate([self._index(v)for v in values])
+        self.flat+=np.bincount(idx,minlength=self.flat.size)
+        self.total+=len(values)
+
+    def add_counts(self,counts):
+        """{значение:вес}-для эталона при обучении"""
+        for value,count in counts.items():
+            self.add(value,float(count))
+
+    def estimate(self,value):
+        return float(self.flat[self._index(value)].min())
+
+    def merge(self,other):
+        return CountMinSketch(self.width,self.depth,self.seed,self.table+other.table,self.total+other.total)
+
+    def distance(self,other):
+        """(tv,превышение шума)other относительно self(эталона).
+        tv-расстояние полной вариации по корзинам хэша:коллизии только склеивают
+        значения,поэтому это нижняя оценка настоящего;берем лучшую из depth строк.
+        у выборки из n запросов tv>0 и без дрейфа(~0.5*sum sqrt(2q(1-q)/(pi*n))),
+        при большом словаре(name)это десятые доли-оценка дрейфа считается сверх него"""
+        if not self.total or not other.total:
+            return None,None
+        q=self.table/self.total
+        tv=0.5*np.abs(q-other.table/other.total).sum(axis=1)
+        noise=0.5*np.sqrt(2*q*(1-q)/(math.pi*other.total)).sum(axis=1)
+        return float(tv.max()),float(max((tv-noise).max(),0.0))
+
+    def empty(self):
+        return CountMinSketch(self.width,self.depth,self.seed)
+
+    def to_dict(self):
+        return{'type':'count_min','width':self.width,'depth':self.depth,'seed':self.seed,'table':self.table,'total':self.total}
+
+class HistogramSketch:
+    """квантили по гистограмме с фиксированными корзинами[low,high)(log-в логарифме)
+    плюс корзины ниже и выше диапазона-доля значений вне обучающих данных"""
+    def __init__(self,low,high,bins=64,log=False,counts=None):
+        self.low=float(low)
+        self.high=float(high)
+        self.bins=int(bins)
+        self.log=log
+        self.width=(self.high-self.low)/self.bins
+        self.counts=np.zeros(self.bins+2)if counts is None else np.asarray(counts,dtype=np.float64)
+
+    @classmethod
+    def for_values(cls,values,bins=64,log=False,integer=False):
+        """диапазон по обучающим значениям;целым(год)-корзина на каждое значение"""
+        values=np.asarray(values,dtype=np.float64)
+        if log:
+            values=np.log(np.maximum(values,1.0))
+        low,high=float(values.min()),float(values.max())
+        if integer:
+            return cls(low-0.5,high+0.5,int(high-low)+1,log)
+        return cls(low,high+max((high-low)*1e-6,1e-9),bins,log)
+
+    def add_many(self,values,weights=None):
+        values=np.asarray(values,dtype=np.float64)
+        if self.log:
+            values=np.log(np.maximum(values,1.0))
+        idx=np.clip(np.floor((values-self.low)/self.width).astype(np.int64)+1,0,self.bins+1)
+        idx[values<self.low]=0
+        idx[values>=self.high]=self.bins+1
+        self.counts+=np.bincount(idx,weights=weights,minlength=self.bins+2)
+
+    @property
+    def total(self):
+        return float(self.counts.sum())
+
+    def quantile(self,q):
+        """линейно внутри корзины;вне диапазона-его граница"""
+        total=self.total
+        if not total:
+            return None
+        target=q*total
+        cum=np.cumsum(self.counts)
+        i=int(np.searchsorted(cum,target,side='left'))
+        if i==0:
+            value=self.low
+        elif i>self.bins:
+            value=self.high
+        else:
+            before=cum[i-1]
+            frac=(target-before)/self.counts[i]if self.counts[i]else 0.0
+            value=self.low+(i-1+frac)*self.width
+        return float(math.exp(value))if self.log else float(value)
+
+    def out_of_range(self):
+        total=self.total
+        return float((self.counts[0]+self.counts[-1])/total)if total else None
+
+    def compare(self,other):
+        """ks-наибольшая разница функций распределения,его превышение над
+        критическим значением 5%(1.36*sqrt(1/n+1/m))и psi-индекс стабильности"""
+        if not self.total or not other.total:
+            return None,None,None
+        p=self.counts/self.total
+        q=other.counts/other.total
+        ks=float(np.abs(np.cumsum(p)-np.cumsum(q)).max())
+        critical=1.36*math.sqrt(1/self.total+1/other.total)
+        p=np.maximum(p,1e-4)
+        q=np.maximum(q,1e-4)
+        return ks,max(ks-critical,0.0),float(np.sum((q-p)*np.log(q/p)))
+
+    def merge(self,other):
+        return HistogramSketch(self.low,self.high,self.bins,self.log,self.counts+other.counts)
+
+    def empty(self):
+        return HistogramSketch(self.low,self.high,self.bins,self.log)
+
+    def to_dict(self):
+        return{'type':'histogram','low':self.low,'high':self.high,'bins':self.bins,'log':self.log,'counts':self.counts}
+
+def sketch_from_dict(data):
+    data=dict(data)
+    kind=data.pop('type')
+    if kind=='count_min':
+        return CountMinSketch(**data)
+    return HistogramSketch(**data)
+
+def build_reference(df,categorical_cols,numerical_cols,predicted_price,weights=None,like=None):
+    """эталонные скетчи обучающих данных и прогнозов модели на них(хранятся в feature_info).
+    like-эталон,чьи диапазоны гистограмм взять(новый кусок при дообучении)"""
+    weights=np.ones(len(df))if weights is None else np.asarray(weights,dtype=np.float64)
+    template={name:sketch_from_dict(data).empty()for name,data in like['sketches'].items()}if like else{}
+    sketches={}
+    for col in categorical_cols:
+        cms=template.get(col)or CountMinSketch()
+        counts={}
+        for value,w in zip(df[col].astype(str),weights):
+            counts[value]=counts.get(value,0.0)+w
+        cms.add_counts(counts)
+        sketches[col]=cms
+    for col in list(numerical_cols)+['price']:
+        values=np.asarray(predicted_price if col=='price'else df[col],dtype=np.float64)
+        sketch=template.get(col)or HistogramSketch.for_values(values,log=col=='price',integer=col=='year')
+        sketch.add_many(values,weights)
+        sketches[col]=sketch
+    return{'rows':float(weights.sum()),'sketches':{name:s.to_dict()for name,s in sketches.items()}}
+
+def merge_reference(reference,other):
+    """эталон старых данных+эталон нового куска,построенный с like=reference"""
+    return{
+        'rows':reference['rows']+other['rows'],
+        'sketches':{
+            name:sketch_from_dict(data).merge(sketch_from_dict(other['sketches'][name])).to_dict()
+            for name,data in reference['sketches'].items()
+        }
+    }
+
+def default_reference(unique_data,categorical_cols):
+    """пустые скетчи по справочнику для артефактов без эталона:
+    живые квантили и доли неизвестных есть,оценок дрейфа нет"""
+    years=unique_data.get('years')or[1990,2024]
+    sketches={col:CountMinSketch()for col in categorical_cols}
+    sketches['year']=HistogramSketch(min(years)-0.5,max(years)+0.5,int(max(years)-min(years))+1)
+    sketches['power']=HistogramSketch(unique_data.get('min_power',50),unique_data.get('max_power',1000)+1)
+    sketches['price']=HistogramSketch(math.log(10000),math.log(10000000),log=True)
+    return{'rows':0.0,'sketches':{name:s.to_dict()for name,s in sketches.items()}}
+
+class DriftMonitor:
+    """живые скетчи запросов /predict против эталона обучения.
+    память постоянная:два окна по window запросов-текущее и предыдущее,
+    оценка идет по их объединению(последние window..2*window запросов).
+    запрос только дописывается в буфер,в скетчи он попадает пакетом по batch_size"""
+    def __init__(self,reference,categorical_cols,numerical_cols,window=10000,min_samples=200,threshold=0.1,top_unknown=10,batch_size=256):
+        self.reference={name:sketch_from_dict(data)for name,data in reference['sketches'].items()}
+        self.has_reference=reference.get('rows',0)>0
+        self.reference_rows=reference.get('rows',0)
+        self.categorical_cols=list(categorical_cols)
+        self.numerical_cols=list(numerical_cols)
+        self.window=window
+        self.min_samples=min_samples
+        self.threshold=threshold
+        self.top_unknown=top_unknown
+        self.batch_size=batch_size
+        self.lock=threading.Lock()
+        self.pending=[]
+        self.current=self._empty()
+        self.previous=None
+        self.observed=0
+        #частые неизвестные значения(Misra-Gries,не больше top_unknown ключей на колонку)
+        self.unknown={col:{}for col in self.categorical_cols}
+
+    def _empty(self):
+        return{
+            'n':0,
+            'sketches':{name:s.empty()for name,s in self.reference.items()},
+            'methods':{col:{}for col in self.categorical_cols}
+        }
+
+    def _track_unknown(self,col,value):
+        counters=self.unknown[col]
+        if value in counters or len(counters)<self.top_unknown:
+            counters[value]=counters.get(value,0)+1
+            return
+        for key in list(counters):
+            counters[key]-=1
+            if counters[key]<=0:
+                del counters[key]
+
+    def observe(self,car_data,resolution,price):
+        """один запрос:разобранные категории,исходные год/мощность,прогноз"""
+        with self.lock:
+            self.pending.append((car_data,price))
+            for col,item in(resolution or{}).items():
+                methods=self.current['methods'][col]
+                methods[item['method']]=methods.get(item['method'],0)+1
+                if item['method']=='fallback':
+                    self._track_unknown(col,str(item['input']))
+            self.observed+=1
+            if len(self.pending)>=self.batch_size:
+                self._flush()
+
+    def _flush(self):
+        """буфер->скетчи текущего окна(под блокировкой)"""
+        pending,self.pending=self.pending,[]
+        if not pending:
+            return
+        sketches=self.current['sketches']
+        for col in self.categorical_cols+self.numerical_cols:
+            sketches[col].add_many([car[col]for car,_ in pending])
+        sketches['price'].add_many([price for _,price in pending])
+        self.current['n']+=len(pending)
+        if self.current['n']>=self.window:
+            self.previous=self.current
+            self.current=self._empty()
+
+    def _live(self):
+        """копия окон под блокировкой,объединение-уже без нее"""
+        with self.lock:
+            self._flush()
+            windows=[self.current]+([self.previous]if self.previous else[])
+            windows=[(w['n'],{name:s.merge(s.empty())for name,s in w['sketches'].items()},
+                      {col:dict(m)for col,m in w['methods'].items()})for w in windows]
+            unknown={col:dict(c)for col,c in self.unknown.items()}
+        n,sketches,methods=windows[0]
+        for other_n,other_sketches,other_methods in windows[1:]:
+            n+=other_n
+            sketches={name:s.merge(other_sketches[name])for name,s in sketches.items()}
+            for col,m in other_methods.items():
+                for method,count in m.items():
+                    methods[col][method]=methods[col].get(method,0)+count
+        return n,sketches,methods,unknown
+
+    def snapshot(self):
+        n,live,methods,unknown=self._live()
+        features={}
+        for col in self.categorical_cols:
+            tv,excess=self.reference[col].distance(live[col])if self.has_reference else(None,None)
+            features[col]={
+                'score':excess,
+                'tv':tv,
+                'resolved':methods[col],
+                'fallback_rate':round(methods[col].get('fallback',0)/n,4)if n else 0.0,
+                'top_unknown':sorted(unknown[col],key=lambda k:-unknown[col][k])
+            }
+        for col in self.numerical_cols+['price']:
+            ks,excess,psi=self.reference[col].compare(live[col])if self.has_reference else(None,None,None)
+            features[col]={
+                'score':excess,
+                'ks':ks,
+                'psi':psi,
+                'out_of_range':live[col].out_of_range(),
+                'live':{f'p{int(q*100)}':live[col].quantile(q)for q in(0.05,0.5,0.95)},
+                'reference':{f'p{int(q*100)}':self.reference[col].quantile(q)for q in(0.05,0.5,0.95)}
+            }
+        scores={name:f['score']for name,f in features.items()if f['score']is not None}
+        warming_up=n<self.min_samples
+        return{
+            'has_reference':self.has_reference,
+            'reference_rows':self.reference_rows,
+            'observed':self.observed,
+            'window_rows':n,
+            'status':'no_reference'if not self.has_reference else('warming_up'if warming_up else'ok'),
+            'drift_score':max(scores.values())if scores else None,
+            'threshold':self.threshold,
+            'drifted':[]if warming_up else sorted(name for name,s in scores.items()if s>=self.threshold),
+            'features':features
+        }
@@ -0,0 +1,105 @@
+import numpy as np
+from inference import predict_log
+
+METHODS=['occlusion','integrated_gradients']
+
+def feature_names(feature_info):
+    """порядок признаков на входе модели:сначала числовые,затем коды категорий"""
+    return list(feature_info['numerical_cols'])+list(feature_info['categorical_cols'])
+
+def make_gradient(model):
+    """прогноз и градиент по входу одним графом"""
+    import tensorflow as tf
+    input_dim=model.input_shape[-1]
+
+    @tf.function(input_signature=[tf.TensorSpec([None,input_dim],tf.float32)])
+    def gradient(x):
+        with tf.GradientTape()as tape:
+            tape.watch(x)
+            y=model(x,training=False)
+        return y,tape.gradient(y,x)
+
+    return gradient
+
+def make_baseline(feature_info,scaler,encoders):
+    """базовая точка во входном пространстве и ее исходные значения.
+    из feature_info['baseline'](мода категорий,средние чисел при обучении);
+    для старых артефактов-средние скейлера и средний код словаря"""
+    stored=feature_info.get('baseline')or{}
+    values={}
+    numerical=[]
+    for i,col in enumerate(feature_info['numerical_cols']):
+        values[col]=float(stored.get(col,scaler.mean_[i]))
+        numerical.append(values[col])
+    scaled=(np.asarray(numerical)-scaler.mean_)/scaler.scale_
+
+    codes=[]
+    for col in feature_info['categorical_cols']:
+        classes=[str(v)for v in encoders[col].classes_]
+        code=classes.index(stored[col])if stored.get(col)in classes else len(classes)//2
+        values[col]=classes[code]
+        codes.append(code)
+    return np.concatenate([scaled,codes]).astype(np.float32),values
+
+def occlusion(forward,features,baseline):
+    """вклад признака-насколько изменится log цены,если заменить его базовым значением.
+    n машин->один батч n*(d+1)+1 строк:исходная строка,d строк с одной заменой
+    на каждую машину и сама базовая точка"""
+    features=np.asarray(features,dtype=np.float32)
+    n,d=features.shape
+    batch=np.repeat(features[:,None,:],d+1,axis=1)
+    idx=np.arange(d)
+    batch[:,idx+1,idx]=baseline[idx]
+    logs=predict_log(forward,np.concatenate([batch.reshape(-1,d),baseline[None,:]]))
+    base_log=logs[-1]
+    logs=logs[:-1].reshape(n,d+1)
+    return logs[:,0],logs[:,:1]-logs[:,1:],np.full(n,base_log)
+
+def integrated_gradients(gradient,features,baseline,steps=32):
+    """интегрированные градиенты от базовой точки(метод средних точек).
+    путь всех n машин,сами машины и базовая точка-один батч n*steps+n+1 строк;
+    сумма вкладов~log цены минус log базовой цены"""
+    features=np.asarray(features,dtype=np.float32)
+    n,d=features.shape
+    alphas=((np.arange(steps)+0.5)/steps).astype(np.float32)
+    path=baseline+alphas[None,:,None]*(features[:,None,:]-baseline)
+    batch=np.concatenate([path.reshape(-1,d),features,baseline[None,:]])
+    y,grads=gradient(batch)
+    y=y.numpy().reshape(-1)
+    grads=grads.numpy()[:n*steps].reshape(n,steps,d)
+    contributions=(features-baseline)*grads.mean(axis=1)
+    return y[n*steps:n*steps+n],contributions,np.full(n,y[-1])
+
+def explain(method,features,rows,names,baseline,baseline_values,forward,gradient=None,steps=32):
+    """объяснения для пакета:rows-исходные значения признаков каждой машины"""
+    if method=='occlusion':
+        point_log,contributions,base_log=occlusion(forward,features,baseline)
+    elif method=='integrated_gradients':
+        point_log,contributions,base_log=integrated_gradients(gradient,features,baseline,steps)
+    else:
+        raise ValueError(f"метод{method}не поддерживается,доступно:{METHODS}")
+
+    result=[]
+    for i,row in enumerate(rows):
+        price=float(np.expm1(point_log[i]))
+        items=[]
+        for j,name in enumerate(names):
+            c=float(contributions[i,j])
+            items.append({
+                'feature':name,
+                'value':row[name],
+                'baseline':baseline_values[name],
+                'log_contribution':round(c,5),
+                #изменение цены при замене только этого признака базовым значением
+                'price_effect':round(float((price+1)*(1-np.exp(-c))),2),
+                'percent':round(float(np.expm1(c))*100,2)
+            })
+        items.sort(key=lambda item:-abs(item['log_contribution']))
+        result.append({
+            'method':method,
+            'predicted_price':price,
+            'log_price':float(point_log[i]),
+            'baseline_price':float(np.expm1(base_log[i])),
+            'contributions':items
+        })
+    return result
@@ -0,0 +1,142 @@
+import io
+import csv
+import sys
+import json
+import sqlite3
+import argparse
+import importlib.util
+from datetime import datetime
+
+from history_store import HistoryStore
+
+EXPORT_COLUMNS=['id','timestamp','brand','name','year','power','bodyType','color','fuelType','predicted_price','model_version']
+FORMATS={
+    'ndjson':'application/x-ndjson',
+    'csv':'text/csv; charset=utf-8',
+    'parquet':'application/vnd.apache.parquet'
+}
+
+def iter_history_batches(store,since=None,until=None,batch_size=5000):
+    """строки истории пачками через fetchmany,в памяти только одна пачка"""
+    #StreamingResponse может звать генератор из разных потоков пула,
+    #поэтому соединение открывается без привязки к потоку(HistoryStore.connect)
+    conn=store.connect()
+    try:
+        yield from store.iter_batches(conn.cursor(),since,until,batch_size)
+    finally:
+        conn.close()
+
+def _ndjson(batches):
+    for rows in batches:
+        yield''.join(json.dumps(dict(zip(EXPORT_COLUMNS,row)),ensure_ascii=False)+'\n'for row in rows).encode('utf-8')
+
+def _csv(batches):
+    buf=io.StringIO()
+    writer=csv.writer(buf)
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in batches:
+        writer.writerows(rows)
+        yield buf.getvalue().encode('utf-8')
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode('utf-8')
+
+class _ChunkSink:
+    """файлоподобный приемник для parquet:отдает записанное кусками,
+    tell()считает все байты,чтобы смещения в футере были верными"""
+    def __init__(self):
+        self.chunks=[]
+        self.position=0
+        self.closed=False
+
+    def write(self,data):
+        data=bytes(data)
+        self.chunks.append(data)
+        self.position+=len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed=True
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def drain(self):
+        data=b''.join(self.chunks)
+        self.chunks=[]
+        return data
+
+def _parquet(batches):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema=pa.schema([
+        ('id',pa.int64()),
+        ('timestamp',pa.string()),
+        ('brand',pa.string()),
+        ('name',pa.string()),
+        ('year',pa.int32()),
+        ('power',pa.int32()),
+        ('bodyType',pa.string()),
+        ('color',pa.string()),
+        ('fuelType',pa.string()),
+        ('predicted_price',pa.float64()),
+        ('model_version',pa.string())
+    ])
+    sink=_ChunkSink()
+    writer=pq.ParquetWriter(pa.PythonFile(sink,mode='w'),schema,compression='zstd')
+    for rows in batches:
+        columns=list(zip(*rows))
+        #одна пачка fetchmany->одна row group
+        writer.write_batch(pa.record_batch([pa.array(col,type=field.type)for col,field in zip(columns,schema)],schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+def stream_history(fmt='ndjson',store=None,since=None,until=None,batch_size=5000):
+    """генератор байтов экспорта в нужном формате"""
+    if fmt not in FORMATS:
+        raise ValueError(f"формат{fmt}не поддерживается,доступно:{list(FORMATS)}")
+    #ошибки отсутствия pyarrow и неверного времени показываем до начала ответа
+    if fmt=='parquet'and importlib.util.find_spec('pyarrow')is None:
+        raise ImportError("No module named 'pyarrow'")
+    since=datetime.fromisoformat(since)if isinstance(since,str)else since
+    until=datetime.fromisoformat(until)if isinstance(until,str)else until
+    serializer={'ndjson':_ndjson,'csv':_csv,'parquet':_parquet}[fmt]
+    return serializer(iter_history_batches(store or HistoryStore(read_only=True),since,until,batch_size))
+
+def main():
+    parser=argparse.ArgumentParser(description="потоковая выгрузка истории предсказаний")
+    parser.add_argument('--db',default='history.db')
+    parser.add_argument('--format',choices=list(FORMATS),default='ndjson')
+    parser.add_argument('--since',help="ISO-время,включительно")
+    parser.add_argument('--until',help="ISO-время,не включительно")
+    parser.add_argument('--batch-size',type=int,default=5000)
+    parser.add_argument('-o','--output',help="файл,по умолчанию stdout")
+    args=parser.parse_args()
+
+    #выгрузка не меняет файл истории:без создания таблиц и перехода в WAL
+    try:
+        chunks=stream_history(args.format,HistoryStore(args.db,read_only=True),args.since,args.until,args.batch_size)
+    except(ValueError,ImportError,sqlite3.Error)as e:
+        parser.exit(1,f"ошибка:{e}\n")
+    out=open(args.output,'wb')if args.output else sys.stdout.buffer
+    try:
+        for chunk in chunks:
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,164 @@
+import math
+
+#корзины гистограммы цен:шаг 5% в логарифме,ошибка перцентиля не больше ~2.5%
+BUCKET_BASE=math.log(1.05)
+GROUP_COLUMNS=['day','brand','model','year']
+
+def price_bucket(price):
+    return int(math.floor(math.log(max(float(price),1.0))/BUCKET_BASE))
+
+def bucket_price(bucket):
+    """середина корзины"""
+    return math.exp((bucket+0.5)*BUCKET_BASE)
+
+def init_rollup_tables(cursor):
+    """сводные таблицы по дню/марке/модели/году"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS history_rollup(
+            day TEXT,
+            brand TEXT,
+            model TEXT,
+            year INTEGER,
+            count INTEGER,
+            sum_price REAL,
+            sum_sq_price REAL,
+            PRIMARY KEY(day,brand,model,year)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS history_rollup_hist(
+            day TEXT,
+            brand TEXT,
+            model TEXT,
+            year INTEGER,
+            bucket INTEGER,
+            count INTEGER,
+            PRIMARY KEY(day,brand,model,year,bucket)
+        )
+    ''')
+
+def record_rollup(cursor,timestamp,brand,model,year,price,sign=1):
+    """инкрементное обновление сводок при записи(sign=1)или удалении(sign=-1)"""
+    day=str(timestamp)[:10]
+    price=float(price)
+    bucket=price_bucket(price)
+    cursor.execute('''
+        INSERT INTO history_rollup(day,brand,model,year,count,sum_price,sum_sq_price)
+        VALUES(?,?,?,?,?,?,?)
+        ON CONFLICT(day,brand,model,year)DO UPDATE SET
+            count=count+excluded.count,
+            sum_price=sum_price+excluded.sum_price,
+            sum_sq_price=sum_sq_price+excluded.sum_sq_price
+    ''',(day,brand,model,year,sign,sign*price,sign*price*price))
+    cursor.execute('''
+        INSERT INTO history_rollup_hist(day,brand,model,year,bucket,count)
+        VALUES(?,?,?,?,?,?)
+        ON CONFLICT(day,brand,model,year,bucket)DO UPDATE SET
+            count=count+excluded.count
+    ''',(day,brand,model,year,bucket,sign))
+    if sign<0:
+        #только уменьшенные строки,а не вся таблица сводок
+        key='day=? AND brand IS ? AND model IS ? AND year IS ?'
+        cursor.execute(f'DELETE FROM history_rollup WHERE {key} AND count<=0',(day,brand,model,year))
+        cursor.execute(f'DELETE FROM history_rollup_hist WHERE {key} AND bucket=? AND count<=0',(day,brand,model,year,bucket))
+
+def purge_rollups(cursor,cutoff):
+    """сводки за дни до cutoff удаляются вместе со старыми партициями истории"""
+    day=str(cutoff)[:10]
+    cursor.execute('DELETE FROM history_rollup WHERE day<?',(day,))
+    cursor.execute('DELETE FROM history_rollup_hist WHERE day<?',(day,))
+
+def backfill_rollups(conn,rows):
+    """первичное заполнение сводок из уже существующей истории.
+    rows-итератор(timestamp,brand,model,year,predicted_price).
+    проверка и заполнение-в одной транзакции записи:другой процесс
+    ждет ее и видит уже заполненные сводки"""
+    conn.commit()
+    cursor=conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    if cursor.execute('SELECT COUNT(*)FROM history_rollup').fetchone()[0]:
+        conn.rollback()
+        return 0
+    total=0
+    for row in rows:
+        record_rollup(cursor,*row)
+        total+=1
+    conn.commit()
+    return total
+
+def _percentile(hist,total,q):
+    """перцентиль по отсортированной гистограмме [(bucket,count)]"""
+    target=q/100*total
+    running=0
+    for bucket,count in hist:
+        running+=count
+        if running>=target:
+            return bucket_price(bucket)
+    return bucket_price(hist[-1][0])if hist else None
+
+def query_stats(cursor,group_by,since=None,until=None,filters=None,percentiles=(50,90),limit=100):
+    """сгруппированные количества,средние и перцентили по сводкам"""
+    where=[]
+    params=[]
+    if since:
+        where.append('day>=?')
+        params.append(str(since)[:10])
+    if until:
+        where.append('day<=?')
+        params.append(str(until)[:10])
+    for col,value in(filters or{}).items():
+        if value is not None:
+            where.append(f'{col}=?')
+            params.append(value)
+    where_sql=f"WHERE {' AND '.join(where)}"if where else''
+    group_sql=','.join(group_by)
+
+    select_groups=f'{group_sql},'if group_by else''
+    group_clause=f'GROUP BY {group_sql}'if group_by else''
+    cursor.execute(f'''
+        SELECT {select_groups}SUM(count),SUM(sum_price),SUM(sum_sq_price)
+        FROM history_rollup {where_sql}
+        {group_clause}
+        ORDER BY SUM(count)DESC
+    ''',params)
+    aggregates=[row for row in cursor.fetchall()if row[len(group_by)]]
+
+    cursor.execute(f'''
+        SELECT {select_groups}bucket,SUM(count)
+        FROM history_rollup_hist {where_sql}
+        GROUP BY {select_groups}bucket
+        ORDER BY bucket
+    ''',params)
+    histograms={}
+    for row in cursor.fetchall():
+        histograms.setdefault(tuple(row[:len(group_by)]),[]).append((row[-2],row[-1]))
+
+    groups=[]
+    for row in aggregates[:limit]:
+        key=tuple(row[:len(group_by)])
+        count,sum_price,sum_sq=row[len(group_by):]
+        mean=sum_price/count
+        group=dict(zip(group_by,key))
+        group.update({
+            'count':int(count),
+            'avg_price':round(mean,2),
+            'std_price':round(math.sqrt(max(sum_sq/count-mean*mean,0.0)),2)
+        })
+        hist=histograms.get(key,[])
+        for q in percentiles:
+            value=_percentile(hist,count,q)
+            #ключ из исходного значения:99.9->p99.9,иначе затер бы p99
+            group[f'p{q:g}']=round(value,2)if value is not None else None
+        groups.append(group)
+
+    return{
+        'group_by':list(group_by),
+        'total_groups':len(aggregates),
+        'groups':groups,
+        #перцентили приближенные:середина корзины,а не цена из истории
+        'percentiles':{
+            'method':'log_buckets',
+            'bucket_step':round(math.exp(BUCKET_BASE)-1,4),
+            'max_relative_error':round(math.exp(BUCKET_BASE/2)-1,4)
+        }
+    }
@@ -0,0 +1,412 @@
+import os
+import re
+import time
+import fcntl
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime,timedelta
+from urllib.parse import quote
+
+#категориальные колонки истории и соответствующие поля запроса
+CATEGORY_COLUMNS={
+    'brand':'brand',
+    'model':'name',
+    'body_type':'bodyType',
+    'color':'color',
+    'fuel_type':'fuelType'
+}
+#версия модели,посчитавшей цену,хранится кодом из того же словаря
+ENCODED_COLUMNS=list(CATEGORY_COLUMNS)+['model_version']
+ROW_FIELDS=['id','timestamp','brand','model','year','power','body_type','color','fuel_type','predicted_price','model_version']
+_PARTITION_RE=re.compile(r'^predictions_\d{6}(\d{2})?$')
+
+def id_to_datetime(record_id):
+    """id записи-микросекунды unix-времени"""
+    return datetime.fromtimestamp(int(record_id)/1_000_000)
+
+def datetime_to_id(value):
+    if isinstance(value,str):
+        value=datetime.fromisoformat(value)
+    return int(value.timestamp()*1_000_000)
+
+@contextmanager
+def maintenance_lock(db_path):
+    """файловая блокировка для разовых работ при старте(перенос,очистка,сводки):
+    их делает один воркер uvicorn,остальные ждут и видят готовый результат"""
+    with open(f"{db_path}.lock",'w')as lock:
+        fcntl.flock(lock,fcntl.LOCK_EX)
+        yield
+
+def is_busy(error):
+    """SQLITE_BUSY:другой процесс держит запись или снимок чтения устарел"""
+    message=str(error)
+    return isinstance(error,sqlite3.OperationalError)and('locked'in message or'busy'in message)
+
+class HistoryStore:
+    """история предсказаний:целочисленные коды категорий,
+    монотонный INTEGER id,таблицы по месяцам/дням и удаление старых"""
+    def __init__(self,db_path='history.db',encoders=None,partition='month',retention_days=None,on_purge=None,read_only=False):
+        if partition not in('month','day'):
+            raise ValueError("partition:'month'или'day'")
+        self.db_path=db_path
+        self.partition=partition
+        self.retention_days=retention_days
+        #on_purge(cursor,cutoff)-очистка зависимых данных(сводок)
+        self.on_purge=on_purge
+        #read_only:только чтение(выгрузки,генератор нагрузки)-файл не меняется
+        self.read_only=read_only
+        self.lock=threading.Lock()
+        self.last_id=0
+        self.codes={col:{}for col in ENCODED_COLUMNS}
+        self.values={col:{}for col in ENCODED_COLUMNS}
+        self.partitions=set()
+
+        conn=self.connect()
+        cursor=conn.cursor()
+        if read_only:
+            self._check_schema(cursor)
+        else:
+            self._create_tables(cursor,encoders)
+        self._load(cursor)
+        conn.commit()
+        conn.close()
+
+    def connect(self):
+        if self.read_only:
+            #без прагм:смена journal_mode тоже запись
+            uri=f"file:{quote(os.path.abspath(self.db_path))}?mode=ro"
+            return sqlite3.connect(uri,uri=True,timeout=30,check_same_thread=False)
+        conn=sqlite3.connect(self.db_path,timeout=30,check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _check_schema(self,cursor):
+        """без записи схему не создать и старую таблицу не перенести"""
+        tables={name for(name,)in cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        if'history_partitions'in tables:
+            return
+        if'predictions'in tables:
+            raise ValueError(f"{self.db_path}:история в старой схеме(таблица predictions),перенос делает API при старте")
+        raise ValueError(f"{self.db_path}:нет таблиц истории")
+
+    def _create_tables(self,cursor,encoders):
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS history_categories(
+                column_name TEXT,
+                code INTEGER,
+                value TEXT,
+                PRIMARY KEY(column_name,code),
+                UNIQUE(column_name,value)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS history_partitions(
+                name TEXT PRIMARY KEY,
+                start_id INTEGER,
+                end_id INTEGER
+            )
+        ''')
+        if encoders:
+            self._seed_vocabulary(cursor,encoders)
+        cursor.connection.commit()
+
+    def _seed_vocabulary(self,cursor,encoders):
+        """коды берем из словарей модели,если они еще не заняты"""
+        for col,field in CATEGORY_COLUMNS.items():
+            if field not in encoders:
+                continue
+            cursor.executemany(
+                'INSERT OR IGNORE INTO history_categories(column_name,code,value)VALUES(?,?,?)',
+                [(col,code,str(value))for code,value in enumerate(encoders[field].classes_)]
+            )
+
+    def _load(self,cursor):
+        for col,code,value in cursor.execute('SELECT column_name,code,value FROM history_categories'):
+            self.codes[col][value]=code
+            self.values[col][code]=value
+        self.partitions={name for(name,)in cursor.execute('SELECT name FROM history_partitions')}
+        for name in self.partitions:
+            row=cursor.execute(f'SELECT MAX(id)FROM {name}').fetchone()
+            self.last_id=max(self.last_id,row[0]or 0)
+            #партиции до появления версии модели:колонка добавляется,старые строки-NULL
+            columns={r[1]for r in cursor.execute(f'PRAGMA table_info({name})')}
+            if'model_version'not in columns and not self.read_only:
+                cursor.execute(f'ALTER TABLE {name} ADD COLUMN model_version INTEGER')
+
+    #словарь категорий
+
+    def encode(self,cursor,col,value):
+        if value is None:
+            return None
+        value=str(value)
+        code=self.codes[col].get(value)
+        if code is not None:
+            return code
+        with self.lock:
+            #новое значение дописывается в конец словаря(как в incremental_training)
+            cursor.execute('''
+                INSERT OR IGNORE INTO history_categories(column_name,code,value)
+                SELECT ?,COALESCE(MAX(code),-1)+1,? FROM history_categories WHERE column_name=?
+            ''',(col,value,col))
+            code=cursor.execute(
+                'SELECT code FROM history_categories WHERE column_name=? AND value=?',(col,value)
+            ).fetchone()[0]
+            self.codes[col][value]=code
+            self.values[col][code]=value
+        return code
+
+    def decode(self,cursor,col,code):
+        if code is None:
+            return None
+        value=self.values[col].get(code)
+        if value is None:
+            #код мог добавить другой процесс
+            row=cursor.execute(
+                'SELECT value FROM history_categories WHERE column_name=? AND code=?',(col,code)
+            ).fetchone()
+            if row:
+                value=row[0]
+                self.values[col][code]=value
+                self.codes[col][value]=code
+        return value
+
+    #партиции
+
+    def partition_name(self,record_id):
+        dt=id_to_datetime(record_id)
+        return f"predictions_{dt:%Y%m%d}"if self.partition=='day'else f"predictions_{dt:%Y%m}"
+
+    def _partition_bounds(self,name):
+        suffix=name.split('_')[1]
+        if len(suffix)==8:
+            start=datetime.strptime(suffix,'%Y%m%d')
+            end=start+timedelta(days=1)
+        else:
+            start=datetime.strptime(suffix,'%Y%m')
+            end=(start+timedelta(days=32)).replace(day=1)
+        return datetime_to_id(start),datetime_to_id(end)
+
+    def _ensure_partition(self,cursor,name):
+        if name in self.partitions:
+            return False
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {name}(
+                id INTEGER PRIMARY KEY,
+                brand INTEGER,
+                model INTEGER,
+                year INTEGER,
+                power INTEGER,
+                body_type INTEGER,
+                color INTEGER,
+                fuel_type INTEGER,
+                predicted_price REAL,
+                model_version INTEGER
+            )
+        ''')
+        start_id,end_id=self._partition_bounds(name)
+        cursor.execute('INSERT OR IGNORE INTO history_partitions(name,start_id,end_id)VALUES(?,?,?)',(name,start_id,end_id))
+        self.partitions.add(name)
+        return True
+
+    def _ordered_partitions(self,cursor,since_id=None,until_id=None,descending=False):
+        query='SELECT name FROM history_partitions WHERE 1=1'
+        params=[]
+        if since_id is not None:
+            query+=' AND end_id>?'
+            params.append(since_id)
+        if until_id is not None:
+            query+=' AND start_id<?'
+            params.append(until_id)
+        query+=' ORDER BY start_id DESC'if descending else' ORDER BY start_id'
+        return[name for(name,)in cursor.execute(query,params)]
+
+    #запись/чтение
+
+    def next_id(self):
+        with self.lock:
+            self.last_id=max(time.time_ns()//1000,self.last_id+1)
+            return self.last_id
+
+    def insert(self,cursor,car_data,predicted_price,record_id=None,model_version=None):
+        """вставка;возвращает(id,timestamp)"""
+        record_id=record_id or self.next_id()
+        row=[
+            self.encode(cursor,'brand',car_data.get('brand')),
+            self.encode(cursor,'model',car_data.get('name')),
+            car_data.get('year'),
+            car_data.get('power'),
+            self.encode(cursor,'body_type',car_data.get('bodyType')),
+            self.encode(cursor,'color',car_data.get('color')),
+            self.encode(cursor,'fuel_type',car_data.get('fuelType')),
+            float(predicted_price),
+            self.encode(cursor,'model_version',model_version)
+        ]
+        name=self.partition_name(record_id)
+        if self._ensure_partition(cursor,name)and self.retention_days:
+            self.purge(cursor)
+        while True:
+            try:
+                cursor.execute(f'INSERT INTO {name} VALUES(?,?,?,?,?,?,?,?,?,?)',[record_id]+row)
+                break
+            except sqlite3.IntegrityError:
+                #тот же id уже выдал другой процесс
+                record_id=self.next_id()
+                name=self.partition_name(record_id)
+                self._ensure_partition(cursor,name)
+        return record_id,id_to_datetime(record_id).isoformat()
+
+    def _decode_row(self,cursor,row):
+        #без model_version-партиция старой версии,открытая только для чтения
+        record_id,brand,model,year,power,body_type,color,fuel_type,price,*version=row
+        model_version=version[0]if version else None
+        return(
+            record_id,
+            id_to_datetime(record_id).isoformat(),
+            self.decode(cursor,'brand',brand),
+            self.decode(cursor,'model',model),
+            year,
+            power,
+            self.decode(cursor,'body_type',body_type),
+            self.decode(cursor,'color',color),
+            self.decode(cursor,'fuel_type',fuel_type),
+            price,
+            self.decode(cursor,'model_version',model_version)
+        )
+
+    def page(self,cursor,limit=10,offset=0):
+        """последние записи,новые первыми"""
+        rows=[]
+        for name in self._ordered_partitions(cursor,descending=True):
+            if len(rows)>=limit:
+                break
+            if offset:
+                count=cursor.execute(f'SELECT COUNT(*)FROM {name}').fetchone()[0]
+                if offset>=count:
+                    offset-=count
+                    continue
+            part=cursor.execute(
+                f'SELECT*FROM {name} ORDER BY id DESC LIMIT ? OFFSET ?',(limit-len(rows),offset)
+            ).fetchall()
+            offset=0
+            rows.extend(self._decode_row(cursor,row)for row in part)
+        return rows
+
+    def iter_batches(self,cursor,since=None,until=None,batch_size=5000):
+        """все записи по возрастанию времени пачками(fetchmany)"""
+        since_id=datetime_to_id(since)if since else None
+        until_id=datetime_to_id(until)if until else None
+        for name in self._ordered_partitions(cursor,since_id,until_id):
+            where=[]
+            params=[]
+            if since_id is not None:
+                where.append('id>=?')
+                params.append(since_id)
+            if until_id is not None:
+                where.append('id<?')
+                params.append(until_id)
+            where_sql=f"WHERE {' AND '.join(where)}"if where else''
+            part=cursor.connection.cursor()
+            part.execute(f'SELECT*FROM {name} {where_sql} ORDER BY id',params)
+            while True:
+                rows=part.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield[self._decode_row(cursor,row)for row in rows]
+
+    def delete(self,cursor,record_id):
+        """удаление по id;возвращает удаленную строку или None"""
+        try:
+            name=self.partition_name(record_id)
+        except(OverflowError,OSError,ValueError):
+            #id вне диапазона дат-такой записи быть не может
+            return None
+        if name not in self.partitions:
+            return None
+        row=cursor.execute(f'SELECT*FROM {name} WHERE id=?',(record_id,)).fetchone()
+        if row is None:
+            return None
+        cursor.execute(f'DELETE FROM {name} WHERE id=?',(record_id,))
+        return self._decode_row(cursor,row)
+
+    def purge(self,cursor,now=None):
+        """удаление партиций старше срока хранения целиком(DROP TABLE)"""
+        if not self.retention_days:
+            return[]
+        cutoff=datetime_to_id((now or datetime.now())-timedelta(days=self.retention_days))
+        old=cursor.execute('SELECT name,end_id FROM history_partitions WHERE end_id<=?',(cutoff,)).fetchall()
+        dropped_until=None
+        for name,end_id in old:
+            if not _PARTITION_RE.match(name):
+                continue
+            cursor.execute(f'DROP TABLE IF EXISTS {name}')
+            cursor.execute('DELETE FROM history_partitions WHERE name=?',(name,))
+            self.partitions.discard(name)
+            dropped_until=max(dropped_until or end_id,end_id)
+        #зависимые данные чистятся по границе удаленных партиций,а не по cutoff:
+        #записи текущей партиции старше cutoff еще в истории
+        if self.on_purge and dropped_until is not None:
+            self.on_purge(cursor,id_to_datetime(dropped_until))
+        return[name for name,_ in old]
+
+    #миграция со старой схемы
+
+    def _insert_legacy(self,cursor,values,record_id):
+        brand,model,year,power,body_type,color,fuel_type,price=values
+        car_data={'brand':brand,'name':model,'year':year,'power':power,
+                  'bodyType':body_type,'color':color,'fuelType':fuel_type}
+        self.insert(cursor,car_data,price or 0.0,record_id=record_id)
+
+    def migrate_legacy(self,conn,table='predictions',batch_size=10000,attempts=5,delay=0.5):
+        """перенос строк из старой таблицы(TEXT id,TEXT категории)и ее удаление.
+        при SQLITE_BUSY перенос откатывается и повторяется с растущей паузой;
+        наличие таблицы проверяется заново-ее мог уже перенести другой процесс"""
+        for attempt in range(attempts):
+            try:
+                return self._migrate_legacy(conn,table,batch_size)
+            except sqlite3.OperationalError as e:
+                conn.rollback()
+                if not is_busy(e)or attempt==attempts-1:
+                    raise
+                time.sleep(delay*2**attempt)
+
+    def _migrate_legacy(self,conn,table,batch_size):
+        cursor=conn.cursor()
+        exists=cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?",(table,)).fetchone()
+        if not exists:
+            return 0
+
+        #кредитные колонки старой схемы никогда не заполнялись,их не переносим
+        legacy=conn.cursor()
+        legacy.execute(f'''
+            SELECT timestamp,brand,model,year,power,body_type,color,fuel_type,predicted_price
+            FROM {table} ORDER BY timestamp
+        ''')
+        moved=0
+        prev_id=0
+        #строки без времени(NULL сортируется первым)-после всех остальных,
+        #иначе id"сейчас"сдвинул бы время всех следующих строк
+        undated=[]
+        while True:
+            rows=legacy.fetchmany(batch_size)
+            if not rows:
+                break
+            for timestamp,*values in rows:
+                try:
+                    record_id=datetime_to_id(timestamp)
+                except(TypeError,ValueError,AttributeError):
+                    undated.append(values)
+                    continue
+                #одинаковое время в старой таблице->сдвиг на микросекунду
+                record_id=max(record_id,prev_id+1)
+                prev_id=record_id
+                self.last_id=max(self.last_id,record_id)
+                self._insert_legacy(cursor,values,record_id)
+                moved+=1
+        for values in undated:
+            self._insert_legacy(cursor,values,self.next_id())
+            moved+=1
+        cursor.execute(f'DROP TABLE {table}')
+        conn.commit()
+        return moved
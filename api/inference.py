@@ -0,0 +1,32 @@
+import time
+import numpy as np
+
+def make_forward(model,training=False):
+    """прямой проход как tf.function с фиксированной сигнатурой:граф строится
+    один раз(на прогреве),а не заново в каждом model.predict"""
+    #tensorflow импортируется только здесь,когда модель уже загружена
+    import tensorflow as tf
+    input_dim=model.input_shape[-1]
+
+    @tf.function(input_signature=[tf.TensorSpec([None,input_dim],tf.float32)])
+    def forward(x):
+        return model(x,training=training)
+
+    return forward
+
+def predict_log(forward,features):
+    """log1p(цена)для каждой строки признаков"""
+    return forward(np.asarray(features,dtype=np.float32)).numpy().reshape(-1)
+
+def warm_up(forward,features,batch_size=8,rounds=3):
+    """несколько проходов одной строкой и батчем:трассировка графа и
+    инициализация ядер до первого настоящего запроса;возвращает секунды по проходам"""
+    features=np.asarray(features,dtype=np.float32)
+    batch=np.repeat(features,batch_size,axis=0)
+    timings=[]
+    for _ in range(rounds):
+        for x in(features,batch):
+            start=time.perf_counter()
+            predict_log(forward,x)
+            timings.append(time.perf_counter()-start)
+    return timings
@@ -1,14 +1,31 @@
-from fastapi import FastAPI,HTTPException
+from fastapi import FastAPI,HTTPException,Request
+from fastapi.responses import StreamingResponse,JSONResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List,Dict,Optional
 import uvicorn
 import numpy as np
 import pickle
-from tensorflow import keras
 import json
-import sqlite3
+import os
+import time
+import zlib
 import hashlib
-from datetime import datetime
+import threading
+from contextlib import asynccontextmanager
+from vocab_index import build_resolvers,resolve_car
+from inference import make_forward,predict_log,warm_up
+from uncertainty import make_mc_forward,mc_dropout_interval
+from history_stats import GROUP_COLUMNS,init_rollup_tables,record_rollup,purge_rollups,backfill_rollups,query_stats
+from history_store import HistoryStore,maintenance_lock
+from history_export import FORMATS,stream_history
+from prediction_cache import PredictionCache,make_cache_key
+from single_flight import SingleFlight,AsyncSingleFlight
+from binary_server import start_binary_server,stop_binary_server
+from admission import AdmissionController,Rejected
+from explain import METHODS as EXPLAIN_METHODS,feature_names,make_gradient,make_baseline,explain
+from drift import DriftMonitor,default_reference
+from shadow import ShadowEvaluator
 
 #модели данных
 class CarRequest(BaseModel):
@@ -24,6 +41,19 @@ class PredictionResponse(BaseModel):
     predicted_price:float
     currency:str="RUB"
     log_price:float
+    resolved:Optional[Dict[str,dict]]=None
+    price_interval:Optional[dict]=None
+    degraded:Optional[str]=None
+    #версия кандидата,если ответил он(CANDIDATE_MODE=split)
+    model_version:Optional[str]=None
+
+class ExplainResponse(BaseModel):
+    method:str
+    predicted_price:float
+    log_price:float
+    baseline_price:float
+    contributions:List[dict]
+    resolved:Optional[Dict[str,dict]]=None
 
 class CreditRequest(BaseModel):
     car_price:float
@@ -50,52 +80,304 @@ ENCODERS_PATH='encoders.pkl'
 FEATURE_INFO_PATH='feature_info.pkl'
 UNIQUE_VALUES_PATH='unique_values.json'
 CAR_INDEX_PATH='car_index.json'
+HISTORY_DB_PATH=os.environ.get('HISTORY_DB_PATH','history.db')
+#партиции истории:'month'или'day',хранение в днях(пусто-без удаления)
+HISTORY_PARTITION=os.environ.get('HISTORY_PARTITION','month')
+HISTORY_RETENTION_DAYS=int(os.environ['HISTORY_RETENTION_DAYS'])if os.environ.get('HISTORY_RETENTION_DAYS')else None
+#общий для всех процессов кэш предсказаний
+PREDICTION_CACHE_PATH=os.environ.get('PREDICTION_CACHE_PATH','prediction_cache.db')
+PREDICTION_CACHE_MAX_ENTRIES=int(os.environ.get('PREDICTION_CACHE_MAX_ENTRIES','100000'))
+CACHE_WARMUP_ROWS=int(os.environ.get('CACHE_WARMUP_ROWS','5000'))
+#одинаковые одновременные запросы /predict считаются один раз(0-выключить)
+PREDICT_COALESCING=os.environ.get('PREDICT_COALESCING','1')!='0'
+MAX_INTERVAL_SAMPLES=256
+MAX_EXPLAIN_BATCH=256
+MAX_EXPLAIN_STEPS=128
+#допуск к /predict:одновременно выполняются ADMISSION_MAX_IN_FLIGHT(0-без ограничения),
+#ждут не больше ADMISSION_MAX_QUEUE,лимит на клиента(X-Client-Id или адрес)-ADMISSION_PER_CLIENT
+ADMISSION_MAX_IN_FLIGHT=int(os.environ.get('ADMISSION_MAX_IN_FLIGHT','8'))
+ADMISSION_MAX_QUEUE=int(os.environ.get('ADMISSION_MAX_QUEUE','16'))
+ADMISSION_PER_CLIENT=int(os.environ.get('ADMISSION_PER_CLIENT','0'))
+ADMISSION_QUEUE_TIMEOUT=float(os.environ.get('ADMISSION_QUEUE_TIMEOUT','1.0'))
+#деградация под нагрузкой через запятую:history-не писать историю,cache-отвечать из кэша вместо отказа
+DEGRADED_MODES={m.strip()for m in os.environ.get('DEGRADED_MODES','').split(',')if m.strip()}
+#бинарный интерфейс(msgpack-кадры)для внутренних сервисов:порт TCP или unix-сокет
+BINARY_HOST=os.environ.get('BINARY_HOST','127.0.0.1')
+BINARY_PORT=int(os.environ['BINARY_PORT'])if os.environ.get('BINARY_PORT')else None
+BINARY_SOCKET=os.environ.get('BINARY_SOCKET')
+#монитор дрейфа запросов /predict относительно обучающих данных(0-выключить):
+#оценка по последним DRIFT_WINDOW..2*DRIFT_WINDOW запросам,дрейф-оценка признака>=DRIFT_THRESHOLD
+DRIFT_MONITOR=os.environ.get('DRIFT_MONITOR','1')!='0'
+DRIFT_WINDOW=int(os.environ.get('DRIFT_WINDOW','10000'))
+DRIFT_THRESHOLD=float(os.environ.get('DRIFT_THRESHOLD','0.1'))
+#модель-кандидат(каталог с артефактами,например ../models/versions/v0003):
+#CANDIDATE_MODE=shadow-считается в фоне для доли CANDIDATE_FRACTION запросов,
+#split-эта доля запросов получает ответ кандидата,а основная модель считается в фоне
+CANDIDATE_MODEL_DIR=os.environ.get('CANDIDATE_MODEL_DIR')
+CANDIDATE_MODE=os.environ.get('CANDIDATE_MODE','shadow')
+CANDIDATE_FRACTION=float(os.environ.get('CANDIDATE_FRACTION','0.1'))
+#пары прогнозов(пусто-только статистика в памяти)
+SHADOW_LOG_PATH=os.environ.get('SHADOW_LOG_PATH','shadow.db')
+SHADOW_BATCH_SIZE=int(os.environ.get('SHADOW_BATCH_SIZE','64'))
+SHADOW_MAX_DELAY=float(os.environ.get('SHADOW_MAX_DELAY','1.0'))
+#сколько секунд клиенту подождать,пока модель загружается
+STARTUP_RETRY_AFTER=5
+#неудачный шаг загрузки повторяется с растущей паузой;после последней попытки
+#/health/live отвечает 503,и оркестратор перезапускает процесс
+STARTUP_ATTEMPTS=int(os.environ.get('STARTUP_ATTEMPTS','4'))
+STARTUP_RETRY_DELAY=float(os.environ.get('STARTUP_RETRY_DELAY','2'))
+
+#артефакты загружаются в lifespan(load_artifacts),до этого модуль импортируется
+#без tensorflow,sklearn и sqlite,и сервер сразу отвечает на /health/live
+model=None
+forward=None
+mc_forward=None
+gradient=None
+baseline=None
+baseline_values=None
+scaler=None
+encoders=None
+feature_info=None
+MODEL_VERSION=None
+unique_data=None
+car_index=[]
+resolvers=None
+history_store=None
+prediction_cache=None
+drift_monitor=None
+candidate=None
+shadow=None
+
+single_flight=SingleFlight()
+#одинаковые запросы /predict до допуска:ожидающие не занимают слот и не получают отказ отдельно
+admission_flight=AsyncSingleFlight()
+#запросы /predict в обработке:теневой поток считает пакет,когда их нет
+predict_in_flight=0
+admission=AdmissionController(
+    max_in_flight=ADMISSION_MAX_IN_FLIGHT,
+    max_queue=ADMISSION_MAX_QUEUE,
+    per_client=ADMISSION_PER_CLIENT,
+    queue_timeout=ADMISSION_QUEUE_TIMEOUT
+)
+
+PROCESS_STARTED=time.time()
+ready=threading.Event()
+startup={'state':'starting','steps':{},'error':None}
+
+def load_artifacts():
+    global model,forward,mc_forward,gradient,baseline,baseline_values,scaler,encoders,feature_info,MODEL_VERSION,car_index,resolvers,drift_monitor
+    from tensorflow import keras
+
+    model=keras.models.load_model(MODEL_PATH)
+    forward=make_forward(model)
+    mc_forward=make_mc_forward(model)
+    gradient=make_gradient(model)
+
+    with open(SCALER_PATH,'rb')as f:
+        scaler=pickle.load(f)
+
+    with open(ENCODERS_PATH,'rb')as f:
+        encoders=pickle.load(f)
+
+    with open(FEATURE_INFO_PATH,'rb')as f:
+        feature_info=pickle.load(f)
+
+    #базовая точка для /explain
+    baseline,baseline_values=make_baseline(feature_info,scaler,encoders)
+
+    #эталон дрейфа из feature_info,у старых артефактов его нет-только живая статистика
+    if DRIFT_MONITOR:
+        reference=feature_info.get('drift_reference')or default_reference(unique_data,feature_info['categorical_cols'])
+        drift_monitor=DriftMonitor(
+            reference,feature_info['categorical_cols'],feature_info['numerical_cols'],
+            window=DRIFT_WINDOW,threshold=DRIFT_THRESHOLD
+        )
 
-model=keras.models.load_model(MODEL_PATH)
+    #версия из models/versions,для старых артефактов-хэш содержимого:
+    #копирование,checkout и повторный деплой тех же файлов ее не меняют
+    MODEL_VERSION=feature_info.get('version')or f"sha-{artifacts_digest()[:12]}"
 
-with open(SCALER_PATH,'rb')as f:
-    scaler=pickle.load(f)
+    try:
+        with open(CAR_INDEX_PATH,'r',encoding='utf-8')as f:
+            car_index=json.load(f)
+    except:
+        car_index=[]
 
-with open(ENCODERS_PATH,'rb')as f:
-    encoders=pickle.load(f)
+    #индексы для неточных названий марок/моделей
+    resolvers=build_resolvers(encoders,unique_data)
 
-with open(FEATURE_INFO_PATH,'rb')as f:
-    feature_info=pickle.load(f)
+def artifacts_digest(path='.'):
+    """sha256 файлов,от которых зависит прогноз:модель,масштабатор,словари"""
+    digest=hashlib.sha256()
+    for name in(MODEL_PATH,SCALER_PATH,ENCODERS_PATH):
+        with open(os.path.join(path,name),'rb')as f:
+            for chunk in iter(lambda:f.read(1<<20),b''):
+                digest.update(chunk)
+    return digest.hexdigest()
 
-with open(UNIQUE_VALUES_PATH,'r',encoding='utf-8')as f:
-    unique_data=json.load(f)
+def load_model_dir(path):
+    """артефакты второй модели из каталога версии(имена файлов те же)"""
+    from tensorflow import keras
+    artifacts={'model':keras.models.load_model(os.path.join(path,MODEL_PATH))}
+    for key,name in(('scaler',SCALER_PATH),('encoders',ENCODERS_PATH),('feature_info',FEATURE_INFO_PATH)):
+        with open(os.path.join(path,name),'rb')as f:
+            artifacts[key]=pickle.load(f)
+    artifacts['forward']=make_forward(artifacts['model'])
+    artifacts['mc_forward']=make_mc_forward(artifacts['model'])
+    artifacts['version']=artifacts['feature_info'].get('version')or os.path.basename(os.path.normpath(path))
+    #словари кандидата могут отличаться(дообучение дописывает классы)
+    artifacts['codes']={
+        col:{str(v):i for i,v in enumerate(artifacts['encoders'][col].classes_)}
+        for col in artifacts['feature_info']['categorical_cols']
+    }
+    return artifacts
 
-try:
-    with open(CAR_INDEX_PATH,'r',encoding='utf-8')as f:
-        car_index=json.load(f)
-except:
-    car_index=[]
+def load_unique_values():
+    global unique_data
+    with open(UNIQUE_VALUES_PATH,'r',encoding='utf-8')as f:
+        unique_data=json.load(f)
     
 #БД для истории
 def init_history_db():
-    conn=sqlite3.connect('history.db')
+    store=HistoryStore(
+        HISTORY_DB_PATH,
+        encoders=encoders,
+        partition=HISTORY_PARTITION,
+        retention_days=HISTORY_RETENTION_DAYS,
+        on_purge=purge_rollups
+    )
+    conn=store.connect()
     cursor=conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS predictions(
-            id TEXT PRIMARY KEY,
-            timestamp TEXT,
-            brand TEXT,
-            model TEXT,
-            year INTEGER,
-            power INTEGER,
-            body_type TEXT,
-            color TEXT,
-            fuel_type TEXT,
-            predicted_price REAL
-        )
-    ''')
+    init_rollup_tables(cursor)
     conn.commit()
+    
+    #перенос старой таблицы predictions(TEXT id и категории)в новую схему;
+    #делает один воркер,остальные ждут блокировку и находят таблицу уже перенесенной
+    with maintenance_lock(HISTORY_DB_PATH):
+        store.migrate_legacy(conn)
+        store.purge(cursor)
+        conn.commit()
+    
+    #сводки для /history/stats по уже записанной истории
+    backfill_rollups(conn,(
+        (row[1],row[2],row[3],row[4],row[9])
+        for batch in store.iter_batches(conn.cursor())
+        for row in batch
+    ))
+    conn.close()
+    return store
+
+def init_prediction_cache():
+    cache=PredictionCache(PREDICTION_CACHE_PATH,max_entries=PREDICTION_CACHE_MAX_ENTRIES)
+    #прогрев:только записи,посчитанные текущей моделью(не кандидатом в split);
+    #записи без версии(до ее появления в истории)считала модель без версии-
+    #они годятся,только если и текущая модель без опубликованной версии
+    conn=history_store.connect()
+    rows=history_store.page(conn.cursor(),limit=CACHE_WARMUP_ROWS)
     conn.close()
+    unversioned=feature_info.get('version')is None
+    cache.warm_up([
+        ({'brand':r[2],'name':r[3],'year':r[4],'power':r[5],'bodyType':r[6],'color':r[7],'fuelType':r[8]},r[9])
+        for r in rows if r[10]==MODEL_VERSION or(r[10]is None and unversioned)
+    ],MODEL_VERSION)
+    return cache
+
+def open_history():
+    global history_store
+    history_store=init_history_db()
+
+def open_prediction_cache():
+    global prediction_cache
+    prediction_cache=init_prediction_cache()
+
+def warm_up_inference():
+    """пробный запрос по тому же пути,что и /predict:разбор категорий,
+    кодирование,обычный и MC-dropout проходы,оба способа /explain"""
+    car_data={col:str(encoders[col].classes_[0])for col in feature_info['categorical_cols']}
+    car_data.update({'year':int(unique_data['years'][0]),'power':int(unique_data['min_power'])})
+    car_data,_=resolve_car(car_data,resolvers,encoders,feature_info['categorical_cols'])
+    features=encode_features(car_data)
+    timings=warm_up(forward,features)
+    mc_dropout_interval(mc_forward,features,samples=32,point_log=predict_log(forward,features))
+    for method in EXPLAIN_METHODS:
+        explain_cars([car_data],method)
+    return timings
 
-init_history_db()
+def open_candidate():
+    """кандидат,прогрев его графа и фоновый поток сравнения"""
+    global candidate,shadow
+    if CANDIDATE_MODE not in('shadow','split'):
+        raise ValueError(f"CANDIDATE_MODE={CANDIDATE_MODE},доступно:shadow,split")
+    candidate=load_model_dir(CANDIDATE_MODEL_DIR)
+    features,_=encode_for(candidate,[{
+        **{col:str(candidate['encoders'][col].classes_[0])for col in candidate['feature_info']['categorical_cols']},
+        'year':int(unique_data['years'][0]),'power':int(unique_data['min_power'])
+    }])
+    warm_up(candidate['forward'],features)
+    shadow=ShadowEvaluator(
+        {'primary':predict_primary,'candidate':predict_candidate},
+        {'primary':MODEL_VERSION,'candidate':candidate['version']},
+        log_path=SHADOW_LOG_PATH or None,
+        batch_size=SHADOW_BATCH_SIZE,
+        max_delay=SHADOW_MAX_DELAY,
+        busy=lambda:predict_in_flight>0
+    )
+    shadow.start()
+
+def run_startup():
+    """загрузка по шагам с замером времени;ready выставляется после прогрева"""
+    steps=[
+        ('artifacts',load_artifacts),
+        ('history',open_history),
+        ('cache',open_prediction_cache),
+        ('warmup',warm_up_inference)
+    ]
+    if CANDIDATE_MODEL_DIR:
+        steps.append(('candidate',open_candidate))
+    for name,step in steps:
+        for attempt in range(STARTUP_ATTEMPTS):
+            start=time.perf_counter()
+            try:
+                step()
+                break
+            except Exception as e:
+                startup['error']=f"{name}:{e}"
+                if attempt==STARTUP_ATTEMPTS-1:
+                    startup['state']='failed'
+                    return
+                startup['state']='retrying'
+                time.sleep(STARTUP_RETRY_DELAY*2**attempt)
+        startup['steps'][name]=round(time.perf_counter()-start,3)
+    startup['error']=None
+    startup['state']='ready'
+    startup['ready_after']=round(time.time()-PROCESS_STARTED,3)
+    ready.set()
+
+@asynccontextmanager
+async def lifespan(app):
+    #справочники легкие и нужны сразу,модель грузится в фоне,
+    #пока сервер уже принимает соединения
+    load_unique_values()
+    threading.Thread(target=run_startup,name='startup',daemon=True).start()
+    binary_server=None
+    if BINARY_PORT or BINARY_SOCKET:
+        binary_server=await start_binary_server(handle_binary,BINARY_HOST,BINARY_PORT,BINARY_SOCKET)
+    yield
+    if binary_server:
+        stop_binary_server(binary_server)
+    if shadow is not None:
+        shadow.stop()
+
+def require_ready():
+    if not ready.is_set():
+        raise HTTPException(
+            status_code=503,
+            detail=f"модель загружается:{startup['state']}",
+            headers={"Retry-After":str(STARTUP_RETRY_AFTER)}
+        )
 
 #fastapi приложение
-app=FastAPI(title="car price prediction api",version="1.0")
+app=FastAPI(title="car price prediction api",version="1.0",lifespan=lifespan)
 
 @app.get("/")
 def root():
@@ -103,8 +385,28 @@ def root():
 
 @app.get("/health")
 def health():
+    require_ready()
     return{"status":"ok"}
 
+@app.get("/health/live")
+def health_live():
+    body={"status":"alive","uptime":round(time.time()-PROCESS_STARTED,3)}
+    #загрузка не удалась после всех повторов:процесс живой,но бесполезный
+    if startup['state']=='failed':
+        body.update(status="failed",error=startup['error'])
+        return JSONResponse(body,status_code=503)
+    return body
+
+@app.get("/health/ready")
+def health_ready():
+    body={"status":startup['state'],"model_version":MODEL_VERSION,"startup":startup['steps']}
+    if startup.get('ready_after')is not None:
+        body['ready_after']=startup['ready_after']
+    if not ready.is_set():
+        body['error']=startup['error']
+        return JSONResponse(body,status_code=503,headers={"Retry-After":str(STARTUP_RETRY_AFTER)})
+    return body
+
 @app.get("/brands")
 def get_brands():
     return{"brands":unique_data['brands']}
@@ -115,6 +417,17 @@ def get_models(brand:str):
         return{"brand":brand,"models":unique_data['models'][brand]}
     raise HTTPException(status_code=404,detail=f"марка{brand}не найдена")
 
+@app.get("/autocomplete")
+def autocomplete(field:str,q:str="",brand:Optional[str]=None,limit:int=10):
+    require_ready()
+    if field not in feature_info['categorical_cols']:
+        raise HTTPException(status_code=400,detail=f"поле{field}не поддерживается")
+    index=resolvers[field]
+    if field=='name'and brand:
+        brand_match,_,_=resolvers['brand'].resolve(brand)
+        index=resolvers['models_by_brand'].get(brand_match,index)
+    return{"field":field,"query":q,"suggestions":index.complete(q,limit=min(max(limit,1),50))}
+
 @app.get("/unique_values")
 def get_unique_values():
     return{
@@ -128,79 +441,292 @@ def get_unique_values():
         }
     }
 
-def save_to_history(car_data:dict,predicted_price:float):
+def save_to_history(car_data:dict,predicted_price:float,model_version:str=None):
     try:
-        unique_str=f"{car_data}{datetime.now()}"
-        record_id=hashlib.md5(unique_str.encode()).hexdigest()[:10]
-        
-        conn=sqlite3.connect('history.db')
+        conn=history_store.connect()
         cursor=conn.cursor()
         
-        cursor.execute('''
-            INSERT OR REPLACE INTO predictions
-            (id,timestamp,brand,model,year,power,body_type,color,fuel_type,predicted_price)
-            VALUES(?,?,?,?,?,?,?,?,?,?)
-        ''',(
-            record_id,
-            datetime.now().isoformat(),
-            car_data.get('brand'),
-            car_data.get('name'),
-            car_data.get('year'),
-            car_data.get('power'),
-            car_data.get('bodyType'),
-            car_data.get('color'),
-            car_data.get('fuelType'),
-            float(predicted_price)
-        ))
+        record_id,timestamp=history_store.insert(cursor,car_data,predicted_price,model_version=model_version or MODEL_VERSION)
+        record_rollup(
+            cursor,timestamp,
+            car_data.get('brand'),car_data.get('name'),car_data.get('year'),
+            predicted_price
+        )
         
         conn.commit()
         conn.close()
-        return record_id
+        return str(record_id)
     except:
         return None
 
-@app.post("/predict",response_model=PredictionResponse)
-def predict(car:CarRequest):
-    try:
-        car_data={
-            'brand':car.brand,
-            'name':car.name,
-            'bodyType':car.bodyType,
-            'color':car.color,
-            'fuelType':car.fuelType,
-            'year':car.year,
-            'power':car.power
+def encode_features(car_data:dict):
+    categorical_features=[]
+    for col in feature_info['categorical_cols']:
+        encoded=encoders[col].transform([car_data[col]])[0]
+        categorical_features.append(encoded)
+    
+    numerical_features=[[car_data['year'],car_data['power']]]
+    scaled_numerical=scaler.transform(numerical_features)[0]
+    return np.hstack([scaled_numerical,categorical_features]).reshape(1,-1)
+
+def encode_codes(codes,year,power):
+    """пакет уже закодированных признаков:коды категорий в порядке categorical_cols"""
+    numerical=np.column_stack([year,power]).astype(np.float64)
+    return np.hstack([scaler.transform(numerical),codes])
+
+def encode_batch(cars:List[dict]):
+    """пакет машин->матрица признаков одним transform на колонку"""
+    cols=feature_info['categorical_cols']
+    codes=np.column_stack([encoders[col].transform([car[col]for car in cars])for col in cols])
+    return encode_codes(codes,[car['year']for car in cars],[car['power']for car in cars])
+
+def encode_for(artifacts,cars:List[dict]):
+    """признаки для модели со своими словарями и скейлером;
+    (матрица,маска)-машины с категориями вне словаря пропускаются"""
+    cols=artifacts['feature_info']['categorical_cols']
+    codes=np.array([[artifacts['codes'][col].get(str(car[col]),-1)for col in cols]for car in cars]).reshape(len(cars),len(cols))
+    mask=(codes>=0).all(axis=1)
+    numerical=np.array([[car['year'],car['power']]for car in cars],dtype=np.float64).reshape(len(cars),2)[mask]
+    if not mask.any():
+        return np.empty((0,numerical.shape[1]+len(cols))),mask
+    return np.hstack([artifacts['scaler'].transform(numerical),codes[mask]]),mask
+
+def encodable(artifacts,car_data:dict):
+    """все категории машины есть в словарях модели"""
+    return all(str(car_data[col])in artifacts['codes'][col]for col in artifacts['feature_info']['categorical_cols'])
+
+def predict_primary(cars:List[dict]):
+    return predict_log(forward,encode_batch(cars))
+
+def predict_candidate(cars:List[dict]):
+    """log цены кандидата пакетом,nan-машина вне его словарей"""
+    features,mask=encode_for(candidate,cars)
+    result=np.full(len(cars),np.nan)
+    if mask.any():
+        result[mask]=predict_log(candidate['forward'],features)
+    return result
+
+def route(cache_key:str):
+    """вариант по хэшу машины:одна и та же машина всегда у одной модели(и в одном кэше)"""
+    if candidate is None or zlib.crc32(cache_key.encode('utf-8'))%10000>=CANDIDATE_FRACTION*10000:
+        return None
+    return CANDIDATE_MODE
+
+def explain_cars(cars:List[dict],method:str='occlusion',steps:int=32):
+    """вклады признаков для уже разобранных машин,один батч на весь пакет"""
+    steps=min(max(steps,2),MAX_EXPLAIN_STEPS)
+    return explain(
+        method,encode_batch(cars),cars,feature_names(feature_info),
+        baseline,baseline_values,forward,gradient,steps
+    )
+
+def handle_binary(request:dict):
+    """запросы бинарного интерфейса:{'op':'meta'}-словари категорий,
+    {'op':'predict','codes':[[...]],'year':[...],'power':[...]}-цены пакетом.
+    без разбора названий,кэша и истории-для внутренних сервисов"""
+    if not ready.is_set():
+        return{'error':f"модель загружается:{startup['state']}",'retry_after':STARTUP_RETRY_AFTER}
+    cols=feature_info['categorical_cols']
+    op=request.get('op','predict')
+    if op=='meta':
+        return{
+            'model_version':MODEL_VERSION,
+            'categorical_cols':cols,
+            'classes':{col:[str(v)for v in encoders[col].classes_]for col in cols}
         }
-        
-        categorical_features=[]
-        for col in feature_info['categorical_cols']:
-            value=car_data[col]
-            encoder=encoders[col]
-            
-            if value in encoder.classes_:
-                encoded=encoder.transform([value])[0]
-            else:
-                encoded=encoder.transform([encoder.classes_[0]])[0]
-            categorical_features.append(encoded)
-        
-        numerical_features=[[car.year,car.power]]
-        scaled_numerical=scaler.transform(numerical_features)[0]
-        features=np.hstack([scaled_numerical,categorical_features]).reshape(1,-1)
-        
-        pred_log=model.predict(features,verbose=0)[0][0]
+    if op!='predict':
+        raise ValueError(f"операция{op}не поддерживается")
+
+    codes=np.asarray(request['codes'],dtype=np.int64).reshape(-1,len(cols))
+    year=np.asarray(request['year'],dtype=np.float64).reshape(-1)
+    power=np.asarray(request['power'],dtype=np.float64).reshape(-1)
+    if not len(codes)==len(year)==len(power):
+        raise ValueError("codes,year и power должны быть одной длины")
+    if not len(codes):
+        return{'model_version':MODEL_VERSION,'prices':[],'log_prices':[]}
+    for i,col in enumerate(cols):
+        if codes[:,i].min()<0 or codes[:,i].max()>=len(encoders[col].classes_):
+            raise ValueError(f"код{col}вне словаря(0..{len(encoders[col].classes_)-1})")
+
+    log_prices=predict_log(forward,encode_codes(codes,year,power))
+    return{
+        'model_version':MODEL_VERSION,
+        'prices':np.expm1(log_prices).tolist(),
+        'log_prices':log_prices.tolist()
+    }
+
+def run_prediction(car_data:dict,cache_key:str,interval:bool,samples:int,write_history:bool=True,artifacts:dict=None):
+    """кэш->модель->интервал->история;возвращает(цена,log цены,интервал).
+    artifacts-модель-кандидат вместо основной"""
+    if artifacts is None:
+        model_forward,model_mc_forward,encode=forward,mc_forward,encode_features
+    else:
+        model_forward,model_mc_forward=artifacts['forward'],artifacts['mc_forward']
+        def encode(car_data):
+            features,mask=encode_for(artifacts,[car_data])
+            if not mask.all():
+                raise ValueError(f"машина вне словарей модели{artifacts['version']}")
+            return features
+    
+    cached=prediction_cache.get(cache_key)
+    if cached is not None:
+        pred_price,pred_log=cached
+    else:
+        features=encode(car_data)
+        pred_log=predict_log(model_forward,features)[0]
         pred_price=np.expm1(pred_log)
+        prediction_cache.put(cache_key,pred_price,pred_log)
+    
+    #интервал P10-P90 по MC-dropout
+    price_interval=None
+    if interval:
+        if cached is not None:
+            features=encode(car_data)
+        price_interval=mc_dropout_interval(model_mc_forward,features,samples,point_log=[pred_log])[0]
+    
+    #сохранение в историю
+    if write_history:
+        save_to_history(car_data,float(pred_price),None if artifacts is None else artifacts['version'])
+    return float(pred_price),float(pred_log),price_interval
+
+def resolve_request(car:CarRequest):
+    car_data={
+        'brand':car.brand,
+        'name':car.name,
+        'bodyType':car.bodyType,
+        'color':car.color,
+        'fuelType':car.fuelType,
+        'year':car.year,
+        'power':car.power
+    }
+    #неизвестные значения->ближайший известный класс
+    return resolve_car(car_data,resolvers,encoders,feature_info['categorical_cols'])
+
+def compute_prediction(car:CarRequest,interval:bool,samples:int,write_history:bool=True):
+    try:
+        car_data,resolution=resolve_request(car)
+        
+        cache_key=make_cache_key(MODEL_VERSION,car_data)
+        #доля запросов:shadow-кандидат в фоне,split-кандидат отвечает
+        mode=route(cache_key)
+        artifacts=None
+        if mode=='split'and not encodable(candidate,car_data):
+            #машина вне словарей кандидата:отвечает основная модель,
+            #кандидат в фоне получит nan и посчитает ее как unencodable
+            shadow.record('split_fallback')
+            mode='shadow'
+        if mode=='split':
+            artifacts=candidate
+            cache_key=make_cache_key(candidate['version'],car_data)
+        samples=min(max(samples,2),MAX_INTERVAL_SAMPLES)
+        compute=lambda:run_prediction(car_data,cache_key,interval,samples,write_history,artifacts)
+        shared=False
+        if PREDICT_COALESCING:
+            #ожидающие получают результат первого запроса,в историю пишется одна запись
+            flight_key=f"{cache_key}|{samples if interval else 0}"
+            (pred_price,pred_log,price_interval),shared=single_flight.do(flight_key,compute)
+        else:
+            pred_price,pred_log,price_interval=compute()
         
-        #сохранение в историю
-        save_to_history(car_data,float(pred_price))
+        if drift_monitor is not None:
+            drift_monitor.observe(car_data,resolution,pred_price)
+        #пара считается один раз на объединенные запросы
+        if mode is not None and not shared:
+            shadow.submit(car_data,pred_log,'candidate'if mode=='split'else'primary')
         
         return PredictionResponse(
-            predicted_price=float(pred_price),
-            log_price=float(pred_log)
+            predicted_price=pred_price,
+            log_price=pred_log,
+            resolved=resolution or None,
+            price_interval=price_interval,
+            degraded=None if write_history else'history_skipped',
+            model_version=candidate['version']if mode=='split'else None
         )
         
     except Exception as e:
         raise HTTPException(status_code=400,detail=str(e))
 
+def predict_from_cache(car:CarRequest):
+    """ответ только из кэша(без модели,интервала и истории)или None"""
+    try:
+        car_data,resolution=resolve_request(car)
+        cached=prediction_cache.get(make_cache_key(MODEL_VERSION,car_data))
+    except Exception:
+        return None
+    if cached is None:
+        return None
+    return PredictionResponse(
+        predicted_price=cached[0],
+        log_price=cached[1],
+        resolved=resolution or None,
+        degraded='cache'
+    )
+
+@app.post("/predict",response_model=PredictionResponse)
+async def predict(car:CarRequest,request:Request,interval:bool=False,samples:int=32):
+    require_ready()
+    client=request.headers.get('x-client-id')or(request.client.host if request.client else None)
+    if not PREDICT_COALESCING:
+        return await admit_and_predict(car,client,interval,samples)
+    #объединение до допуска:слот(или отказ)один на все одинаковые запросы в обработке;
+    #при лимите на клиента-только в пределах клиента,чужой 429 не делится
+    key=(car.brand,car.name,car.bodyType,car.color,car.fuelType,car.year,car.power,samples if interval else 0,
+         client if ADMISSION_PER_CLIENT else None)
+    response,_=await admission_flight.do(key,lambda:admit_and_predict(car,client,interval,samples))
+    return response
+
+async def admit_and_predict(car:CarRequest,client:Optional[str],interval:bool,samples:int):
+    global predict_in_flight
+    #допуск в цикле событий:в пул потоков попадают только допущенные запросы
+    try:
+        waited=await admission.acquire(client)
+    except Rejected as e:
+        #кэш выручает только при перегрузке(503);клиент сверх своего лимита получает 429
+        if 'cache'in DEGRADED_MODES and e.status_code==503:
+            #в пуле потоков:разбор названий и чтение sqlite не задерживают цикл событий
+            response=await run_in_threadpool(predict_from_cache,car)
+            if response is not None:
+                admission.record('served_from_cache')
+                return response
+        detail="слишком много запросов клиента"if e.status_code==429 else f"сервер перегружен:{e.reason}"
+        raise HTTPException(status_code=e.status_code,detail=detail,headers={"Retry-After":str(e.retry_after)})
+    
+    predict_in_flight+=1
+    start=time.perf_counter()
+    try:
+        #под нагрузкой запись в историю(sqlite commit)можно пропустить
+        write_history=not('history'in DEGRADED_MODES and(waited or admission.overloaded()))
+        if not write_history:
+            admission.record('history_skipped')
+        return await run_in_threadpool(compute_prediction,car,interval,samples,write_history)
+    finally:
+        predict_in_flight-=1
+        admission.release(client,time.perf_counter()-start)
+
+@app.post("/explain",response_model=ExplainResponse)
+def explain_price(car:CarRequest,method:str="occlusion",steps:int=32):
+    return explain_batch([car],method,steps)[0]
+
+@app.post("/explain/batch",response_model=List[ExplainResponse])
+def explain_batch(cars:List[CarRequest],method:str="occlusion",steps:int=32):
+    require_ready()
+    if method not in EXPLAIN_METHODS:
+        raise HTTPException(status_code=400,detail=f"метод{method}не поддерживается,доступно:{EXPLAIN_METHODS}")
+    if len(cars)>MAX_EXPLAIN_BATCH:
+        raise HTTPException(status_code=400,detail=f"не больше{MAX_EXPLAIN_BATCH}машин за запрос")
+    if not cars:
+        return[]
+    try:
+        resolved=[resolve_request(car)for car in cars]
+        explanations=explain_cars([car_data for car_data,_ in resolved],method,steps)
+        return[
+            ExplainResponse(**explanation,resolved=resolution or None)
+            for explanation,(_,resolution)in zip(explanations,resolved)
+        ]
+        
+    except Exception as e:
+        raise HTTPException(status_code=400,detail=str(e))
+
 @app.post("/calculate_credit",response_model=CreditResponse)
 def calculate_credit(credit_request:CreditRequest):
     try:
@@ -234,23 +760,16 @@ def calculate_credit(credit_request:CreditRequest):
 
 @app.get("/history",response_model=List[HistoryRecord])
 def get_history(limit:int=10,offset:int=0):
+    require_ready()
     try:
-        conn=sqlite3.connect('history.db')
-        cursor=conn.cursor()
-        
-        cursor.execute('''
-            SELECT*FROM predictions
-            ORDER BY timestamp DESC
-            LIMIT?OFFSET?
-        ''',(limit,offset))
-        
-        rows=cursor.fetchall()
+        conn=history_store.connect()
+        rows=history_store.page(conn.cursor(),limit,offset)
         conn.close()
         
         history=[]
         for row in rows:
             record=HistoryRecord(
-                id=row[0],
+                id=str(row[0]),
                 timestamp=row[1],
                 car_data={
                     'brand':row[2],
@@ -270,26 +789,120 @@ def get_history(limit:int=10,offset:int=0):
     except Exception as e:
         raise HTTPException(status_code=500,detail=str(e))
 
+@app.get("/history/stats")
+def get_history_stats(group_by:str="brand",since:Optional[str]=None,until:Optional[str]=None,
+                      brand:Optional[str]=None,model:Optional[str]=None,year:Optional[int]=None,
+                      percentiles:str="50,90",limit:int=100):
+    require_ready()
+    columns=[c.strip()for c in group_by.split(',')if c.strip()]
+    unknown=[c for c in columns if c not in GROUP_COLUMNS]
+    if unknown:
+        raise HTTPException(status_code=400,detail=f"группировка по{unknown}не поддерживается,доступно:{GROUP_COLUMNS}")
+    try:
+        qs=[float(q)for q in percentiles.split(',')if q.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400,detail="percentiles:числа через запятую")
+    #nan не проходит ни одно сравнение,inf и 150 отсекаются границами
+    if not all(0<=q<=100 for q in qs):
+        raise HTTPException(status_code=400,detail="percentiles:числа от 0 до 100")
+    try:
+        conn=history_store.connect()
+        stats=query_stats(
+            conn.cursor(),columns,since=since,until=until,
+            filters={'brand':brand,'model':model,'year':year},
+            percentiles=qs,limit=limit
+        )
+        conn.close()
+        return stats
+        
+    except Exception as e:
+        raise HTTPException(status_code=500,detail=str(e))
+
+@app.get("/history/export")
+def export_history(format:str="ndjson",since:Optional[str]=None,until:Optional[str]=None):
+    require_ready()
+    if format not in FORMATS:
+        raise HTTPException(status_code=400,detail=f"формат{format}не поддерживается,доступно:{list(FORMATS)}")
+    try:
+        chunks=stream_history(format,history_store,since,until)
+    except ImportError as e:
+        raise HTTPException(status_code=501,detail=f"для{format}нужен pyarrow:{e}")
+    except ValueError as e:
+        #время разбирается до ответа:после 200 ошибку уже не передать
+        raise HTTPException(status_code=400,detail=f"since/until:ISO-время:{e}")
+    return StreamingResponse(
+        chunks,
+        media_type=FORMATS[format],
+        headers={"Content-Disposition":f"attachment; filename=history.{format}"}
+    )
+
 @app.delete("/history/{record_id}")
 def delete_history_record(record_id:str):
+    require_ready()
+    if not record_id.isdigit():
+        return{"deleted":False}
     try:
-        conn=sqlite3.connect('history.db')
+        conn=history_store.connect()
         cursor=conn.cursor()
         
-        cursor.execute('DELETE FROM predictions WHERE id=?',(record_id,))
-        deleted=cursor.rowcount
+        row=history_store.delete(cursor,int(record_id))
+        if row:
+            record_rollup(cursor,row[1],row[2],row[3],row[4],row[9],sign=-1)
         
         conn.commit()
         conn.close()
         
-        return{"deleted":deleted>0}
+        return{"deleted":row is not None}
         
     except Exception as e:
         raise HTTPException(status_code=500,detail=str(e))
 
+@app.get("/cache/stats")
+def get_cache_stats():
+    require_ready()
+    return{
+        "model_version":MODEL_VERSION,
+        **prediction_cache.snapshot(),
+        "coalescing":{"enabled":PREDICT_COALESCING,**single_flight.snapshot()},
+        "admission_coalescing":admission_flight.snapshot()
+    }
+
+@app.get("/drift")
+def get_drift():
+    require_ready()
+    if drift_monitor is None:
+        return{"enabled":False}
+    return{"enabled":True,"model_version":MODEL_VERSION,"window":DRIFT_WINDOW,**drift_monitor.snapshot()}
+
+@app.get("/shadow/stats")
+def get_shadow_stats():
+    require_ready()
+    if shadow is None:
+        return{"enabled":False}
+    return{
+        "enabled":True,
+        "mode":CANDIDATE_MODE,
+        "fraction":CANDIDATE_FRACTION,
+        "log_path":SHADOW_LOG_PATH or None,
+        **shadow.snapshot()
+    }
+
+@app.get("/admission/stats")
+async def get_admission_stats():
+    return{
+        "enabled":admission.enabled,
+        "max_in_flight":ADMISSION_MAX_IN_FLIGHT,
+        "max_queue":ADMISSION_MAX_QUEUE,
+        "per_client":ADMISSION_PER_CLIENT,
+        "queue_timeout":ADMISSION_QUEUE_TIMEOUT,
+        "degraded_modes":sorted(DEGRADED_MODES),
+        **admission.snapshot()
+    }
+
 @app.get("/metrics")
 def get_metrics():
+    require_ready()
     return feature_info['metrics']
 
 if __name__=="__main__":
-    uvicorn.run(app,host="0.0.0.0",port=8000)
\ No newline at end of file
+    uvicorn.run(app,host="0.0.0.0",port=int(os.environ.get('PORT','8000')))
\ No newline at end of file
@@ -0,0 +1,178 @@
+import os
+import math
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+CACHE_KEY_FIELDS=['brand','name','bodyType','color','fuelType','year','power']
+
+def make_cache_key(model_version,car_data):
+    """ключ:версия модели+признаки после приведения к словарю"""
+    return '|'.join([str(model_version)]+[str(car_data[field])for field in CACHE_KEY_FIELDS])
+
+class PredictionCache:
+    """двухуровневый кэш предсказаний:LRU в процессе поверх общего sqlite-файла,
+    который видят все воркеры uvicorn и который переживает перезапуск"""
+    def __init__(self,path='prediction_cache.db',max_entries=100000,memory_entries=4096,evict_every=500):
+        self.path=path
+        self.max_entries=max_entries
+        self.memory_entries=memory_entries
+        self.evict_every=evict_every
+        self.pid=os.getpid()
+        self.memory=OrderedDict()
+        self.lock=threading.Lock()
+        self.local=threading.local()
+        #время обращений к записям sqlite:пишется пачкой вместе со следующей записью,
+        #чтобы попадание оставалось чтением
+        self.touched={}
+        self.stats={
+            'memory_hits':0,
+            'shared_hits':0,
+            'cross_process_hits':0,
+            'misses':0,
+            'puts':0,
+            'evicted':0
+        }
+
+        conn=self._conn()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS prediction_cache(
+                key TEXT PRIMARY KEY,
+                predicted_price REAL,
+                log_price REAL,
+                writer_pid INTEGER,
+                last_access REAL
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_prediction_cache_access ON prediction_cache(last_access)')
+        conn.commit()
+
+    def _conn(self):
+        #соединение на поток:эндпоинты выполняются в пуле потоков
+        conn=getattr(self.local,'conn',None)
+        if conn is None:
+            conn=sqlite3.connect(self.path,timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn=conn
+        return conn
+
+    def _remember(self,key,value):
+        with self.lock:
+            self.memory[key]=value
+            self.memory.move_to_end(key)
+            while len(self.memory)>self.memory_entries:
+                self.memory.popitem(last=False)
+
+    def get(self,key):
+        """(predicted_price,log_price)или None"""
+        with self.lock:
+            value=self.memory.get(key)
+            if value is not None:
+                self.memory.move_to_end(key)
+                self.stats['memory_hits']+=1
+                return value
+
+        try:
+            conn=self._conn()
+            row=conn.execute(
+                'SELECT predicted_price,log_price,writer_pid FROM prediction_cache WHERE key=?',(key,)
+            ).fetchone()
+        except sqlite3.Error:
+            #кэш не должен ронять предсказание
+            row=None
+
+        if row is None:
+            with self.lock:
+                self.stats['misses']+=1
+            return None
+
+        value=(row[0],row[1])
+        with self.lock:
+            self.touched[key]=time.time()
+            self.stats['shared_hits']+=1
+            if row[2]!=self.pid:
+                self.stats['cross_process_hits']+=1
+        self._remember(key,value)
+        return value
+
+    def _flush_touched(self,conn):
+        """отложенное обновление last_access(без commit-его делает вызывающий)"""
+        with self.lock:
+            touched,self.touched=self.touched,{}
+        if touched:
+            conn.executemany('UPDATE prediction_cache SET last_access=? WHERE key=?',[(t,key)for key,t in touched.items()])
+
+    def put(self,key,predicted_price,log_price):
+        value=(float(predicted_price),float(log_price))
+        self._remember(key,value)
+        try:
+            conn=self._conn()
+            conn.execute(
+                'INSERT OR REPLACE INTO prediction_cache VALUES(?,?,?,?,?)',
+                (key,value[0],value[1],self.pid,time.time())
+            )
+            self._flush_touched(conn)
+            conn.commit()
+        except sqlite3.Error:
+            return
+        with self.lock:
+            self.stats['puts']+=1
+            evict=self.stats['puts']%self.evict_every==0
+        if evict:
+            self.evict()
+
+    def put_many(self,items):
+        """items:[(key,predicted_price,log_price)]одной транзакцией"""
+        now=time.time()
+        conn=self._conn()
+        conn.executemany(
+            'INSERT OR IGNORE INTO prediction_cache VALUES(?,?,?,?,?)',
+            [(key,float(price),float(log_price),self.pid,now)for key,price,log_price in items]
+        )
+        conn.commit()
+        self.evict()
+
+    def evict(self):
+        """удаление давно не использованных записей сверх max_entries"""
+        conn=self._conn()
+        self._flush_touched(conn)
+        conn.commit()
+        size=conn.execute('SELECT COUNT(*)FROM prediction_cache').fetchone()[0]
+        extra=size-self.max_entries
+        if extra>0:
+            conn.execute('''
+                DELETE FROM prediction_cache WHERE key IN(
+                    SELECT key FROM prediction_cache ORDER BY last_access LIMIT ?
+                )
+            ''',(extra,))
+            conn.commit()
+            with self.lock:
+                self.stats['evicted']+=extra
+        return max(extra,0)
+
+    def warm_up(self,rows,model_version):
+        """прогрев из истории;rows-[(car_data,predicted_price)]"""
+        items=[
+            (make_cache_key(model_version,car_data),price,math.log1p(price))
+            for car_data,price in rows
+        ]
+        if items:
+            self.put_many(items)
+        return len(items)
+
+    def snapshot(self):
+        with self.lock:
+            stats=dict(self.stats)
+            stats['memory_entries']=len(self.memory)
+        lookups=stats['memory_hits']+stats['shared_hits']+stats['misses']
+        stats['lookups']=lookups
+        stats['hit_rate']=round((stats['memory_hits']+stats['shared_hits'])/lookups,4)if lookups else 0.0
+        stats['cross_process_hit_rate']=round(stats['cross_process_hits']/lookups,4)if lookups else 0.0
+        try:
+            stats['shared_entries']=self._conn().execute('SELECT COUNT(*)FROM prediction_cache').fetchone()[0]
+        except sqlite3.Error:
+            stats['shared_entries']=None
+        stats['pid']=self.pid
+        return stats
@@ -0,0 +1,226 @@
+import json
+import math
+import time
+import queue
+import sqlite3
+import threading
+import numpy as np
+from drift import HistogramSketch
+
+VARIANTS=('primary','candidate')
+
+class ShadowEvaluator:
+    """второй прогноз тем же запросам вне пути запроса:запрос только кладется в очередь,
+    фоновый поток собирает пакет до batch_size(или ждет max_delay секунд)и считает
+    другой вариант одним батчем:чем реже он просыпается,тем меньше отнимает у запросов
+    процессор и GIL.перед пакетом поток ждет,пока busy()не станет False(нет запросов
+    в обработке),но не дольше idle_wait секунд-иначе под постоянной нагрузкой пары копятся.пары пишутся в sqlite(log_path)и в живую статистику.
+    predictors-{'primary':fn,'candidate':fn},fn(машины)->log цены(nan-не закодировать)"""
+    def __init__(self,predictors,versions,log_path=None,batch_size=64,max_delay=1.0,max_queue=1024,busy=None,idle_wait=2.0):
+        self.predictors=predictors
+        self.versions=versions
+        self.log_path=log_path
+        self.batch_size=batch_size
+        self.max_delay=max_delay
+        self.busy=busy
+        self.idle_wait=idle_wait
+        self.queue=queue.Queue(maxsize=max_queue)
+        self.lock=threading.Lock()
+        self.thread=None
+        #разница log цен кандидат-основная:сумма и сумма квадратов,модуль-гистограммой
+        self.abs_diff=HistogramSketch(0.0,1.0,200)
+        self.stats={
+            'submitted':0,
+            'dropped':0,
+            'pairs':0,
+            'unencodable':0,
+            'errors':0,
+            'log_errors':0,
+            'batches':0,
+            'busy_waits':0,
+            #split:машина вне словарей кандидата,ответила основная модель
+            'split_fallback':0,
+            'diff_sum':0.0,
+            'diff_sq_sum':0.0,
+            'over_10_percent':0,
+            #границы наблюдаемых модулей разницы:перцентили гистограммы в них зажимаются,
+            #иначе одинаковые модели дали бы середину первой корзины вместо 0
+            'abs_diff_min':math.inf,
+            'abs_diff_max':0.0,
+            'lag_seconds':0.0
+        }
+        self.last_error=None
+
+    def start(self):
+        self.thread=threading.Thread(target=self._run,name='shadow',daemon=True)
+        self.thread.start()
+
+    def stop(self,timeout=5):
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join(timeout)
+
+    def submit(self,car_data,served_log,served='primary'):
+        """без ожидания:при полной очереди пара теряется,а не задерживает ответ"""
+        try:
+            self.queue.put_nowait((time.monotonic(),car_data,float(served_log),served))
+        except queue.Full:
+            with self.lock:
+                self.stats['dropped']+=1
+            return False
+        with self.lock:
+            self.stats['submitted']+=1
+        return True
+
+    def record(self,name):
+        with self.lock:
+            self.stats[name]+=1
+
+    def _collect(self):
+        """первый элемент ждем без ограничения,остальные-не дольше max_delay"""
+        item=self.queue.get()
+        if item is None:
+            return None
+        batch=[item]
+        deadline=time.monotonic()+self.max_delay
+        while len(batch)<self.batch_size:
+            timeout=deadline-time.monotonic()
+            if timeout<=0:
+                break
+            try:
+                item=self.queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is None:
+                self.queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        conn=self._connect()if self.log_path else None
+        while True:
+            batch=self._collect()
+            if batch is None:
+                break
+            self._wait_idle()
+            try:
+                self._evaluate(batch,conn)
+            except Exception as e:
+                with self.lock:
+                    self.stats['errors']+=len(batch)
+                self.last_error=str(e)
+        if conn is not None:
+            conn.close()
+
+    def _wait_idle(self):
+        if self.busy is None or not self.busy():
+            return
+        with self.lock:
+            self.stats['busy_waits']+=1
+        deadline=time.monotonic()+self.idle_wait
+        while self.busy()and time.monotonic()<deadline:
+            time.sleep(0.002)
+
+    def _connect(self):
+        conn=sqlite3.connect(self.log_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        #пары не критичны:без fsync на каждый пакет
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS shadow_pairs(
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp TEXT,
+                served TEXT,
+                primary_version TEXT,
+                candidate_version TEXT,
+                car_data TEXT,
+                primary_log REAL,
+                candidate_log REAL
+            )
+        ''')
+        conn.commit()
+        return conn
+
+    def _evaluate(self,batch,conn):
+        primary=np.full(len(batch),np.nan)
+        candidate=np.full(len(batch),np.nan)
+        #другой вариант-тот,что не отвечал клиенту
+        for served in VARIANTS:
+            idx=[i for i,item in enumerate(batch)if item[3]==served]
+            if not idx:
+                continue
+            other='candidate'if served=='primary'else'primary'
+            served_logs=np.array([batch[i][2]for i in idx])
+            other_logs=self.predictors[other]([batch[i][1]for i in idx])
+            (primary if served=='primary'else candidate)[idx]=served_logs
+            (candidate if served=='primary'else primary)[idx]=other_logs
+
+        ok=~np.isnan(primary)&~np.isnan(candidate)
+        diff=candidate[ok]-primary[ok]
+        now=time.monotonic()
+        with self.lock:
+            self.stats['batches']+=1
+            self.stats['pairs']+=int(ok.sum())
+            self.stats['unencodable']+=int((~ok).sum())
+            self.stats['diff_sum']+=float(diff.sum())
+            self.stats['diff_sq_sum']+=float((diff**2).sum())
+            self.stats['over_10_percent']+=int((np.abs(np.expm1(diff))>0.1).sum())
+            self.stats['lag_seconds']+=sum(now-item[0]for item in batch)
+            self.abs_diff.add_many(np.abs(diff))
+            if diff.size:
+                self.stats['abs_diff_min']=min(self.stats['abs_diff_min'],float(np.abs(diff).min()))
+                self.stats['abs_diff_max']=max(self.stats['abs_diff_max'],float(np.abs(diff).max()))
+
+        if conn is not None:
+            self._log(conn,batch,primary,candidate)
+
+    def _log(self,conn,batch,primary,candidate):
+        try:
+            timestamp=time.strftime('%Y-%m-%dT%H:%M:%S')
+            conn.executemany(
+                "INSERT INTO shadow_pairs(timestamp,served,primary_version,candidate_version,car_data,primary_log,candidate_log) VALUES(?,?,?,?,?,?,?)",
+                [
+                    (timestamp,item[3],self.versions['primary'],self.versions['candidate'],
+                     json.dumps(item[1],ensure_ascii=False),
+                     None if math.isnan(p)else float(p),None if math.isnan(c)else float(c))
+                    for item,p,c in zip(batch,primary,candidate)
+                ]
+            )
+            conn.commit()
+        except sqlite3.Error as e:
+            with self.lock:
+                self.stats['log_errors']+=len(batch)
+            self.last_error=str(e)
+
+    def snapshot(self):
+        with self.lock:
+            stats=dict(self.stats)
+            abs_diff=self.abs_diff.merge(self.abs_diff.empty())
+        pairs=stats.pop('pairs')
+        diff_sum=stats.pop('diff_sum')
+        diff_sq_sum=stats.pop('diff_sq_sum')
+        lag=stats.pop('lag_seconds')
+        over=stats.pop('over_10_percent')
+        low=stats.pop('abs_diff_min')
+        high=stats.pop('abs_diff_max')
+        processed=pairs+stats['unencodable']+stats['errors']
+        stats.update({
+            'versions':self.versions,
+            'pairs':pairs,
+            'queue_depth':self.queue.qsize(),
+            'avg_batch_size':round(processed/stats['batches'],2)if stats['batches']else 0.0,
+            'avg_lag_ms':round(lag/processed*1000,2)if processed else 0.0,
+            'last_error':self.last_error
+        })
+        if pairs:
+            mean=diff_sum/pairs
+            stats['divergence']={
+                #>0-кандидат в среднем оценивает дороже основной модели
+                'mean_log_diff':round(mean,5),
+                'std_log_diff':round(math.sqrt(max(diff_sq_sum/pairs-mean**2,0.0)),5),
+                'rms_log_diff':round(math.sqrt(diff_sq_sum/pairs),5),
+                'abs_log_diff':{f'p{q}':round(min(max(abs_diff.quantile(q/100),low),high),5)for q in(50,90,99)},
+                'over_10_percent':round(over/pairs,4)
+            }
+        return stats
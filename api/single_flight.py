@@ -0,0 +1,97 @@
+import asyncio
+import threading
+
+class _Call:
+    def __init__(self):
+        self.done=threading.Event()
+        self.result=None
+        self.error=None
+        self.waiters=0
+
+class SingleFlight:
+    """одновременные вызовы с одинаковым ключом выполняются один раз:
+    первый(ведущий)считает,остальные ждут и получают тот же результат"""
+    def __init__(self):
+        self.lock=threading.Lock()
+        self.calls={}
+        self.stats={
+            'leaders':0,
+            'coalesced':0,
+            'errors':0,
+            'max_waiters':0
+        }
+
+    def do(self,key,fn):
+        """(результат,shared);shared=True у тех,кто дождался чужого вызова"""
+        with self.lock:
+            call=self.calls.get(key)
+            if call is None:
+                call=self.calls[key]=_Call()
+                self.stats['leaders']+=1
+                leader=True
+            else:
+                call.waiters+=1
+                self.stats['coalesced']+=1
+                self.stats['max_waiters']=max(self.stats['max_waiters'],call.waiters)
+                leader=False
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result,True
+
+        try:
+            call.result=fn()
+        except Exception as e:
+            call.error=e
+            with self.lock:
+                self.stats['errors']+=1
+            raise
+        finally:
+            #ключ убирается до пробуждения ожидающих:следующий запрос уже посчитается заново
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result,False
+
+    def snapshot(self):
+        with self.lock:
+            stats=dict(self.stats)
+            stats['in_flight']=len(self.calls)
+        requests=stats['leaders']+stats['coalesced']
+        stats['requests']=requests
+        stats['coalesce_rate']=round(stats['coalesced']/requests,4)if requests else 0.0
+        return stats
+
+class AsyncSingleFlight(SingleFlight):
+    """то же в цикле событий:ожидающие ждут asyncio future,не занимая потоков пула"""
+    async def do(self,key,fn):
+        """fn-корутинная функция;(результат,shared)"""
+        call=self.calls.get(key)
+        if call is not None:
+            call.waiters+=1
+            self.stats['coalesced']+=1
+            self.stats['max_waiters']=max(self.stats['max_waiters'],call.waiters)
+            #shield:ушедший ожидающий не отменяет ведущего
+            return await asyncio.shield(call.future),True
+
+        call=self.calls[key]=_Call()
+        call.future=asyncio.get_running_loop().create_future()
+        self.stats['leaders']+=1
+        try:
+            result=await fn()
+        except Exception as e:
+            self.stats['errors']+=1
+            call.future.set_exception(e)
+            #без ожидающих исключение future никто не заберет-asyncio не пишет его в лог
+            call.future.exception()
+            raise
+        except BaseException:
+            call.future.cancel()
+            raise
+        else:
+            call.future.set_result(result)
+        finally:
+            del self.calls[key]
+        return result,False
@@ -0,0 +1,28 @@
+import numpy as np
+from inference import make_forward
+
+def make_mc_forward(model):
+    """один граф для стохастического прохода:dropout включен(training=True)"""
+    return make_forward(model,training=True)
+
+def mc_dropout_interval(forward,features,samples=32,low=10,high=90,point_log=None):
+    """K стохастических проходов одним батчем:вход размножается в K строк"""
+    features=np.asarray(features,dtype=np.float32)
+    tiled=np.repeat(features,samples,axis=0)
+    pred_log=forward(tiled).numpy().reshape(len(features),samples)
+    if point_log is not None:
+        #с включенным dropout среднее смещено из-за relu,берем только разброс
+        #и центрируем его по обычному прогнозу
+        pred_log=pred_log-np.median(pred_log,axis=1,keepdims=True)+np.asarray(point_log,dtype=np.float32).reshape(-1,1)
+    prices=np.expm1(pred_log)
+    p_low,p_mid,p_high=np.percentile(prices,[low,50,high],axis=1)
+    return[
+        {
+            f'p{low}':float(p_low[i]),
+            'p50':float(p_mid[i]),
+            f'p{high}':float(p_high[i]),
+            'std_log':float(pred_log[i].std()),
+            'samples':int(samples)
+        }
+        for i in range(len(features))
+    ]
@@ -0,0 +1,172 @@
+import re
+import bisect
+import numpy as np
+
+_PUNCT_RE=re.compile(r"[\s\-_.,/\\()'\"]+")
+
+def normalize(value):
+    """ключ для сравнения:регистр,ё,пробелы и пунктуация"""
+    key=str(value).casefold().replace('ё','е')
+    return _PUNCT_RE.sub(' ',key).strip()
+
+def _grams(key,n=3):
+    padded=f" {key} "
+    if len(padded)<=n:
+        return{padded}
+    return{padded[i:i+n]for i in range(len(padded)-n+1)}
+
+def _levenshtein(a,b,max_dist=None):
+    """расстояние редактирования;при max_dist ранний выход с max_dist+1"""
+    if a==b:
+        return 0
+    #общие префикс и суффикс не влияют на расстояние
+    start=0
+    while start<len(a)and start<len(b)and a[start]==b[start]:
+        start+=1
+    end=0
+    while end<len(a)-start and end<len(b)-start and a[-1-end]==b[-1-end]:
+        end+=1
+    a,b=a[start:len(a)-end],b[start:len(b)-end]
+    if len(a)<len(b):
+        a,b=b,a
+    if max_dist is not None and len(a)-len(b)>max_dist:
+        return max_dist+1
+    if not b:
+        return len(a)if max_dist is None else min(len(a),max_dist+1)
+    prev=list(range(len(b)+1))
+    for i,ca in enumerate(a,1):
+        cur=[i]
+        for j,cb in enumerate(b,1):
+            cur.append(min(prev[j]+1,cur[j-1]+1,prev[j-1]+(ca!=cb)))
+        if max_dist is not None and min(cur)>max_dist:
+            return max_dist+1
+        prev=cur
+    return prev[-1]if max_dist is None else min(prev[-1],max_dist+1)
+
+class VocabIndex:
+    """индекс словаря:точное совпадение,нормализованный ключ,триграммы"""
+    def __init__(self,values,min_score=0.5,n=3):
+        self.values=list(dict.fromkeys(str(v)for v in values))
+        self.exact=set(self.values)
+        self.min_score=min_score
+        self.n=n
+
+        #нормализованный ключ->исходное значение(первое побеждает)
+        self.by_key={}
+        for value in self.values:
+            self.by_key.setdefault(normalize(value),value)
+        self.keys=list(self.by_key)
+        self.sorted_keys=sorted(self.keys)
+
+        #триграмма->номера ключей
+        self.key_grams=[_grams(key,n)for key in self.keys]
+        postings={}
+        for i,grams in enumerate(self.key_grams):
+            for gram in grams:
+                postings.setdefault(gram,[]).append(i)
+        self.postings={gram:np.array(ids,dtype=np.int32)for gram,ids in postings.items()}
+        self.gram_counts=np.array([len(grams)for grams in self.key_grams],dtype=np.float32)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __contains__(self,value):
+        return value in self.exact
+
+    def _candidates(self,key,limit):
+        grams=_grams(key,self.n)
+        hits=[self.postings[gram]for gram in grams if gram in self.postings]
+        if not hits:
+            return[]
+        overlap=np.bincount(np.concatenate(hits),minlength=len(self.keys))
+        #коэффициент Дайса по триграммам,векторно по всему словарю
+        dice=2*overlap/(len(grams)+self.gram_counts)
+        limit=min(limit,int(np.count_nonzero(overlap)))
+        top=np.argpartition(-dice,limit-1)[:limit]
+        top=top[np.argsort(-dice[top])]
+        return[(float(dice[i]),int(i))for i in top]
+
+    def resolve(self,value,candidates=5):
+        """(значение,способ,оценка);значение None,если ничего похожего нет"""
+        value=str(value)
+        if value in self.exact:
+            return value,'exact',1.0
+
+        key=normalize(value)
+        if key in self.by_key:
+            return self.by_key[key],'normalized',1.0
+        if not key:
+            return None,None,0.0
+
+        best=None
+        for dice,i in self._candidates(key,candidates):
+            #финальный выбор по расстоянию редактирования среди лучших по триграммам
+            candidate=self.keys[i]
+            longest=max(len(key),len(candidate))
+            #считаем расстояние только пока кандидат может обойти лучшего
+            bound=max(dice,best[0]if best else self.min_score)
+            max_dist=int((1-bound)*longest)
+            similarity=1-_levenshtein(key,candidate,max_dist)/longest
+            score=max(similarity,dice)
+            if best is None or score>best[0]:
+                best=(score,candidate)
+
+        if best is None or best[0]<self.min_score:
+            return None,None,round(best[0],4)if best else 0.0
+        return self.by_key[best[1]],'fuzzy',round(best[0],4)
+
+    def complete(self,prefix,limit=10):
+        """подсказки:сначала по префиксу,затем похожие"""
+        key=normalize(prefix)
+        if not key:
+            return self.values[:limit]
+
+        result=[]
+        start=bisect.bisect_left(self.sorted_keys,key)
+        for candidate in self.sorted_keys[start:]:
+            if not candidate.startswith(key)or len(result)>=limit:
+                break
+            result.append(self.by_key[candidate])
+
+        if len(result)<limit:
+            seen=set(result)
+            for _,i in self._candidates(key,limit*2):
+                value=self.by_key[self.keys[i]]
+                if value not in seen:
+                    result.append(value)
+                    seen.add(value)
+                if len(result)>=limit:
+                    break
+        return result
+
+def build_resolvers(encoders,unique_data):
+    """индексы по словарям кодировщиков и по моделям внутри марки"""
+    resolvers={col:VocabIndex(encoder.classes_)for col,encoder in encoders.items()}
+    known_names=resolvers['name'].exact
+    resolvers['models_by_brand']={
+        brand:VocabIndex([m for m in models if m in known_names])
+        for brand,models in unique_data.get('models',{}).items()
+    }
+    return resolvers
+
+def resolve_car(car_data,resolvers,encoders,categorical_cols):
+    """замена категорий на известные классы;возвращает(данные,отчет о замене)"""
+    resolved=dict(car_data)
+    report={}
+    for col in categorical_cols:
+        value=car_data[col]
+        if col=='name':
+            brand_index=resolvers['models_by_brand'].get(resolved['brand'])
+            match,method,score=brand_index.resolve(value)if brand_index else(None,None,0.0)
+            if match is None:
+                match,method,score=resolvers['name'].resolve(value)
+        else:
+            match,method,score=resolvers[col].resolve(value)
+
+        if match is None:
+            #ничего похожего:прежнее поведение,но с пометкой в ответе
+            match,method=str(encoders[col].classes_[0]),'fallback'
+        resolved[col]=match
+        if method!='exact':
+            report[col]={'input':value,'value':match,'method':method,'score':score}
+    return resolved,report
@@ -99,6 +99,9 @@ class CarPriceApp:
                 }
 
                 recommendation=self.get_recommendation(price,year,power)
+                explanation=self.get_explanation(car_data)
+                if explanation:
+                    recommendation+="\n\nЧто сильнее всего влияет на цену:\n"+explanation
 
                 self.save_to_local_history(brand,model,year,power,body_type,color,fuel_type,price)
 
@@ -164,6 +167,30 @@ class CarPriceApp:
             print(f"Ошибка сохранения истории:{e}")
             return False
 
+    def get_explanation(self,car_data,top=3):
+        """главные вклады признаков из /explain;пусто,если API не ответил"""
+        labels={
+            'brand':"Марка",
+            'name':"Модель",
+            'year':"Год выпуска",
+            'power':"Мощность",
+            'bodyType':"Тип кузова",
+            'color':"Цвет",
+            'fuelType':"Тип топлива"
+        }
+        try:
+            response=requests.post(f"{self.api_url}/explain",json=car_data,timeout=3)
+            if response.status_code!=200:
+                return""
+            lines=[]
+            for item in response.json()['contributions'][:top]:
+                arrow="⬆️"if item['percent']>0 else"⬇️"
+                lines.append(f"{arrow}{labels.get(item['feature'],item['feature'])}:{item['percent']:+.0f}% к цене")
+            return"\n".join(lines)
+
+        except:
+            return""
+
     def get_recommendation(self,price,year,power):
         current_year=2024
         age=current_year-year
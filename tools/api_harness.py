@@ -0,0 +1,81 @@
+import os
+import sys
+import json
+import time
+import socket
+import subprocess
+import importlib.util
+import urllib.error
+import urllib.request
+from contextlib import contextmanager
+
+API_DIR=os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','api')
+#имя модуля API в этом процессе:не пересекается с другими main(app/main.py)
+API_MODULE='car_price_api'
+
+def free_port():
+    with socket.socket()as s:
+        s.bind(('127.0.0.1',0))
+        return s.getsockname()[1]
+
+def http_request(url,body=None,timeout=30):
+    """(статус,тело);статус None,если сервер еще не слушает порт"""
+    data=json.dumps(body).encode('utf-8')if body is not None else None
+    req=urllib.request.Request(url,data=data,headers={'Content-Type':'application/json'})
+    try:
+        with urllib.request.urlopen(req,timeout=timeout)as resp:
+            return resp.status,resp.read()
+    except urllib.error.HTTPError as e:
+        return e.code,e.read()
+    except(urllib.error.URLError,ConnectionError,socket.timeout):
+        return None,None
+
+def start_api(api_dir,env=None,timeout=300):
+    """API в отдельном процессе;возвращает(процесс,порт)после /health/ready"""
+    port=free_port()
+    proc=subprocess.Popen([sys.executable,'main.py'],cwd=api_dir,env=dict(os.environ,PORT=str(port),**(env or{})),
+                          stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL)
+    start=time.perf_counter()
+    while time.perf_counter()-start<timeout:
+        status,_=http_request(f"http://127.0.0.1:{port}/health/ready",timeout=1)
+        if status==200:
+            return proc,port
+        if proc.poll()is not None:
+            raise RuntimeError(f"сервер завершился с кодом{proc.returncode}")
+        time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("сервер не дождался готовности")
+
+@contextmanager
+def _working_dir(path):
+    previous=os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+def load_api(api_dir,tmp):
+    """main.py из api_dir в этом процессе с отдельными историей,кэшем и журналом
+    пар во временном каталоге.пути артефактов у API относительные,поэтому загрузка
+    идет из api_dir,после нее текущий каталог возвращается"""
+    api_dir=os.path.abspath(api_dir)
+    #модули API импортируют друг друга по имени(from history_store import...)
+    if api_dir not in sys.path:
+        sys.path.insert(0,api_dir)
+    api=sys.modules.get(API_MODULE)
+    if api is None:
+        spec=importlib.util.spec_from_file_location(API_MODULE,os.path.join(api_dir,'main.py'))
+        api=importlib.util.module_from_spec(spec)
+        sys.modules[API_MODULE]=api
+        spec.loader.exec_module(api)
+    api.HISTORY_DB_PATH=os.path.join(tmp,'history.db')
+    api.PREDICTION_CACHE_PATH=os.path.join(tmp,'prediction_cache.db')
+    if api.SHADOW_LOG_PATH:
+        api.SHADOW_LOG_PATH=os.path.join(tmp,'shadow.db')
+    with _working_dir(api_dir):
+        api.load_unique_values()
+        api.run_startup()
+    if not api.ready.is_set():
+        raise RuntimeError(api.startup['error'])
+    return api
@@ -0,0 +1,155 @@
+import os
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from api_harness import http_request,start_api
+
+def make_cars(api_dir,n,seed):
+    """случайные машины из unique_values.json:почти каждая мимо кэша"""
+    with open(os.path.join(api_dir,'unique_values.json'),'r',encoding='utf-8')as f:
+        unique=json.load(f)
+    rng=random.Random(seed)
+    cars=[]
+    for _ in range(n):
+        brand=rng.choice(unique['brands'])
+        cars.append({
+            'brand':brand,
+            'name':rng.choice(unique['models'].get(brand)or['-']),
+            'bodyType':rng.choice(unique['bodyTypes']),
+            'color':rng.choice(unique['colors']),
+            'fuelType':rng.choice(unique['fuelTypes']),
+            'year':rng.randint(1995,2024),
+            'power':rng.randint(60,400)
+        })
+    return cars
+
+def measure_capacity(port,cars,clients,seconds):
+    """замкнутый цикл:clients клиентов шлют запросы друг за другом"""
+    done=[]
+    stop=time.perf_counter()+seconds
+
+    def client(i):
+        n=0
+        while time.perf_counter()<stop:
+            http_request(f"http://127.0.0.1:{port}/predict",cars[(i*7919+n)%len(cars)])
+            n+=1
+        done.append(n)
+
+    threads=[threading.Thread(target=client,args=(i,))for i in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sum(done)/seconds
+
+def open_loop(port,cars,rps,seconds,timeout):
+    """открытый цикл:запросы уходят по расписанию rps,не дожидаясь ответов,
+    как у клиентов с таймаутом(Gradio-10 с)"""
+    results=[]
+    lock=threading.Lock()
+
+    def send(car):
+        start=time.perf_counter()
+        status,_=http_request(f"http://127.0.0.1:{port}/predict",car,timeout=timeout)
+        with lock:
+            results.append((status,time.perf_counter()-start))
+
+    total=int(rps*seconds)
+    with ThreadPoolExecutor(max_workers=min(total,1024))as pool:
+        start=time.perf_counter()
+        for i in range(total):
+            delay=start+i/rps-time.perf_counter()
+            if delay>0:
+                time.sleep(delay)
+            pool.submit(send,cars[i%len(cars)])
+    return summarize(results,seconds)
+
+def _percentiles(values):
+    if not values:
+        return None
+    values=sorted(values)
+    pick=lambda q:round(values[min(int(len(values)*q),len(values)-1)]*1000,1)
+    return{'p50_ms':pick(0.5),'p95_ms':pick(0.95),'p99_ms':pick(0.99),'max_ms':round(values[-1]*1000,1)}
+
+def summarize(results,seconds):
+    ok=[latency for status,latency in results if status==200]
+    rejected=[latency for status,latency in results if status in(429,503)]
+    timeouts=sum(1 for status,_ in results if status is None)
+    return{
+        'requests':len(results),
+        'ok':len(ok),
+        'rejected':len(rejected),
+        'timeouts':timeouts,
+        'other_errors':len(results)-len(ok)-len(rejected)-timeouts,
+        'goodput_rps':round(len(ok)/seconds,1),
+        'ok_latency':_percentiles(ok),
+        'reject_latency':_percentiles(rejected)
+    }
+
+def run(api_dir,env,cars,rps,seconds,timeout):
+    with tempfile.TemporaryDirectory()as tmp:
+        env=dict(env,
+                 HISTORY_DB_PATH=os.path.join(tmp,'history.db'),
+                 PREDICTION_CACHE_PATH=os.path.join(tmp,'prediction_cache.db'))
+        proc,port=start_api(api_dir,env)
+        try:
+            result=open_loop(port,cars,rps,seconds,timeout)
+            status,body=http_request(f"http://127.0.0.1:{port}/admission/stats")
+            if status==200:
+                result['admission']={k:v for k,v in json.loads(body).items()
+                                     if k in('rejected_queue_full','rejected_timeout','max_queue_depth','avg_queue_wait_ms','history_skipped','served_from_cache')}
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+    return result
+
+def main():
+    parser=argparse.ArgumentParser(description="нагрузка 2x от пропускной способности:с допуском и без")
+    parser.add_argument('--api-dir',required=True,help="каталог с main.py и артефактами модели")
+    parser.add_argument('--overload',type=float,default=2.0,help="во сколько раз нагрузка выше пропускной способности")
+    parser.add_argument('--seconds',type=float,default=20)
+    parser.add_argument('--timeout',type=float,default=10,help="таймаут клиента,как в Gradio")
+    parser.add_argument('--capacity-clients',type=int,default=16)
+    parser.add_argument('--max-in-flight',type=int,default=8)
+    parser.add_argument('--max-queue',type=int,default=16)
+    parser.add_argument('--degraded',default='history',help="DEGRADED_MODES для третьего прогона")
+    parser.add_argument('--seed',type=int,default=42)
+    args=parser.parse_args()
+
+    api_dir=os.path.abspath(args.api_dir)
+    cars=make_cars(api_dir,20000,args.seed)
+    admission={'ADMISSION_MAX_IN_FLIGHT':str(args.max_in_flight),'ADMISSION_MAX_QUEUE':str(args.max_queue)}
+
+    with tempfile.TemporaryDirectory()as tmp:
+        proc,port=start_api(api_dir,dict(admission,
+                                         HISTORY_DB_PATH=os.path.join(tmp,'history.db'),
+                                         PREDICTION_CACHE_PATH=os.path.join(tmp,'prediction_cache.db')))
+        try:
+            capacity=measure_capacity(port,cars,args.capacity_clients,5)
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+    rps=capacity*args.overload
+    #другой срез машин,чтобы не попадать в кэш от замера
+    cars=cars[len(cars)//2:]
+    report={
+        'capacity_rps':round(capacity,1),
+        'offered_rps':round(rps,1),
+        'seconds':args.seconds,
+        'without_admission':run(api_dir,{'ADMISSION_MAX_IN_FLIGHT':'0'},cars,rps,args.seconds,args.timeout),
+        'with_admission':run(api_dir,admission,cars,rps,args.seconds,args.timeout)
+    }
+    if args.degraded:
+        report[f'with_admission_degraded_{args.degraded}']=run(
+            api_dir,dict(admission,DEGRADED_MODES=args.degraded),cars,rps,args.seconds,args.timeout
+        )
+    print(json.dumps(report,ensure_ascii=False,indent=2))
+
+if __name__=="__main__":
+    main()
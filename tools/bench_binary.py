@@ -0,0 +1,122 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import http.client
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','api'))
+from binary_server import BinaryClient
+from api_harness import free_port,start_api
+
+def make_rows(meta,n,seed):
+    """случайные коды категорий и год/мощность"""
+    rng=random.Random(seed)
+    sizes=[len(meta['classes'][col])for col in meta['categorical_cols']]
+    return[
+        ([rng.randrange(size)for size in sizes],rng.randint(1995,2024),rng.randint(60,400))
+        for _ in range(n)
+    ]
+
+def bench_json(port,meta,rows,connections):
+    """POST /predict по строке,keep-alive,connections параллельных соединений"""
+    cols=meta['categorical_cols']
+    bodies=[
+        json.dumps(dict(
+            {col:meta['classes'][col][code]for col,code in zip(cols,codes)},
+            year=year,power=power
+        )).encode('utf-8')
+        for codes,year,power in rows
+    ]
+    parts=[bodies[i::connections]for i in range(connections)]
+
+    def worker(part):
+        conn=http.client.HTTPConnection('127.0.0.1',port)
+        for body in part:
+            conn.request('POST','/predict',body,{'Content-Type':'application/json'})
+            resp=conn.getresponse()
+            resp.read()
+            if resp.status!=200:
+                raise RuntimeError(f"/predict:{resp.status}")
+        conn.close()
+
+    return _timed(worker,parts,len(rows))
+
+def bench_binary(binary_port,rows,connections,batch_size,window):
+    """кадры по batch_size строк,до window кадров в полете на соединение"""
+    batches=[
+        ([r[0]for r in rows[i:i+batch_size]],[r[1]for r in rows[i:i+batch_size]],[r[2]for r in rows[i:i+batch_size]])
+        for i in range(0,len(rows),batch_size)
+    ]
+    parts=[batches[i::connections]for i in range(connections)]
+
+    def worker(part):
+        client=BinaryClient(port=binary_port)
+        for response in client.predict_many(part,window=window):
+            if 'error'in response:
+                raise RuntimeError(response['error'])
+        client.close()
+
+    return _timed(worker,parts,len(rows))
+
+def _timed(worker,parts,rows):
+    errors=[]
+
+    def run(part):
+        try:
+            worker(part)
+        except Exception as e:
+            errors.append(str(e))
+
+    threads=[threading.Thread(target=run,args=(part,))for part in parts]
+    start=time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    seconds=time.perf_counter()-start
+    if errors:
+        raise RuntimeError(errors[0])
+    return{'rows':rows,'seconds':round(seconds,3),'rows_per_second':round(rows/seconds,1)}
+
+def main():
+    parser=argparse.ArgumentParser(description="пропускная способность:JSON /predict и бинарный интерфейс")
+    parser.add_argument('--api-dir',required=True,help="каталог с main.py и артефактами модели")
+    parser.add_argument('--rows',type=int,default=2000)
+    parser.add_argument('--connections',type=int,default=4)
+    parser.add_argument('--batch-size',type=int,default=256)
+    parser.add_argument('--window',type=int,default=8,help="кадров в полете на соединение")
+    parser.add_argument('--seed',type=int,default=42)
+    args=parser.parse_args()
+
+    with tempfile.TemporaryDirectory()as tmp:
+        binary_port=free_port()
+        proc,port=start_api(os.path.abspath(args.api_dir),{
+            'BINARY_PORT':str(binary_port),
+            'HISTORY_DB_PATH':os.path.join(tmp,'history.db'),
+            'PREDICTION_CACHE_PATH':os.path.join(tmp,'prediction_cache.db')
+        })
+        try:
+            client=BinaryClient(port=binary_port)
+            meta=client.meta()
+            client.close()
+            rows=make_rows(meta,args.rows,args.seed)
+            report={
+                'json_per_row':bench_json(port,meta,rows,args.connections),
+                'binary_per_row':bench_binary(binary_port,rows,args.connections,1,args.window),
+                f'binary_batch_{args.batch_size}':bench_binary(binary_port,rows,args.connections,args.batch_size,args.window)
+            }
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+    base=report['json_per_row']['rows_per_second']
+    for result in report.values():
+        result['speedup_vs_json']=round(result['rows_per_second']/base,1)
+    print(json.dumps(report,ensure_ascii=False,indent=2))
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,70 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import multiprocessing as mp
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','api'))
+from prediction_cache import PredictionCache
+
+def _worker(args):
+    """имитация воркера uvicorn:zipf-поток запросов,промах=расчет модели"""
+    path,worker_id,requests,keyspace,compute_ms,memory_entries,seed=args
+    cache=PredictionCache(path,memory_entries=memory_entries)
+    rng=random.Random(seed+worker_id)
+    weights=[1/(rank+1)for rank in range(keyspace)]
+    keys=rng.choices(range(keyspace),weights=weights,k=requests)
+
+    start=time.perf_counter()
+    for k in keys:
+        key=f"v1|car{k}"
+        if cache.get(key)is None:
+            time.sleep(compute_ms/1000)
+            cache.put(key,1000000.0+k,13.8)
+    seconds=time.perf_counter()-start
+    stats=cache.snapshot()
+    stats['seconds']=seconds
+    return stats
+
+def run(processes,shared,args):
+    with tempfile.TemporaryDirectory()as tmp:
+        jobs=[
+            (os.path.join(tmp,'cache.db'if shared else f'cache_{i}.db'),i,args.requests,args.keyspace,
+             args.compute_ms,args.memory_entries,args.seed)
+            for i in range(processes)
+        ]
+        with mp.get_context('spawn').Pool(processes)as pool:
+            results=pool.map(_worker,jobs)
+
+    lookups=sum(r['lookups']for r in results)
+    return{
+        'processes':processes,
+        'shared_store':shared,
+        'hit_rate':round(sum(r['memory_hits']+r['shared_hits']for r in results)/lookups,4),
+        'memory_hit_rate':round(sum(r['memory_hits']for r in results)/lookups,4),
+        'cross_process_hit_rate':round(sum(r['cross_process_hits']for r in results)/lookups,4),
+        'model_calls':sum(r['misses']for r in results),
+        'wall_seconds_max':round(max(r['seconds']for r in results),2)
+    }
+
+def main():
+    parser=argparse.ArgumentParser(description="доля попаданий общего кэша между процессами")
+    parser.add_argument('--processes',type=int,default=4)
+    parser.add_argument('--requests',type=int,default=3000,help="запросов на процесс")
+    parser.add_argument('--keyspace',type=int,default=20000,help="разных конфигураций авто")
+    parser.add_argument('--compute-ms',type=float,default=2.0,help="имитация времени model.predict")
+    parser.add_argument('--memory-entries',type=int,default=1024)
+    parser.add_argument('--seed',type=int,default=42)
+    args=parser.parse_args()
+
+    report={
+        'per_process_store':run(args.processes,False,args),
+        'memory_plus_shared':run(args.processes,True,args)
+    }
+    print(json.dumps(report,ensure_ascii=False,indent=2))
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,95 @@
+import os
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import threading
+
+from api_harness import API_DIR,load_api
+
+def burst(main,car,clients):
+    """clients потоков одновременно отправляют один и тот же запрос"""
+    barrier=threading.Barrier(clients)
+    latencies=[]
+    lock=threading.Lock()
+
+    def client():
+        request=main.CarRequest(**car)
+        barrier.wait()
+        start=time.perf_counter()
+        #без допуска(admission):сравнивается только объединение
+        main.compute_prediction(request,False,32)
+        with lock:
+            latencies.append(time.perf_counter()-start)
+
+    threads=[threading.Thread(target=client)for _ in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies
+
+def run(main,cars,clients,coalescing):
+    main.PREDICT_COALESCING=coalescing
+    counts={'model_calls':0,'history_writes':0}
+    forward,save=main.forward,main.save_to_history
+
+    def counted_forward(x):
+        counts['model_calls']+=1
+        return forward(x)
+
+    def counted_save(car_data,price,model_version=None):
+        counts['history_writes']+=1
+        return save(car_data,price,model_version)
+
+    main.forward,main.save_to_history=counted_forward,counted_save
+    latencies=[]
+    start=time.perf_counter()
+    try:
+        for car in cars:
+            latencies.extend(burst(main,car,clients))
+    finally:
+        main.forward,main.save_to_history=forward,save
+    seconds=time.perf_counter()-start
+    latencies.sort()
+    return{
+        'coalescing':coalescing,
+        'requests':len(latencies),
+        'model_calls':counts['model_calls'],
+        'history_writes':counts['history_writes'],
+        'throughput_rps':round(len(latencies)/seconds,1),
+        'p50_ms':round(statistics.median(latencies)*1000,2),
+        'p99_ms':round(latencies[int(len(latencies)*0.99)-1]*1000,2)
+    }
+
+def main():
+    parser=argparse.ArgumentParser(description="одинаковые одновременные /predict:с объединением и без")
+    parser.add_argument('--api-dir',default=API_DIR,help="каталог с main.py и артефактами модели")
+    parser.add_argument('--clients',type=int,default=32,help="одновременных одинаковых запросов")
+    parser.add_argument('--bursts',type=int,default=50,help="всплесков,каждый с новой машиной(мимо кэша)")
+    args=parser.parse_args()
+
+    with tempfile.TemporaryDirectory()as tmp:
+        api=load_api(os.path.abspath(args.api_dir),tmp)
+        brand=api.unique_data['brands'][0]
+        base={
+            'brand':brand,
+            'name':api.unique_data['models'][brand][0],
+            'bodyType':api.unique_data['bodyTypes'][0],
+            'color':api.unique_data['colors'][0],
+            'fuelType':api.unique_data['fuelTypes'][0],
+            'year':2015
+        }
+        #разная мощность в прогонах:каждый всплеск начинается с промаха кэша
+        report={
+            'clients':args.clients,
+            'bursts':args.bursts,
+            'without':run(api,[dict(base,power=100+i)for i in range(args.bursts)],args.clients,False),
+            'with':run(api,[dict(base,power=1000+i)for i in range(args.bursts)],args.clients,True),
+            'single_flight':api.single_flight.snapshot()
+        }
+    print(json.dumps(report,ensure_ascii=False,indent=2))
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,103 @@
+import os
+import json
+import time
+import random
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+
+from api_harness import API_DIR,load_api
+from bench_explain import random_cars
+
+def shifted_cars(api,n,seed):
+    """сдвинутый поток:годы новее словаря,незнакомые модели(уходят в fallback)"""
+    rng=random.Random(seed)
+    cars=random_cars(api,n,seed)
+    for car in cars:
+        car['year']=rng.randint(2022,2027)
+        if rng.random()<0.3:
+            car['name']=f"zz-{rng.randrange(20)}"
+    return cars
+
+def reference_for(api,cars):
+    """эталон по машинам и прогнозам модели,если в артефактах его нет"""
+    from drift import build_reference
+    df=pd.DataFrame(cars)
+    prices=np.expm1(api.predict_log(api.forward,api.encode_batch(cars)))
+    return build_reference(df,api.feature_info['categorical_cols'],api.feature_info['numerical_cols'],prices)
+
+def time_predictions(api,requests,monitor):
+    """compute_prediction без записи истории,монитор включен через запрос"""
+    times={True:[],False:[]}
+    for i,request in enumerate(requests):
+        enabled=i%2==0
+        api.drift_monitor=monitor if enabled else None
+        start=time.perf_counter()
+        api.compute_prediction(request,False,32,False)
+        times[enabled].append(time.perf_counter()-start)
+    api.drift_monitor=monitor
+    summary=lambda t:{'mean_us':round(float(np.mean(t))*1e6,1),'p50_us':round(float(np.median(t))*1e6,1)}
+    return summary(times[True]),summary(times[False])
+
+def main():
+    parser=argparse.ArgumentParser(description="стоимость монитора дрейфа на запрос и чувствительность оценок")
+    parser.add_argument('--api-dir',default=API_DIR,help="каталог с main.py и артефактами модели")
+    parser.add_argument('--requests',type=int,default=4000)
+    parser.add_argument('--seed',type=int,default=42)
+    args=parser.parse_args()
+
+    with tempfile.TemporaryDirectory()as tmp:
+        api=load_api(os.path.abspath(args.api_dir),tmp)
+        from drift import DriftMonitor
+        cols=api.feature_info['categorical_cols'],api.feature_info['numerical_cols']
+
+        reference=api.feature_info.get('drift_reference')
+        report={'reference':'artifacts'if reference else'synthetic'}
+        if not reference:
+            reference=reference_for(api,random_cars(api,20000,args.seed+1))
+
+        #чистая стоимость observe
+        monitor=DriftMonitor(reference,*cols,window=args.requests)
+        cars=random_cars(api,args.requests,args.seed)
+        prices=np.expm1(api.predict_log(api.forward,api.encode_batch(cars)))
+        start=time.perf_counter()
+        for car,price in zip(cars,prices):
+            monitor.observe(car,{},price)
+        report['observe_us']=round((time.perf_counter()-start)/len(cars)*1e6,2)
+        start=time.perf_counter()
+        snapshot=monitor.snapshot()
+        report['snapshot_ms']=round((time.perf_counter()-start)*1000,2)
+        report['same_distribution']={
+            'drift_score':snapshot['drift_score'],
+            'drifted':snapshot['drifted'],
+            'name_tv':snapshot['features']['name']['tv']
+        }
+
+        #весь путь /predict(разбор,кэш,модель)с монитором и без
+        requests=[api.CarRequest(**car)for car in random_cars(api,args.requests,args.seed+2)]
+        api.compute_prediction(requests[0],False,32,False)
+        on,off=time_predictions(api,requests,DriftMonitor(reference,*cols))
+        report['predict_with_monitor']=on
+        report['predict_without_monitor']=off
+        report['overhead_us']=round(on['mean_us']-off['mean_us'],1)
+        report['overhead_percent']=round((on['mean_us']/off['mean_us']-1)*100,2)
+
+        #сдвинутый поток через настоящий путь с разбором названий
+        api.drift_monitor=DriftMonitor(reference,*cols)
+        for car in shifted_cars(api,2000,args.seed+3):
+            api.compute_prediction(api.CarRequest(**car),False,32,False)
+        snapshot=api.get_drift()
+        report['shifted']={
+            'drift_score':snapshot['drift_score'],
+            'scores':{name:f['score']for name,f in snapshot['features'].items()},
+            'drifted':snapshot['drifted'],
+            'year_out_of_range':snapshot['features']['year']['out_of_range'],
+            'name_fallback_rate':snapshot['features']['name']['fallback_rate'],
+            'name_top_unknown':snapshot['features']['name']['top_unknown'][:5]
+        }
+
+    print(json.dumps(report,ensure_ascii=False,indent=2))
+
+if __name__=="__main__":
+    main()
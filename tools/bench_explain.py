@@ -0,0 +1,81 @@
+import os
+import json
+import time
+import random
+import argparse
+import tempfile
+import numpy as np
+
+from api_harness import API_DIR,load_api
+
+def random_cars(api,n,seed):
+    """случайные машины из словарей модели(уже разобранные значения)"""
+    rng=random.Random(seed)
+    cols=api.feature_info['categorical_cols']
+    classes={col:[str(v)for v in api.encoders[col].classes_]for col in cols}
+    return[
+        dict({col:rng.choice(classes[col])for col in cols},year=rng.randint(1995,2024),power=rng.randint(60,400))
+        for _ in range(n)
+    ]
+
+def timed(fn,repeats):
+    times=[]
+    for _ in range(repeats):
+        start=time.perf_counter()
+        fn()
+        times.append(time.perf_counter()-start)
+    times=np.array(times)*1000
+    return{'p50_ms':round(float(np.percentile(times,50)),2),'p95_ms':round(float(np.percentile(times,95)),2)}
+
+def naive_occlusion(api,car):
+    """как без батча:отдельный model.predict на исходную машину и на каждую замену"""
+    features=api.encode_batch([car]).astype(np.float32)
+    point=api.model.predict(features,verbose=0)[0][0]
+    for j in range(features.shape[1]):
+        row=features.copy()
+        row[0,j]=api.baseline[j]
+        api.model.predict(row,verbose=0)
+    return point
+
+def main():
+    parser=argparse.ArgumentParser(description="задержка /explain:одна машина и пакеты")
+    parser.add_argument('--api-dir',default=API_DIR,help="каталог с main.py и артефактами модели")
+    parser.add_argument('--repeats',type=int,default=50)
+    parser.add_argument('--batch-sizes',default='16,64,256')
+    parser.add_argument('--steps',type=int,default=32,help="шагов интегрированных градиентов")
+    parser.add_argument('--target-ms',type=float,default=20,help="цель p95 для одной машины")
+    parser.add_argument('--seed',type=int,default=42)
+    args=parser.parse_args()
+
+    with tempfile.TemporaryDirectory()as tmp:
+        api=load_api(os.path.abspath(args.api_dir),tmp)
+        cars=random_cars(api,max(int(b)for b in args.batch_sizes.split(',')),args.seed)
+        car=cars[0]
+
+        report={
+            'naive_occlusion_single':timed(lambda:naive_occlusion(api,car),max(args.repeats//10,3)),
+            'occlusion_single':timed(lambda:api.explain_cars([car],'occlusion'),args.repeats),
+            'integrated_gradients_single':timed(lambda:api.explain_cars([car],'integrated_gradients',args.steps),args.repeats)
+        }
+        for size in(int(b)for b in args.batch_sizes.split(',')):
+            for method in('occlusion','integrated_gradients'):
+                result=timed(lambda:api.explain_cars(cars[:size],method,args.steps),max(args.repeats//5,5))
+                result['per_car_ms']=round(result['p50_ms']/size,3)
+                report[f'{method}_batch_{size}']=result
+
+        #проверки:сумма вкладов IG~разница с базовой ценой,вклад замены совпадает с отдельным прогнозом
+        ig=api.explain_cars([car],'integrated_gradients',args.steps)[0]
+        occ=api.explain_cars([car],'occlusion')[0]
+        report['ig_completeness_error']=round(abs(
+            sum(c['log_contribution']for c in ig['contributions'])-(ig['log_price']-np.log1p(ig['baseline_price']))
+        ),5)
+        report['occlusion_matches_model_predict']=bool(abs(occ['log_price']-naive_occlusion(api,car))<1e-4)
+
+    report['target_p95_ms']=args.target_ms
+    report['meets_target']={
+        key:report[key]['p95_ms']<=args.target_ms for key in('occlusion_single','integrated_gradients_single')
+    }
+    print(json.dumps(report,ensure_ascii=False,indent=2))
+
+if __name__=="__main__":
+    main()
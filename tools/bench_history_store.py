@@ -0,0 +1,163 @@
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import sqlite3
+import argparse
+import tempfile
+from datetime import datetime,timedelta
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','api'))
+from history_store import HistoryStore
+
+LEGACY_SCHEMA='''
+    CREATE TABLE predictions(
+        id TEXT PRIMARY KEY,
+        timestamp TEXT,
+        brand TEXT,
+        model TEXT,
+        year INTEGER,
+        power INTEGER,
+        body_type TEXT,
+        color TEXT,
+        fuel_type TEXT,
+        predicted_price REAL,
+        monthly_payment REAL,
+        credit_term INTEGER,
+        interest_rate REAL,
+        down_payment REAL
+    )
+'''
+
+def synth_rows(unique_data,n,seed=42):
+    """случайные запросы по справочнику,время-последние 90 дней"""
+    rng=random.Random(seed)
+    start=datetime.now()-timedelta(days=90)
+    step=timedelta(days=90)/n
+    brands=[b for b in unique_data['brands']if unique_data['models'].get(b)]
+    for i in range(n):
+        brand=rng.choice(brands)
+        yield{
+            'timestamp':(start+step*i).isoformat(),
+            'brand':brand,
+            'name':rng.choice(unique_data['models'][brand]),
+            'year':rng.choice(unique_data['years']),
+            'power':rng.randint(unique_data['min_power'],400),
+            'bodyType':rng.choice(unique_data['bodyTypes']),
+            'color':rng.choice(unique_data['colors']),
+            'fuelType':rng.choice(unique_data['fuelTypes']),
+            'price':rng.uniform(1e5,5e6)
+        }
+
+def legacy_insert(cursor,car):
+    record_id=hashlib.md5(f"{car}{datetime.now()}".encode()).hexdigest()[:10]
+    cursor.execute('''
+        INSERT OR REPLACE INTO predictions
+        (id,timestamp,brand,model,year,power,body_type,color,fuel_type,predicted_price)
+        VALUES(?,?,?,?,?,?,?,?,?,?)
+    ''',(record_id,car['timestamp'],car['brand'],car['name'],car['year'],car['power'],
+         car['bodyType'],car['color'],car['fuelType'],car['price']))
+
+def _db_size(path):
+    return sum(os.path.getsize(p)for p in(path,path+'-wal')if os.path.exists(p))
+
+def _timed(fn):
+    start=time.perf_counter()
+    result=fn()
+    return time.perf_counter()-start,result
+
+def main():
+    parser=argparse.ArgumentParser(description="старая и новая схема истории:размер и скорость")
+    parser.add_argument('--rows',type=int,default=200000)
+    parser.add_argument('--single-inserts',type=int,default=2000,help="вставок с коммитом на каждую,как в /predict")
+    parser.add_argument('--unique-values',default='unique_values.json')
+    args=parser.parse_args()
+
+    with open(args.unique_values,'r',encoding='utf-8')as f:
+        unique_data=json.load(f)
+    rows=list(synth_rows(unique_data,args.rows))
+    extra=list(synth_rows(unique_data,args.single_inserts,seed=7))
+    report={'rows':args.rows}
+
+    with tempfile.TemporaryDirectory()as tmp:
+        #старая схема
+        legacy_path=os.path.join(tmp,'legacy.db')
+        conn=sqlite3.connect(legacy_path)
+        conn.execute(LEGACY_SCHEMA)
+        seconds,_=_timed(lambda:[legacy_insert(conn.cursor(),car)for car in rows])
+        conn.commit()
+        legacy={'bulk_insert_rows_per_s':round(args.rows/seconds)}
+
+        def legacy_single():
+            for car in extra:
+                c=sqlite3.connect(legacy_path)
+                legacy_insert(c.cursor(),dict(car,timestamp=datetime.now().isoformat()))
+                c.commit()
+                c.close()
+        seconds,_=_timed(legacy_single)
+        legacy['single_insert_ms']=round(seconds/len(extra)*1000,3)
+        legacy['size_mb']=round(_db_size(legacy_path)/2**20,2)
+        seconds,_=_timed(lambda:conn.execute('SELECT*FROM predictions ORDER BY timestamp DESC LIMIT 10 OFFSET 0').fetchall())
+        legacy['page_ms']=round(seconds*1000,3)
+        seconds,count=_timed(lambda:sum(1 for _ in conn.execute('SELECT*FROM predictions ORDER BY timestamp')))
+        legacy['full_scan_ms']=round(seconds*1000,1)
+        conn.close()
+        report['legacy']=legacy
+
+        #миграция в новую схему
+        new_path=os.path.join(tmp,'new.db')
+        conn=sqlite3.connect(new_path)
+        conn.execute(LEGACY_SCHEMA)
+        conn.executemany('''
+            INSERT INTO predictions(id,timestamp,brand,model,year,power,body_type,color,fuel_type,predicted_price)
+            VALUES(?,?,?,?,?,?,?,?,?,?)
+        ''',[(str(i),car['timestamp'],car['brand'],car['name'],car['year'],car['power'],
+              car['bodyType'],car['color'],car['fuelType'],car['price'])for i,car in enumerate(rows)])
+        conn.commit()
+        conn.close()
+
+        store=HistoryStore(new_path)
+        conn=store.connect()
+        seconds,moved=_timed(lambda:store.migrate_legacy(conn))
+        conn.execute('VACUUM')
+        new={'migrated_rows':moved,'migration_s':round(seconds,2)}
+
+        #вставки в том же режиме,что и для старой схемы
+        bulk_store=HistoryStore(os.path.join(tmp,'bulk.db'))
+        bulk=bulk_store.connect()
+        seconds,_=_timed(lambda:[bulk_store.insert(bulk.cursor(),car,car['price'])for car in rows])
+        bulk.commit()
+        bulk.close()
+        new['bulk_insert_rows_per_s']=round(args.rows/seconds)
+
+        def new_single():
+            for car in extra:
+                c=store.connect()
+                store.insert(c.cursor(),car,car['price'])
+                c.commit()
+                c.close()
+        seconds,_=_timed(new_single)
+        new['single_insert_ms']=round(seconds/len(extra)*1000,3)
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        new['size_mb']=round(_db_size(new_path)/2**20,2)
+        seconds,_=_timed(lambda:store.page(conn.cursor(),10,0))
+        new['page_ms']=round(seconds*1000,3)
+        seconds,_=_timed(lambda:sum(len(batch)for batch in store.iter_batches(conn.cursor())))
+        new['full_scan_ms']=round(seconds*1000,1)
+
+        #удаление старше 30 дней целыми таблицами
+        store.retention_days=30
+        seconds,dropped=_timed(lambda:store.purge(conn.cursor()))
+        conn.commit()
+        new['purge_ms']=round(seconds*1000,2)
+        new['purged_partitions']=dropped
+        conn.close()
+        report['new']=new
+
+    report['size_ratio']=round(report['legacy']['size_mb']/report['new']['size_mb'],2)
+    print(json.dumps(report,ensure_ascii=False,indent=2))
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,49 @@
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+from tensorflow import keras
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','api'))
+from uncertainty import make_mc_forward,mc_dropout_interval
+
+def _timed(fn,repeat):
+    fn()
+    timings=[]
+    for _ in range(repeat):
+        start=time.perf_counter()
+        fn()
+        timings.append((time.perf_counter()-start)*1000)
+    return float(np.percentile(timings,50)),float(np.percentile(timings,95))
+
+def main():
+    parser=argparse.ArgumentParser(description="задержка интервалов MC-dropout")
+    parser.add_argument('--model',default='models/car_price_model.keras')
+    parser.add_argument('--samples',default='16,64')
+    parser.add_argument('--repeat',type=int,default=50)
+    parser.add_argument('--budget-ms',type=float,default=50.0,help="допустимая добавка к задержке /predict")
+    args=parser.parse_args()
+
+    model=keras.models.load_model(args.model)
+    forward=make_mc_forward(model)
+    features=np.zeros((1,model.input_shape[-1]),dtype=np.float32)
+
+    report={'budget_ms':args.budget_ms,'point_predict_ms':round(_timed(lambda:model.predict(features,verbose=0),args.repeat)[0],3),'runs':[]}
+    for k in[int(v)for v in args.samples.split(',')]:
+        batched_p50,batched_p95=_timed(lambda:mc_dropout_interval(forward,features,k),args.repeat)
+        #наивный вариант:K отдельных вызовов model.predict
+        naive_p50,_=_timed(lambda:[model.predict(features,verbose=0)for _ in range(k)],max(args.repeat//10,3))
+        report['runs'].append({
+            'samples':k,
+            'batched_p50_ms':round(batched_p50,3),
+            'batched_p95_ms':round(batched_p95,3),
+            'separate_predict_p50_ms':round(naive_p50,3),
+            'speedup':round(naive_p50/batched_p50,1),
+            'within_budget':batched_p95<=args.budget_ms
+        })
+    print(json.dumps(report,ensure_ascii=False,indent=2))
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,71 @@
+import os
+import sys
+import json
+import time
+import pickle
+import random
+import argparse
+import numpy as np
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','api'))
+from vocab_index import VocabIndex
+
+def perturb(value,rng):
+    """типичные ошибки ввода:регистр,пробелы,опечатка,пропуск символа"""
+    kind=rng.choice(['case','space','typo','drop'])
+    if kind=='case':
+        return value.upper()if rng.random()<0.5 else value.lower()
+    if kind=='space':
+        return f" {value} "
+    if len(value)<4:
+        return value.lower()
+    i=rng.randrange(1,len(value)-1)
+    if kind=='typo':
+        return value[:i]+rng.choice('abcdefghijklmnopqrstuvwxyz')+value[i+1:]
+    return value[:i]+value[i+1:]
+
+def main():
+    parser=argparse.ArgumentParser(description="задержка поиска моделей в индексе словаря")
+    parser.add_argument('--encoders',default='models/encoders.pkl')
+    parser.add_argument('--repeat',type=int,default=3)
+    args=parser.parse_args()
+
+    with open(args.encoders,'rb')as f:
+        encoders=pickle.load(f)
+    names=[str(v)for v in encoders['name'].classes_]
+
+    start=time.perf_counter()
+    index=VocabIndex(names)
+    build_ms=(time.perf_counter()-start)*1000
+
+    rng=random.Random(42)
+    queries=[(name,perturb(name,rng))for name in names]*args.repeat
+
+    timings=[]
+    correct=0
+    methods={}
+    for expected,query in queries:
+        t0=time.perf_counter_ns()
+        value,method,_=index.resolve(query)
+        timings.append((time.perf_counter_ns()-t0)/1000)
+        correct+=value==expected
+        methods[method]=methods.get(method,0)+1
+
+    timings=np.array(timings)
+    report={
+        'vocab_size':len(names),
+        'build_ms':round(build_ms,2),
+        'lookups':len(queries),
+        'accuracy':round(correct/len(queries),4),
+        'methods':{str(k):v for k,v in methods.items()},
+        'latency_us':{
+            'p50':round(float(np.percentile(timings,50)),1),
+            'p90':round(float(np.percentile(timings,90)),1),
+            'p99':round(float(np.percentile(timings,99)),1),
+            'max':round(float(timings.max()),1)
+        }
+    }
+    print(json.dumps(report,ensure_ascii=False,indent=2))
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,116 @@
+import os
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+from api_harness import http_request,load_api,start_api
+from bench_admission import make_cars,open_loop,_percentiles
+
+ARTIFACTS=['car_price_model.keras','scaler.pkl','encoders.pkl','feature_info.pkl']
+
+def perturbed_candidate(api_dir,out_dir,noise,seed):
+    """копия основной модели с шумом в весах-кандидат с ненулевым расхождением"""
+    import numpy as np
+    from tensorflow import keras
+    os.makedirs(out_dir,exist_ok=True)
+    for name in ARTIFACTS[1:]:
+        shutil.copy(os.path.join(api_dir,name),out_dir)
+    model=keras.models.load_model(os.path.join(api_dir,ARTIFACTS[0]))
+    rng=np.random.default_rng(seed)
+    model.set_weights([w+rng.normal(0,noise*(w.std()or 1),w.shape).astype(w.dtype)for w in model.get_weights()])
+    model.save(os.path.join(out_dir,ARTIFACTS[0]))
+    return out_dir
+
+def run(api_dir,env,cars,rps,seconds):
+    with tempfile.TemporaryDirectory()as tmp:
+        env=dict(env,
+                 HISTORY_DB_PATH=os.path.join(tmp,'history.db'),
+                 PREDICTION_CACHE_PATH=os.path.join(tmp,'prediction_cache.db'),
+                 SHADOW_LOG_PATH=os.path.join(tmp,'shadow.db'))
+        proc,port=start_api(api_dir,env,timeout=180)
+        try:
+            result=open_loop(port,cars,rps,seconds,timeout=10)
+            status,body=http_request(f"http://127.0.0.1:{port}/shadow/stats")
+            if status==200:
+                stats=json.loads(body)
+                if stats.get('enabled'):
+                    result['shadow']={k:stats.get(k)for k in('submitted','dropped','pairs','unencodable','errors','avg_batch_size','avg_lag_ms','divergence')}
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+    return result
+
+def in_process(api_dir,candidate_dir,cars,rps,seconds,rounds,split_fraction):
+    """без HTTP и генератора нагрузки в том же процессоре:compute_prediction по расписанию
+    из одного потока,варианты чередуются по раундам,фоновый поток кандидата работает"""
+    os.environ['CANDIDATE_MODEL_DIR']=candidate_dir
+    with tempfile.TemporaryDirectory()as tmp:
+        os.environ['SHADOW_LOG_PATH']=os.path.join(tmp,'shadow.db')
+        api=load_api(api_dir,tmp)
+        requests=[api.CarRequest(**car)for car in cars]
+        variants={'primary_only':('shadow',0.0),'shadow_all':('shadow',1.0),f'split_{split_fraction}':('split',split_fraction)}
+        latencies={name:[]for name in variants}
+        per_round=int(rps*seconds/rounds/len(variants))
+        i=0
+        for _ in range(rounds):
+            for name,(mode,fraction) in variants.items():
+                api.CANDIDATE_MODE,api.CANDIDATE_FRACTION=mode,fraction
+                start=time.perf_counter()
+                for k in range(per_round):
+                    delay=start+k/rps-time.perf_counter()
+                    if delay>0:
+                        time.sleep(delay)
+                    request=requests[i%len(requests)]
+                    i+=1
+                    #как в /predict:фоновый поток видит запрос в обработке
+                    api.predict_in_flight+=1
+                    t=time.perf_counter()
+                    api.compute_prediction(request,False,32)
+                    latencies[name].append(time.perf_counter()-t)
+                    api.predict_in_flight-=1
+        time.sleep(api.SHADOW_MAX_DELAY*2)
+        report={name:_percentiles(values)for name,values in latencies.items()}
+        report['shadow']={k:v for k,v in api.get_shadow_stats().items()if k in('submitted','dropped','pairs','busy_waits','avg_batch_size','avg_lag_ms')}
+    return report
+
+def main():
+    parser=argparse.ArgumentParser(description="задержка /predict без кандидата,с теневым кандидатом и с A/B")
+    parser.add_argument('--api-dir',required=True,help="каталог с main.py и артефактами модели")
+    parser.add_argument('--candidate-dir',help="каталог версии-кандидата;по умолчанию-основная модель с шумом в весах")
+    parser.add_argument('--noise',type=float,default=0.01,help="шум весов в долях их std")
+    parser.add_argument('--rps',type=float,default=50)
+    parser.add_argument('--seconds',type=float,default=20)
+    parser.add_argument('--split-fraction',type=float,default=0.5)
+    parser.add_argument('--rounds',type=int,default=6,help="чередований вариантов в замере без HTTP")
+    parser.add_argument('--seed',type=int,default=42)
+    args=parser.parse_args()
+
+    api_dir=os.path.abspath(args.api_dir)
+    cars=make_cars(api_dir,int(args.rps*args.seconds),args.seed)
+    with tempfile.TemporaryDirectory()as tmp:
+        candidate_dir=os.path.abspath(args.candidate_dir)if args.candidate_dir else perturbed_candidate(api_dir,os.path.join(tmp,'candidate'),args.noise,args.seed)
+        configs={
+            'primary_only':{},
+            'shadow_all':{'CANDIDATE_MODEL_DIR':candidate_dir,'CANDIDATE_MODE':'shadow','CANDIDATE_FRACTION':'1'},
+            f'split_{args.split_fraction}':{'CANDIDATE_MODEL_DIR':candidate_dir,'CANDIDATE_MODE':'split','CANDIDATE_FRACTION':str(args.split_fraction)}
+        }
+        report={'rps':args.rps,'seconds':args.seconds}
+        for name,env in configs.items():
+            #тот же поток машин,у каждого прогона свой пустой кэш
+            report[name]=run(api_dir,env,cars,args.rps,args.seconds)
+        #в конце:load_api импортирует main в этот процесс
+        total=int(args.rps*args.seconds*len(configs))
+        report['in_process']=in_process(api_dir,candidate_dir,make_cars(api_dir,total,args.seed+1),args.rps,args.seconds*len(configs),args.rounds,args.split_fraction)
+
+    base=report['primary_only']['ok_latency']
+    for name in list(configs)[1:]:
+        latency=report[name]['ok_latency']
+        if base and latency:
+            report[name]['p50_change_ms']=round(latency['p50_ms']-base['p50_ms'],1)
+            report[name]['p99_change_ms']=round(latency['p99_ms']-base['p99_ms'],1)
+    print(json.dumps(report,ensure_ascii=False,indent=2))
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,95 @@
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+from api_harness import free_port,http_request
+
+def sample_car(api_dir):
+    with open(os.path.join(api_dir,'unique_values.json'),'r',encoding='utf-8')as f:
+        unique=json.load(f)
+    brand=unique['brands'][0]
+    return{
+        'brand':brand,
+        'name':unique['models'][brand][0],
+        'bodyType':unique['bodyTypes'][0],
+        'color':unique['colors'][0],
+        'fuelType':unique['fuelTypes'][0],
+        'year':int(unique['years'][len(unique['years'])//2]),
+        'power':150
+    }
+
+def measure(api_dir,car,poll_ms=100,steady=20,timeout=300):
+    """один холодный старт:python main.py в api_dir.
+    первый байт-первый ответ на GET /(есть и в старых версиях API),
+    первое предсказание-первый 200 от POST /predict"""
+    port=free_port()
+    base=f"http://127.0.0.1:{port}"
+    env=dict(os.environ,PORT=str(port))
+    start=time.perf_counter()
+    proc=subprocess.Popen([sys.executable,'main.py'],cwd=api_dir,env=env,
+                          stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL)
+    result={}
+    try:
+        while time.perf_counter()-start<timeout:
+            status,_=http_request(base+'/',timeout=1)
+            if status is not None:
+                result['time_to_first_byte']=time.perf_counter()-start
+                break
+            if proc.poll()is not None:
+                raise RuntimeError(f"сервер завершился с кодом{proc.returncode}")
+            time.sleep(poll_ms/1000)
+        else:
+            raise RuntimeError("сервер не ответил")
+
+        retries=0
+        while time.perf_counter()-start<timeout:
+            sent=time.perf_counter()
+            status,_=http_request(base+'/predict',car)
+            if status==200:
+                result['time_to_first_prediction']=time.perf_counter()-start
+                result['first_prediction_latency']=time.perf_counter()-sent
+                break
+            retries+=1
+            time.sleep(poll_ms/1000)
+        else:
+            raise RuntimeError("не дождались предсказания")
+        result['predict_retries']=retries
+
+        latencies=[]
+        for i in range(steady):
+            #другая мощность-мимо кэша предсказаний
+            sent=time.perf_counter()
+            http_request(base+'/predict',dict(car,power=car['power']+1+i))
+            latencies.append(time.perf_counter()-sent)
+        result['steady_prediction_latency']=statistics.median(latencies)
+
+        status,body=http_request(base+'/health/ready')
+        if status==200:
+            result['startup_steps']=json.loads(body).get('startup')
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+    return result
+
+def main():
+    parser=argparse.ArgumentParser(description="холодный старт API:первый байт и первое предсказание")
+    parser.add_argument('--api-dir',required=True,help="каталог с main.py и артефактами модели(рабочий каталог API)")
+    parser.add_argument('--runs',type=int,default=3)
+    parser.add_argument('--steady',type=int,default=20,help="запросов после прогрева для сравнения")
+    parser.add_argument('--poll-ms',type=int,default=100,help="пауза между попытками до первого ответа")
+    args=parser.parse_args()
+
+    car=sample_car(args.api_dir)
+    runs=[measure(os.path.abspath(args.api_dir),car,poll_ms=args.poll_ms,steady=args.steady)for _ in range(args.runs)]
+    report={'runs':len(runs)}
+    for key in['time_to_first_byte','time_to_first_prediction','first_prediction_latency','steady_prediction_latency']:
+        report[f'{key}_ms']=round(statistics.median(r[key]for r in runs)*1000,1)
+    report['startup_steps']=runs[-1].get('startup_steps')
+    print(json.dumps(report,ensure_ascii=False,indent=2))
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,88 @@
+import os
+import json
+import time
+import argparse
+import tempfile
+import pandas as pd
+from sklearn.model_selection import train_test_split
+
+from preprocessing import prepare_data,deduplicate,stratified_sample,compaction_report
+from model_training import create_and_train_model
+from incremental_training import evaluate
+
+def compact(df,price_tolerance=0.05,sample_frac=None,min_per_group=1,seed=42):
+    """схлопывание дублей и,если задано,стратифицированная подвыборка по марке/модели"""
+    start=time.perf_counter()
+    out=deduplicate(df,price_tolerance)
+    report={'deduplicate':compaction_report(df,out)}
+    if sample_frac:
+        sampled=stratified_sample(out,sample_frac,min_per_group=min_per_group,seed=seed)
+        report['sample']=compaction_report(out,sampled)
+        out=sampled
+    report['total']=compaction_report(df,out)
+    report['seconds']=round(time.perf_counter()-start,3)
+    return out,report
+
+def compare_with_full(df,epochs=50,**compact_kwargs):
+    """время и точность:обучение на всех строках против сжатого набора с весами.
+    обе модели проверяются на одних и тех же отложенных сырых объявлениях"""
+    df_train,df_eval=train_test_split(df,test_size=0.2,random_state=42)
+    df_compact,report=compact(df_train,**compact_kwargs)
+    report['eval_rows']=int(len(df_eval))
+
+    with tempfile.TemporaryDirectory()as tmp:
+        start=time.perf_counter()
+        model,scaler,encoders,info=create_and_train_model(df_train,out_dir=os.path.join(tmp,'full'),epochs=epochs)
+        report['full']={
+            'seconds':time.perf_counter()-start,
+            'train_seconds':info['metrics']['train_seconds'],
+            'train_epochs':info['metrics']['train_epochs'],
+            'eval':evaluate(model,scaler,encoders,df_eval)
+        }
+
+        start=time.perf_counter()
+        model,scaler,encoders,info=create_and_train_model(
+            df_compact,out_dir=os.path.join(tmp,'compact'),epochs=epochs,sample_weight=df_compact['weight']
+        )
+        report['compact']={
+            'seconds':time.perf_counter()-start,
+            'train_seconds':info['metrics']['train_seconds'],
+            'train_epochs':info['metrics']['train_epochs'],
+            'eval':evaluate(model,scaler,encoders,df_eval)
+        }
+
+    report['speedup']=report['full']['train_seconds']/report['compact']['train_seconds']
+    report['mae_change']=report['compact']['eval']['mae']-report['full']['eval']['mae']
+    return report
+
+def main():
+    parser=argparse.ArgumentParser(description="обучение на наборе без дублей(с весами)")
+    parser.add_argument('data',help="csv с объявлениями")
+    parser.add_argument('--out-dir',default='models')
+    parser.add_argument('--epochs',type=int,default=50)
+    parser.add_argument('--price-tolerance',type=float,default=0.05,help="относительная разница цен,при которой объявления-дубли")
+    parser.add_argument('--sample-frac',type=float,help="доля строк внутри каждой марки/модели для быстрых экспериментов")
+    parser.add_argument('--min-per-group',type=int,default=1)
+    parser.add_argument('--seed',type=int,default=42)
+    parser.add_argument('--compare-full',action='store_true',help="сравнить с обучением на всех строках")
+    args=parser.parse_args()
+
+    df,_=prepare_data(pd.read_csv(args.data))
+    compact_kwargs={
+        'price_tolerance':args.price_tolerance,
+        'sample_frac':args.sample_frac,
+        'min_per_group':args.min_per_group,
+        'seed':args.seed
+    }
+
+    if args.compare_full:
+        report=compare_with_full(df,args.epochs,**compact_kwargs)
+        print(json.dumps(report,ensure_ascii=False,indent=2))
+        return
+
+    df_compact,report=compact(df,**compact_kwargs)
+    print(json.dumps(report,ensure_ascii=False,indent=2))
+    create_and_train_model(df_compact,out_dir=args.out_dir,epochs=args.epochs,sample_weight=df_compact['weight'])
+
+if __name__=="__main__":
+    main()
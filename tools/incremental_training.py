@@ -0,0 +1,191 @@
+import os
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import train_test_split
+from tensorflow import keras
+
+from preprocessing import filter_listings,update_unique_values
+from model_training import (CATEGORICAL_COLS,NUMERICAL_COLS,load_artifacts,transform_features,
+                            fit_model,publish_version,create_and_train_model,load_drift)
+
+def extend_encoders(encoders,df):
+    """новые значения дописываются в конец classes_,старые коды не меняются"""
+    added={}
+    for col in CATEGORICAL_COLS:
+        encoder=encoders[col]
+        known=set(encoder.classes_.tolist())
+        new_values=sorted(set(df[col].astype(str))-known)
+        if new_values:
+            #LabelEncoder кодирует строки через словарь,поэтому classes_ не обязан быть отсортирован
+            encoder.classes_=np.concatenate([encoder.classes_.astype(object),np.array(new_values,dtype=object)])
+        added[col]=new_values
+    return added
+
+def update_scaler(scaler,df):
+    """обновление бегущих среднего и дисперсии новыми данными"""
+    scaler.partial_fit(df[NUMERICAL_COLS])
+    return scaler
+
+def known_rows(df,encoders):
+    """строки,все категории которых есть в словарях"""
+    mask=np.ones(len(df),dtype=bool)
+    for col in CATEGORICAL_COLS:
+        mask&=df[col].astype(str).isin(set(encoders[col].classes_.tolist())).values
+    return df[mask]
+
+def evaluate(model,scaler,encoders,df):
+    """mae/rmse в логарифме цены на сырых данных"""
+    df=known_rows(df,encoders)
+    X,y=transform_features(df,scaler,encoders)
+    pred=model.predict(X,batch_size=4096,verbose=0).ravel()
+    err=pred-y
+    return{
+        'rows':int(len(df)),
+        'mae':float(np.mean(np.abs(err))),
+        'rmse':float(np.sqrt(np.mean(err**2)))
+    }
+
+def version_metrics(test_metrics,parent_metrics,parent_version):
+    """test_*для /metrics:на отложенных строках или,без них,метрики родителя
+    с пометкой test_metrics_from-ключи ответа не меняются"""
+    if test_metrics is not None:
+        return{
+            'test_mae':test_metrics['mae'],
+            'test_rmse':test_metrics['rmse'],
+            'test_loss':test_metrics['rmse']**2
+        }
+    inherited={key:value for key,value in parent_metrics.items()if key.startswith('test_')}
+    if inherited:
+        inherited['test_metrics_from']=parent_metrics.get('test_metrics_from',parent_version or'parent')
+    return inherited
+
+def incremental_train(df_new,models_dir='models',df_eval=None,epochs=5,learning_rate=0.0001,batch_size=None,publish=True,holdout=0.2):
+    """дообучение текущей модели только на новом куске данных.
+    holdout-доля куска для test_*метрик(в словари она все равно попадает,как и
+    в unique_values.json);holdout=0-обучение на всем куске,test_*берутся у родителя"""
+    start=time.perf_counter()
+    df_vocab=df_new
+    if df_eval is None and holdout:
+        df_new,df_eval=train_test_split(df_new,test_size=holdout,random_state=42)
+
+    model,scaler,encoders,feature_info=load_artifacts(models_dir)
+    parent_version=feature_info.get('version')
+
+    added=extend_encoders(encoders,df_vocab)
+    update_scaler(scaler,df_new)
+    X,y=transform_features(df_new,scaler,encoders)
+
+    #меньший шаг обучения,чтобы не забыть старые данные
+    batch_size=batch_size or feature_info.get('params',{}).get('batch_size',32)
+    model.compile(
+        optimizer=keras.optimizers.Adam(learning_rate=learning_rate),
+        loss='mse',
+        metrics=['mae',keras.metrics.RootMeanSquaredError()]
+    )
+    #без валидационной доли:ни одна новая строка не пропадает из обучения
+    fit_model(model,X,y,batch_size=batch_size,epochs=epochs,validation_split=0)
+    seconds=time.perf_counter()-start
+
+    #ошибка на обучающем куске-всегда,на отложенных строках-если они есть
+    train_metrics=evaluate(model,scaler,encoders,df_new)
+    test_metrics=evaluate(model,scaler,encoders,df_eval)if df_eval is not None else None
+
+    #эталон дрейфа дополняется новым куском,иначе новые модели всегда будут дрейфом
+    reference=feature_info.get('drift_reference')
+    drift=load_drift()
+    if reference and drift:
+        predicted_price=np.expm1(model.predict(X,batch_size=4096,verbose=0).ravel())
+        reference=drift.merge_reference(reference,drift.build_reference(df_new,CATEGORICAL_COLS,NUMERICAL_COLS,predicted_price,like=reference))
+
+    feature_info={
+        **feature_info,
+        'drift_reference':reference,
+        'parent_version':parent_version,
+        'mode':'incremental',
+        'metrics':{
+            **version_metrics(test_metrics,feature_info.get('metrics',{}),parent_version),
+            'train_mae':train_metrics['mae'],
+            'train_rmse':train_metrics['rmse'],
+            'train_loss':train_metrics['rmse']**2,
+            'train_rows':int(len(df_new)),
+            'train_seconds':seconds
+        },
+        'added_classes':{col:len(values)for col,values in added.items()}
+    }
+
+    if publish:
+        version,feature_info=publish_version(model,scaler,encoders,feature_info,models_dir)
+        print(f"опубликована версия {version}(родитель {parent_version})")
+
+    print(f"дообучение на {len(df_new)} строках за {seconds:.1f}с,train mae:{train_metrics['mae']:.4f}"
+          +(f",test mae:{test_metrics['mae']:.4f}"if test_metrics else",test_*от родителя"))
+    return model,scaler,encoders,feature_info
+
+def compare_with_full_retrain(df_old,df_new,models_dir='models',epochs=5,full_epochs=50):
+    """время и точность:дообучение против полного переобучения на старых+новых"""
+    df_train,df_eval=train_test_split(df_new,test_size=0.2,random_state=42)
+    #контроль забывания на старых данных
+    df_old_eval=df_old.sample(n=min(len(df_old),len(df_eval)or 1),random_state=42)
+
+    report={'new_rows':int(len(df_train)),'old_rows':int(len(df_old)),'eval_rows':int(len(df_eval))}
+    with tempfile.TemporaryDirectory()as tmp:
+        inc_dir=os.path.join(tmp,'incremental')
+        full_dir=os.path.join(tmp,'full')
+        shutil.copytree(models_dir,inc_dir)
+
+        start=time.perf_counter()
+        model,scaler,encoders,_=incremental_train(df_train,inc_dir,df_eval=df_eval,epochs=epochs,publish=False)
+        report['incremental']={
+            'seconds':time.perf_counter()-start,
+            'new':evaluate(model,scaler,encoders,df_eval),
+            'old':evaluate(model,scaler,encoders,df_old_eval)
+        }
+
+        start=time.perf_counter()
+        model,scaler,encoders,_=create_and_train_model(pd.concat([df_old,df_train]),out_dir=full_dir,epochs=full_epochs)
+        report['full']={
+            'seconds':time.perf_counter()-start,
+            'new':evaluate(model,scaler,encoders,df_eval),
+            'old':evaluate(model,scaler,encoders,df_old_eval)
+        }
+
+    report['speedup']=report['full']['seconds']/report['incremental']['seconds']
+    return report
+
+def main():
+    parser=argparse.ArgumentParser(description="дообучение модели на новых объявлениях")
+    parser.add_argument('data',help="csv с новыми объявлениями")
+    parser.add_argument('--models-dir',default='models')
+    parser.add_argument('--epochs',type=int,default=5)
+    parser.add_argument('--learning-rate',type=float,default=0.0001)
+    parser.add_argument('--compare-full',metavar='OLD_CSV',help="сравнить с полным переобучением на старых+новых данных")
+    parser.add_argument('--full-epochs',type=int,default=50)
+    parser.add_argument('--holdout',type=float,default=0.2,help="доля новых строк только для test_*метрик;0-все строки в обучение,test_*от родителя")
+    parser.add_argument('--no-publish',action='store_true')
+    args=parser.parse_args()
+
+    df_new=filter_listings(pd.read_csv(args.data))
+
+    if args.compare_full:
+        df_old=filter_listings(pd.read_csv(args.compare_full))
+        report=compare_with_full_retrain(df_old,df_new,args.models_dir,args.epochs,args.full_epochs)
+        print(json.dumps(report,ensure_ascii=False,indent=2))
+        return
+
+    incremental_train(
+        df_new,args.models_dir,
+        epochs=args.epochs,
+        learning_rate=args.learning_rate,
+        publish=not args.no_publish,
+        holdout=args.holdout
+    )
+    if not args.no_publish:
+        update_unique_values(df_new)
+
+if __name__=="__main__":
+    main()
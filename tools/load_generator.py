@@ -0,0 +1,319 @@
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import asyncio
+import argparse
+import tempfile
+from collections import Counter
+from urllib.parse import quote
+
+import httpx
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','api'))
+from history_store import CATEGORY_COLUMNS,ROW_FIELDS,HistoryStore
+
+from api_harness import API_DIR,load_api,start_api
+
+#границы корзин гистограммы задержек(мс):4 корзины на удвоение,от 0.5 мс до ~65 с
+HISTOGRAM_EDGES_MS=[round(0.5*2**(k/4),3)for k in range(69)]
+
+def history_cars(db_path,limit=None):
+    """записанные запросы истории по возрастанию времени:[(unix-время,машина)].
+    новая схема читается через HistoryStore(read_only),старая таблица predictions-
+    напрямую;оба соединения только для чтения,файл истории не меняется"""
+    conn=sqlite3.connect(f"file:{quote(os.path.abspath(db_path))}?mode=ro",uri=True)
+    tables={name for(name,)in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    out=[]
+    if'history_partitions'in tables:
+        conn.close()
+        store=HistoryStore(db_path,read_only=True)
+        conn=store.connect()
+        for batch in store.iter_batches(conn.cursor()):
+            for row in batch:
+                values=dict(zip(ROW_FIELDS,row))
+                car={field:values[col]for col,field in CATEGORY_COLUMNS.items()}
+                car.update(year=values['year'],power=values['power'])
+                out.append((values['id']/1_000_000,car))
+            if limit and len(out)>=limit:
+                break
+    elif'predictions'in tables:
+        query='SELECT timestamp,brand,model,year,power,body_type,color,fuel_type FROM predictions ORDER BY timestamp'
+        for timestamp,brand,model,year,power,body_type,color,fuel_type in conn.execute(query):
+            try:
+                t=time.mktime(time.strptime(timestamp[:19],'%Y-%m-%dT%H:%M:%S'))
+            except(TypeError,ValueError):
+                t=None
+            out.append((t,{'brand':brand,'name':model,'bodyType':body_type,'color':color,
+                           'fuelType':fuel_type,'year':year,'power':power}))
+            if limit and len(out)>=limit:
+                break
+    conn.close()
+    #неполные записи в запрос не превратить
+    return[(t,car)for t,car in out[:limit]if all(v is not None for v in car.values())]
+
+def synthetic_cars(unique_path,n,seed):
+    """машины по словарям unique_values.json:модель из моделей марки,год из известных лет,
+    мощность-в диапазоне min_power..max_power"""
+    with open(unique_path,'r',encoding='utf-8')as f:
+        unique=json.load(f)
+    rng=random.Random(seed)
+    low,high=int(unique.get('min_power')or 60),int(unique.get('max_power')or 400)
+    cars=[]
+    for _ in range(n):
+        brand=rng.choice(unique['brands'])
+        cars.append((None,{
+            'brand':brand,
+            'name':rng.choice(unique['models'].get(brand)or['-']),
+            'bodyType':rng.choice(unique['bodyTypes']),
+            'color':rng.choice(unique['colors']),
+            'fuelType':rng.choice(unique['fuelTypes']),
+            'year':int(rng.choice(unique['years'])),
+            'power':rng.randint(low,high)
+        }))
+    return cars
+
+def replay_offsets(records,speed):
+    """смещения отправки по записанным интервалам,ускоренные в speed раз"""
+    times=[t for t,_ in records]
+    if len(times)<2 or any(t is None for t in times):
+        raise ValueError("в записях нет времени для воспроизведения интервалов")
+    return[(t-times[0])/speed for t in times]
+
+def _percentiles(values):
+    if not values:
+        return None
+    values=sorted(values)
+    pick=lambda q:round(values[min(int(len(values)*q),len(values)-1)]*1000,2)
+    return{'p50_ms':pick(0.5),'p90_ms':pick(0.9),'p95_ms':pick(0.95),'p99_ms':pick(0.99),
+           'max_ms':round(values[-1]*1000,2),'mean_ms':round(sum(values)/len(values)*1000,2)}
+
+class Recorder:
+    """результаты запросов:гистограмма задержек,статусы и ошибки,посекундная лента"""
+    def __init__(self):
+        self.start=time.perf_counter()
+        self.latencies=[]
+        self.histogram=[0]*(len(HISTOGRAM_EDGES_MS)+1)
+        self.outcomes=Counter()
+        self.degraded=Counter()
+        self.timeline={}
+        self.max_lag=0.0
+
+    def sent(self,lag=0.0):
+        second=int(time.perf_counter()-self.start)
+        self.timeline.setdefault(second,{'sent':0,'ok':0,'errors':0,'latencies':[]})['sent']+=1
+        self.max_lag=max(self.max_lag,lag)
+
+    def done(self,outcome,latency,degraded=None):
+        self.outcomes[outcome]+=1
+        if degraded:
+            self.degraded[degraded]+=1
+        #лента по времени завершения
+        second=int(time.perf_counter()-self.start)
+        bucket=self.timeline.setdefault(second,{'sent':0,'ok':0,'errors':0,'latencies':[]})
+        if outcome=='200':
+            self.latencies.append(latency)
+            bucket['ok']+=1
+            bucket['latencies'].append(latency)
+            ms=latency*1000
+            lo,hi=0,len(HISTOGRAM_EDGES_MS)
+            while lo<hi:
+                mid=(lo+hi)//2
+                if ms<=HISTOGRAM_EDGES_MS[mid]:
+                    hi=mid
+                else:
+                    lo=mid+1
+            self.histogram[lo]+=1
+        else:
+            bucket['errors']+=1
+
+    def report(self,elapsed):
+        total=sum(self.outcomes.values())
+        ok=self.outcomes.get('200',0)
+        histogram=[{'le_ms':edge,'count':count}for edge,count in zip(HISTOGRAM_EDGES_MS,self.histogram)if count]
+        if self.histogram[-1]:
+            histogram.append({'le_ms':None,'count':self.histogram[-1]})
+        timeline=[]
+        for second in range(max(self.timeline,default=-1)+1):
+            bucket=self.timeline.get(second,{'sent':0,'ok':0,'errors':0,'latencies':[]})
+            p=_percentiles(bucket['latencies'])
+            timeline.append({'second':second,'sent':bucket['sent'],'ok':bucket['ok'],'errors':bucket['errors'],
+                             'p50_ms':p and p['p50_ms'],'p99_ms':p and p['p99_ms']})
+        return{
+            'elapsed_s':round(elapsed,3),
+            'completed':total,
+            'ok':ok,
+            'errors':total-ok,
+            'error_rate':round((total-ok)/total,4)if total else 0.0,
+            'throughput_rps':round(ok/elapsed,2)if elapsed else 0.0,
+            'outcomes':dict(self.outcomes),
+            'degraded':dict(self.degraded),
+            #генератор не успевал за расписанием-задержки занижены
+            'max_schedule_lag_ms':round(self.max_lag*1000,2),
+            'latency':_percentiles(self.latencies),
+            'histogram':histogram,
+            'timeline':timeline
+        }
+
+async def send(client,path,car,recorder,timeout):
+    start=time.perf_counter()
+    try:
+        resp=await client.post(path,json=car,timeout=timeout)
+    except httpx.TimeoutException:
+        recorder.done('timeout',time.perf_counter()-start)
+        return
+    except httpx.HTTPError as e:
+        recorder.done(type(e).__name__,time.perf_counter()-start)
+        return
+    latency=time.perf_counter()-start
+    degraded=None
+    if resp.status_code==200:
+        try:
+            degraded=resp.json().get('degraded')
+        except ValueError:
+            pass
+    recorder.done(str(resp.status_code),latency,degraded)
+
+async def open_loop(client,path,cars,offsets,recorder,timeout):
+    """открытый цикл:i-й запрос уходит в offsets[i]секунд от старта,не дожидаясь ответов"""
+    tasks=[]
+    start=time.perf_counter()
+    for i,offset in enumerate(offsets):
+        delay=start+offset-time.perf_counter()
+        if delay>0:
+            await asyncio.sleep(delay)
+        recorder.sent(max(-delay,0.0))
+        tasks.append(asyncio.create_task(send(client,path,cars[i%len(cars)],recorder,timeout)))
+    await asyncio.gather(*tasks)
+
+async def closed_loop(client,path,cars,concurrency,total,deadline,recorder,timeout):
+    """замкнутый цикл:concurrency клиентов шлют запросы друг за другом"""
+    counter=iter(range(total))if total else None
+    n=0
+
+    async def worker():
+        nonlocal n
+        while time.perf_counter()<deadline:
+            if counter is not None and next(counter,None)is None:
+                return
+            car=cars[n%len(cars)]
+            n+=1
+            recorder.sent()
+            await send(client,path,car,recorder,timeout)
+
+    await asyncio.gather(*[worker()for _ in range(concurrency)])
+
+async def drive(client,args,cars):
+    recorder=Recorder()
+    if args.concurrency:
+        deadline=recorder.start+args.duration if args.duration else float('inf')
+        await closed_loop(client,args.path,cars,args.concurrency,args.requests,deadline,recorder,args.timeout)
+    else:
+        if args.speed:
+            offsets=replay_offsets(cars,args.speed)
+        else:
+            count=args.requests or int(args.rps*args.duration)
+            offsets=[i/args.rps for i in range(count)]
+        if args.duration:
+            offsets=[t for t in offsets if t<args.duration]
+        await open_loop(client,args.path,[car for _,car in cars],offsets,recorder,args.timeout)
+    report=recorder.report(time.perf_counter()-recorder.start)
+    #состояние очереди и отказов сервера после прогона,если API их отдает
+    try:
+        resp=await client.get('/admission/stats',timeout=args.timeout)
+        if resp.status_code==200:
+            report['server_admission']=resp.json()
+    except httpx.HTTPError:
+        pass
+    return report
+
+def load_cars(args,api_dir):
+    if args.source=='history':
+        cars=history_cars(args.history_db or os.path.join(api_dir,'history.db'),args.requests)
+        if not cars:
+            raise SystemExit("в истории нет записей:используйте --source synthetic")
+        return cars
+    n=args.requests or max(int((args.rps or 100)*(args.duration or 30)),1000)
+    return synthetic_cars(args.unique_values or os.path.join(api_dir,'unique_values.json'),n,args.seed)
+
+def run(args):
+    api_dir=os.path.abspath(args.api_dir)
+    cars=load_cars(args,api_dir)
+    if args.concurrency:
+        cars=[car for _,car in cars]
+    config={k:v for k,v in vars(args).items()if v is not None}
+    config['records']=len(cars)
+
+    proc=None
+    with tempfile.TemporaryDirectory()as tmp:
+        if args.in_process:
+            #main в этом процессе:ASGI без сети,история и кэш во временном каталоге
+            api=load_api(api_dir,tmp)
+            transport=httpx.ASGITransport(app=api.app)
+            base_url='http://load-generator'
+        elif args.url:
+            transport=None
+            base_url=args.url.rstrip('/')
+        else:
+            env=dict(os.environ,
+                     HISTORY_DB_PATH=os.path.join(tmp,'history.db'),
+                     PREDICTION_CACHE_PATH=os.path.join(tmp,'prediction_cache.db'))
+            proc,port=start_api(api_dir,env)
+            transport=None
+            base_url=f"http://127.0.0.1:{port}"
+        try:
+            limits=httpx.Limits(max_connections=args.max_connections,max_keepalive_connections=args.max_connections)
+            async def main_async():
+                async with httpx.AsyncClient(base_url=base_url,transport=transport,limits=limits)as client:
+                    return await drive(client,args,cars)
+            report=asyncio.run(main_async())
+        finally:
+            if proc is not None:
+                proc.terminate()
+                proc.wait(timeout=30)
+    report['config']=config
+    return report
+
+def main():
+    parser=argparse.ArgumentParser(description="нагрузка на API:повтор истории или синтетические запросы,отчет в JSON")
+    target=parser.add_mutually_exclusive_group()
+    target.add_argument('--url',help="адрес запущенного API(http://127.0.0.1:8000);по умолчанию API запускается из --api-dir на свободном порту")
+    target.add_argument('--in-process',action='store_true',help="API в этом процессе через ASGI,без сети")
+    parser.add_argument('--api-dir',default=API_DIR,help="каталог с main.py и артефактами модели")
+    parser.add_argument('--path',default='/predict')
+    parser.add_argument('--source',choices=['synthetic','history'],default='synthetic')
+    parser.add_argument('--history-db',help="файл истории;по умолчанию history.db в --api-dir")
+    parser.add_argument('--unique-values',help="словари для синтетики;по умолчанию unique_values.json в --api-dir")
+    load=parser.add_mutually_exclusive_group()
+    load.add_argument('--rps',type=float,help="открытый цикл:запросов в секунду")
+    load.add_argument('--concurrency',type=int,help="замкнутый цикл:одновременных клиентов")
+    load.add_argument('--speed',type=float,help="открытый цикл по записанным интервалам истории,ускорение в speed раз")
+    parser.add_argument('--duration',type=float,help="секунд нагрузки")
+    parser.add_argument('--requests',type=int,help="всего запросов;с --speed-первые N записей истории")
+    parser.add_argument('--timeout',type=float,default=10,help="таймаут запроса,с(как у Gradio)")
+    parser.add_argument('--max-connections',type=int,default=256)
+    parser.add_argument('--seed',type=int,default=42)
+    parser.add_argument('--out',help="файл JSON-отчета;по умолчанию вывод в stdout")
+    args=parser.parse_args()
+
+    if not(args.rps or args.concurrency or args.speed):
+        args.rps=20
+    if args.speed and args.source!='history':
+        parser.error("--speed воспроизводит интервалы истории:нужен --source history")
+    if not(args.duration or args.requests):
+        args.duration=30
+
+    out=os.path.abspath(args.out)if args.out else None
+    report=run(args)
+    text=json.dumps(report,ensure_ascii=False,indent=2)
+    if out:
+        with open(out,'w',encoding='utf-8')as f:
+            f.write(text)
+        print(json.dumps({k:report[k]for k in('completed','error_rate','throughput_rps','latency')},ensure_ascii=False))
+    else:
+        print(text)
+
+if __name__=="__main__":
+    main()
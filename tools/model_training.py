@@ -1,103 +1,243 @@
+import os
 import pickle
 import json
+import time
 import numpy as np
+import pandas as pd
+import importlib.util
+from datetime import datetime
 from sklearn.preprocessing import LabelEncoder,StandardScaler
 from sklearn.model_selection import train_test_split
 from tensorflow import keras
 from tensorflow.keras import layers,callbacks
 
-def create_and_train_model(df):
-    """обучение модели"""
-    #категориальные и числовые признаки
-    categorical_cols=['brand','name','bodyType','color','fuelType']
-    numerical_cols=['year','power']
-    
+CATEGORICAL_COLS=['brand','name','bodyType','color','fuelType']
+NUMERICAL_COLS=['year','power']
+
+#скетчи дрейфа общие с api:эталон строится тем же кодом,что и живые скетчи
+DRIFT_MODULE_PATH=os.environ.get('DRIFT_MODULE_PATH',os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','api','drift.py'))
+_drift=[]
+
+#архитектура по умолчанию
+DEFAULT_PARAMS={
+    'units':(128,64,32),
+    'dropout':(0.3,0.2),
+    'learning_rate':0.001,
+    'batch_size':32
+}
+
+def load_drift():
+    """модуль скетчей дрейфа(api/drift.py или DRIFT_MODULE_PATH)загружается при первом
+    обучении,а не при импорте и без правки sys.path;без него эталон не строится-
+    API тогда сравнивает с эталоном из unique_values.json"""
+    if not _drift:
+        module=None
+        if os.path.exists(DRIFT_MODULE_PATH):
+            spec=importlib.util.spec_from_file_location('drift_sketches',DRIFT_MODULE_PATH)
+            module=importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+        else:
+            print(f"нет{DRIFT_MODULE_PATH}:модель без эталона дрейфа")
+        _drift.append(module)
+    return _drift[0]
+
+def encode_features(df):
+    """кодирование признаков и целевой переменной"""
     #кодирование категориальных признаков
     encoders={}
     encoded_features=[]
-    
-    for col in categorical_cols:
+
+    for col in CATEGORICAL_COLS:
         le=LabelEncoder()
         encoded=le.fit_transform(df[col])
         encoded_features.append(encoded.reshape(-1,1))
         encoders[col]=le
-    
+
     #масштабирование числовых
     scaler=StandardScaler()
-    scaled_numerical=scaler.fit_transform(df[numerical_cols])
-    
+    scaled_numerical=scaler.fit_transform(df[NUMERICAL_COLS])
+
     #объединяем фичи
     X_categorical=np.hstack(encoded_features)
     X_numerical=scaled_numerical
     X=np.hstack([X_numerical,X_categorical])
-    
+
     #целевая переменная
     y=np.log1p(df['price'].values)
-    
-    #разделение
-    X_train,X_test,y_train,y_test=train_test_split(
-        X,y,test_size=0.2,random_state=42
-    )
-    
-    #создание модели
-    input_dim=X_train.shape[1]
-    model=keras.Sequential([
-        layers.Dense(128,activation='relu',input_dim=input_dim),
-        layers.Dropout(0.3),
-        layers.Dense(64,activation='relu'),
-        layers.Dropout(0.2),
-        layers.Dense(32,activation='relu'),
-        layers.Dense(1)
-    ])
-    
+    return X,y,scaler,encoders
+
+def transform_features(df,scaler,encoders):
+    """кодирование новых данных уже обученными артефактами"""
+    encoded_features=[encoders[col].transform(df[col].astype(str).values.astype(object)).reshape(-1,1)for col in CATEGORICAL_COLS]
+    X=np.hstack([scaler.transform(df[NUMERICAL_COLS]),np.hstack(encoded_features)])
+    y=np.log1p(df['price'].values)if'price'in df else None
+    return X,y
+
+def feature_baseline(df,sample_weight=None):
+    """базовая точка для объяснений:самые частые категории и средние числовых признаков
+    (с весами-если строки после схлопывания дублей)"""
+    if sample_weight is None:
+        baseline={col:str(df[col].mode().iloc[0])for col in CATEGORICAL_COLS}
+        baseline.update({col:float(df[col].mean())for col in NUMERICAL_COLS})
+        return baseline
+    weight=pd.Series(np.asarray(sample_weight,dtype=np.float64),index=df.index)
+    baseline={col:str(weight.groupby(df[col].astype(str)).sum().idxmax())for col in CATEGORICAL_COLS}
+    baseline.update({col:float(np.average(df[col],weights=weight))for col in NUMERICAL_COLS})
+    return baseline
+
+def build_model(input_dim,units=(128,64,32),dropout=(0.3,0.2),learning_rate=0.001):
+    """создание модели,dropout идет после первых слоев"""
+    model=keras.Sequential()
+    model.add(keras.Input(shape=(input_dim,)))
+    for i,width in enumerate(units):
+        model.add(layers.Dense(width,activation='relu'))
+        if i<len(dropout)and dropout[i]>0:
+            model.add(layers.Dropout(dropout[i]))
+    model.add(layers.Dense(1))
+
     model.compile(
-        optimizer='adam',
+        optimizer=keras.optimizers.Adam(learning_rate=learning_rate),
         loss='mse',
         metrics=['mae',keras.metrics.RootMeanSquaredError()]
     )
-    
-    #обучение
+    return model
+
+def fit_model(model,X_train,y_train,batch_size=32,epochs=50,validation_data=None,verbose=1,sample_weight=None,validation_split=0.2):
+    """обучение с ранней остановкой;sample_weight-вес строки(число схлопнутых объявлений).
+    validation_split=0 без validation_data-все строки в обучение,фиксированное число эпох"""
+    if validation_data is not None:
+        fit_kwargs={'validation_data':validation_data}
+    elif validation_split:
+        fit_kwargs={'validation_split':validation_split}
+    else:
+        fit_kwargs={}
     early_stopping=callbacks.EarlyStopping(
         monitor='val_loss',
         patience=10,
         restore_best_weights=True
     )
-    
-    history=model.fit(
+    return model.fit(
         X_train,y_train,
-        validation_split=0.2,
-        epochs=50,
-        batch_size=32,
-        callbacks=[early_stopping],
-        verbose=1
+        epochs=epochs,
+        batch_size=batch_size,
+        callbacks=[early_stopping]if fit_kwargs else[],
+        verbose=verbose,
+        sample_weight=sample_weight,
+        **fit_kwargs
     )
-    
-    #оценка
-    test_loss,test_mae,test_rmse=model.evaluate(X_test,y_test,verbose=0)
-    
-    #сохранение модели
-    model.save('models/car_price_model.keras')
-    
-    with open('models/scaler.pkl','wb')as f:
+
+def save_artifacts(model,scaler,encoders,feature_info,out_dir='models'):
+    """сохранение модели и артефактов в формате models/"""
+    os.makedirs(out_dir,exist_ok=True)
+    model.save(os.path.join(out_dir,'car_price_model.keras'))
+
+    with open(os.path.join(out_dir,'scaler.pkl'),'wb')as f:
         pickle.dump(scaler,f)
-    
-    with open('models/encoders.pkl','wb')as f:
+
+    with open(os.path.join(out_dir,'encoders.pkl'),'wb')as f:
         pickle.dump(encoders,f)
-    
+
+    with open(os.path.join(out_dir,'feature_info.pkl'),'wb')as f:
+        pickle.dump(feature_info,f)
+
+def load_artifacts(model_dir='models'):
+    """загрузка модели и артефактов из формата models/"""
+    model=keras.models.load_model(os.path.join(model_dir,'car_price_model.keras'))
+
+    with open(os.path.join(model_dir,'scaler.pkl'),'rb')as f:
+        scaler=pickle.load(f)
+
+    with open(os.path.join(model_dir,'encoders.pkl'),'rb')as f:
+        encoders=pickle.load(f)
+
+    with open(os.path.join(model_dir,'feature_info.pkl'),'rb')as f:
+        feature_info=pickle.load(f)
+
+    return model,scaler,encoders,feature_info
+
+def publish_version(model,scaler,encoders,feature_info,models_dir='models'):
+    """сохранение версии в models/versions/vNNNN и обновление текущих артефактов"""
+    versions_dir=os.path.join(models_dir,'versions')
+    index_path=os.path.join(versions_dir,'index.json')
+    os.makedirs(versions_dir,exist_ok=True)
+
+    index=[]
+    if os.path.exists(index_path):
+        with open(index_path,'r',encoding='utf-8')as f:
+            index=json.load(f)
+
+    version=f"v{len(index)+1:04d}"
+    feature_info={**feature_info,'version':version}
+    save_artifacts(model,scaler,encoders,feature_info,os.path.join(versions_dir,version))
+    save_artifacts(model,scaler,encoders,feature_info,models_dir)
+
+    index.append({
+        'version':version,
+        'parent_version':feature_info.get('parent_version'),
+        'mode':feature_info.get('mode','full'),
+        'created':datetime.now().isoformat(),
+        'metrics':feature_info.get('metrics',{}),
+        'vocab_sizes':{col:len(encoders[col].classes_)for col in CATEGORICAL_COLS}
+    })
+    with open(index_path,'w',encoding='utf-8')as f:
+        json.dump(index,f,ensure_ascii=False,indent=2)
+
+    return version,feature_info
+
+def create_and_train_model(df,params=None,out_dir='models',epochs=50,sample_weight=None):
+    """обучение модели;sample_weight-веса строк,например df['weight']после deduplicate"""
+    params={**DEFAULT_PARAMS,**(params or{})}
+    X,y,scaler,encoders=encode_features(df)
+    weights=np.ones(len(df))if sample_weight is None else np.asarray(sample_weight,dtype=np.float64)
+
+    #разделение(лишний массив не меняет перестановку)
+    X_train,X_test,y_train,y_test,w_train,w_test=train_test_split(
+        X,y,weights,test_size=0.2,random_state=42
+    )
+    if sample_weight is None:
+        w_train=w_test=None
+
+    #создание модели
+    input_dim=X_train.shape[1]
+    model=build_model(
+        input_dim,
+        units=params['units'],
+        dropout=params['dropout'],
+        learning_rate=params['learning_rate']
+    )
+
+    #обучение
+    start=time.perf_counter()
+    history=fit_model(model,X_train,y_train,batch_size=params['batch_size'],epochs=epochs,sample_weight=w_train)
+    train_seconds=time.perf_counter()-start
+
+    #оценка
+    test_loss,test_mae,test_rmse=model.evaluate(X_test,y_test,sample_weight=w_test,verbose=0)
+
+    #эталон для монитора дрейфа:признаки и прогнозы модели на всех данных
+    drift=load_drift()
+    predicted_price=np.expm1(model.predict(X,batch_size=4096,verbose=0).ravel())if drift else None
+
     #информация о фичах
     feature_info={
-        'categorical_cols':categorical_cols,
-        'numerical_cols':numerical_cols,
+        'categorical_cols':CATEGORICAL_COLS,
+        'numerical_cols':NUMERICAL_COLS,
         'input_dim':input_dim,
+        'params':{k:list(v)if isinstance(v,tuple)else v for k,v in params.items()},
+        'baseline':feature_baseline(df,sample_weight),
+        'drift_reference':drift.build_reference(df,CATEGORICAL_COLS,NUMERICAL_COLS,predicted_price,sample_weight)if drift else None,
         'metrics':{
             'test_mae':float(test_mae),
             'test_rmse':float(test_rmse),
-            'test_loss':float(test_loss)
+            'test_loss':float(test_loss),
+            'train_rows':int(len(X_train)),
+            'train_seconds':train_seconds,
+            'train_epochs':len(history.history['loss'])
         }
     }
-    
-    with open('models/feature_info.pkl','wb')as f:
-        pickle.dump(feature_info,f)
-    
+
+    #сохранение модели
+    save_artifacts(model,scaler,encoders,feature_info,out_dir)
+
     print(f"модель обучена,mae:{test_mae:.4f}")
-    return model,scaler,encoders,feature_info
\ No newline at end of file
+    return model,scaler,encoders,feature_info
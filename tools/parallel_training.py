@@ -0,0 +1,252 @@
+import os
+import json
+import time
+import argparse
+import itertools
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor,as_completed
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import KFold,ShuffleSplit
+
+from preprocessing import prepare_data
+from model_training import encode_features,build_model,fit_model,create_and_train_model
+
+#состояние процесса-воркера,заполняется в _init_worker
+_worker={}
+
+def build_grid(units,dropout,learning_rates,batch_sizes):
+    """декартово произведение гиперпараметров"""
+    grid=[]
+    for u,d,lr,bs in itertools.product(units,dropout,learning_rates,batch_sizes):
+        grid.append({'units':tuple(u),'dropout':tuple(d),'learning_rate':float(lr),'batch_size':int(bs)})
+    return grid
+
+def make_splits(n_rows,folds,seed=42):
+    """индексы train/val:k-fold или одно разбиение 80/20"""
+    idx=np.arange(n_rows)
+    if folds>=2:
+        return list(KFold(n_splits=folds,shuffle=True,random_state=seed).split(idx))
+    return list(ShuffleSplit(n_splits=1,test_size=0.2,random_state=seed).split(idx))
+
+def _share_array(arr):
+    """копия массива в shared memory,воркеры подключаются по имени"""
+    shm=shared_memory.SharedMemory(create=True,size=arr.nbytes)
+    view=np.ndarray(arr.shape,dtype=arr.dtype,buffer=shm.buf)
+    view[:]=arr
+    return shm,{'name':shm.name,'shape':arr.shape,'dtype':arr.dtype.str}
+
+def _attach(spec):
+    shm=shared_memory.SharedMemory(name=spec['name'])
+    return shm,np.ndarray(spec['shape'],dtype=np.dtype(spec['dtype']),buffer=shm.buf)
+
+def _init_worker(x_spec,y_spec,folds,seed,threads):
+    """подключение к общим массивам и ограничение потоков cpu"""
+    os.environ['OMP_NUM_THREADS']=str(threads)
+    os.environ['TF_NUM_INTRAOP_THREADS']=str(threads)
+    os.environ['TF_NUM_INTEROP_THREADS']='1'
+    import tensorflow as tf
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+    except RuntimeError:
+        #рантайм уже инициализирован(последовательный режим в главном процессе)
+        pass
+
+    x_shm,X=_attach(x_spec)
+    y_shm,y=_attach(y_spec)
+    #ссылки на shm держим,иначе буфер освободится
+    _worker.update(x_shm=x_shm,y_shm=y_shm,X=X,y=y,splits=make_splits(len(X),folds,seed),folds={})
+
+def _fold_data(fold):
+    """train/val фолда копируются из общей памяти один раз на воркер,
+    а не выборкой X[idx]в каждой задаче"""
+    if fold not in _worker['folds']:
+        X,y=_worker['X'],_worker['y']
+        train_idx,val_idx=_worker['splits'][fold]
+        _worker['folds'][fold]=(X[train_idx],y[train_idx],X[val_idx],y[val_idx])
+    return _worker['folds'][fold]
+
+def _run_job(job_id,params,fold,epochs):
+    """обучение одной конфигурации на одном фолде"""
+    X_train,y_train,X_val,y_val=_fold_data(fold)
+
+    start=time.perf_counter()
+    model=build_model(
+        X_train.shape[1],
+        units=params['units'],
+        dropout=params['dropout'],
+        learning_rate=params['learning_rate']
+    )
+    history=fit_model(
+        model,X_train,y_train,
+        batch_size=params['batch_size'],
+        epochs=epochs,
+        validation_data=(X_val,y_val),
+        verbose=0
+    )
+    val_loss,val_mae,val_rmse=model.evaluate(X_val,y_val,verbose=0)
+
+    return{
+        'job_id':job_id,
+        'params':params,
+        'fold':fold,
+        'val_mae':float(val_mae),
+        'val_rmse':float(val_rmse),
+        'val_loss':float(val_loss),
+        'epochs':len(history.history['loss']),
+        'seconds':time.perf_counter()-start,
+        'pid':os.getpid()
+    }
+
+def summarize(results):
+    """средние метрики по фолдам для каждой конфигурации"""
+    by_config={}
+    for r in results:
+        key=json.dumps(r['params'],sort_keys=True)
+        by_config.setdefault(key,[]).append(r)
+
+    summary=[]
+    for key,runs in by_config.items():
+        summary.append({
+            'params':runs[0]['params'],
+            'folds':len(runs),
+            'val_mae':float(np.mean([r['val_mae']for r in runs])),
+            'val_mae_std':float(np.std([r['val_mae']for r in runs])),
+            'val_rmse':float(np.mean([r['val_rmse']for r in runs]))
+        })
+    return sorted(summary,key=lambda s:s['val_mae'])
+
+def _run_sequential(jobs,x_spec,y_spec,folds,seed,epochs,log=True):
+    """те же задачи в главном процессе со всеми потоками cpu"""
+    _init_worker(x_spec,y_spec,folds,seed,os.cpu_count()or 1)
+    results=[]
+    try:
+        for job_id,params,fold in jobs:
+            results.append(_run_job(job_id,params,fold,epochs))
+            if log:
+                _log_job(results,len(jobs))
+    finally:
+        _worker.clear()
+    return results
+
+def _log_job(results,total):
+    r=results[-1]
+    print(f"[{len(results)}/{total}]fold={r['fold']} mae={r['val_mae']:.4f} {r['seconds']:.1f}с {r['params']}")
+
+def run_search(X,y,grid,folds=5,epochs=50,workers=None,threads_per_worker=None,seed=42,compare_sequential=True):
+    """параллельный перебор сетки и k-fold по процессам.
+    маленькая сеть плохо делится по потокам,поэтому по умолчанию процесс на ядро
+    с одним потоком;ускорение замеряется тем же набором задач последовательно"""
+    n_folds=folds if folds>=2 else 1
+    jobs=[(i,params,fold)for i,(params,fold)in enumerate(itertools.product(grid,range(n_folds)))]
+    cpus=os.cpu_count()or 1
+    workers=min(workers or cpus,len(jobs))
+    threads=threads_per_worker or max(1,cpus//workers)
+
+    x_shm,x_spec=_share_array(np.ascontiguousarray(X,dtype=np.float32))
+    y_shm,y_spec=_share_array(np.ascontiguousarray(y,dtype=np.float32))
+    try:
+        print(f"задач:{len(jobs)},процессов:{workers},потоков на процесс:{threads}")
+        start=time.perf_counter()
+        if workers==1:
+            #один процесс:пул только добавил бы запуск tensorflow
+            results=_run_sequential(jobs,x_spec,y_spec,folds,seed,epochs)
+        else:
+            results=[]
+            #spawn:форк процесса с уже инициализированным tensorflow небезопасен;
+            #задачи по фолдам подряд,чтобы воркер переиспользовал свою копию фолда
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=mp.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(x_spec,y_spec,folds,seed,threads)
+            )as pool:
+                ordered=sorted(jobs,key=lambda job:job[2])
+                futures=[pool.submit(_run_job,job_id,params,fold,epochs)for job_id,params,fold in ordered]
+                for future in as_completed(futures):
+                    results.append(future.result())
+                    _log_job(results,len(jobs))
+        parallel_wall=time.perf_counter()-start
+
+        timing={
+            'parallel_wall_seconds':parallel_wall,
+            'sum_job_seconds':float(sum(r['seconds']for r in results)),
+            'workers':workers,
+            'threads_per_worker':threads
+        }
+        #доля времени воркеров,занятая задачами-не ускорение:задачи в параллели
+        #идут медленнее,чем поодиночке.ускорение-только замер(--compare-sequential)
+        timing['worker_utilization']=timing['sum_job_seconds']/(parallel_wall*workers)
+
+        if workers==1:
+            #это и был последовательный прогон
+            timing['sequential_wall_seconds']=parallel_wall
+            timing['speedup']=1.0
+        elif compare_sequential:
+            print("последовательный прогон тех же задач для замера ускорения")
+            start=time.perf_counter()
+            _run_sequential(jobs,x_spec,y_spec,folds,seed,epochs,log=False)
+            timing['sequential_wall_seconds']=time.perf_counter()-start
+            timing['speedup']=timing['sequential_wall_seconds']/parallel_wall
+    finally:
+        x_shm.close()
+        x_shm.unlink()
+        y_shm.close()
+        y_shm.unlink()
+
+    return summarize(results),results,timing
+
+def _parse_list(value,cast):
+    """'128,64,32;256,128' ->[(128,64,32),(256,128)]"""
+    return[tuple(cast(v)for v in group.split(',')if v)for group in value.split(';')]
+
+def main():
+    parser=argparse.ArgumentParser(description="параллельный подбор гиперпараметров и k-fold")
+    parser.add_argument('data',help="csv с объявлениями")
+    parser.add_argument('--folds',type=int,default=5,help="число фолдов,1-одно разбиение 80/20")
+    parser.add_argument('--units',default='128,64,32',help="ширины слоев,варианты через ';'")
+    parser.add_argument('--dropout',default='0.3,0.2',help="dropout по слоям,варианты через ';'")
+    parser.add_argument('--learning-rate',default='0.001',help="через запятую")
+    parser.add_argument('--batch-size',default='32',help="через запятую")
+    parser.add_argument('--epochs',type=int,default=50)
+    parser.add_argument('--workers',type=int,default=None)
+    parser.add_argument('--threads-per-worker',type=int,default=None)
+    parser.add_argument('--no-compare-sequential',action='store_true',help="не прогонять задачи последовательно(ускорение не замеряется)")
+    parser.add_argument('--out-dir',default='models')
+    args=parser.parse_args()
+
+    df,_=prepare_data(pd.read_csv(args.data))
+    X,y,_,_=encode_features(df)
+
+    grid=build_grid(
+        _parse_list(args.units,int),
+        _parse_list(args.dropout,float),
+        _parse_list(args.learning_rate,float)[0],
+        _parse_list(args.batch_size,int)[0]
+    )
+
+    summary,results,timing=run_search(
+        X,y,grid,
+        folds=args.folds,
+        epochs=args.epochs,
+        workers=args.workers,
+        threads_per_worker=args.threads_per_worker,
+        compare_sequential=not args.no_compare_sequential
+    )
+
+    best=summary[0]
+    print(f"лучшая конфигурация:{best['params']} mae={best['val_mae']:.4f}±{best['val_mae_std']:.4f}")
+    print(f"время:{timing['parallel_wall_seconds']:.1f}с,загрузка воркеров {timing['worker_utilization']:.0%}")
+    if'speedup'in timing:
+        print(f"последовательно:{timing['sequential_wall_seconds']:.1f}с,ускорение x{timing['speedup']:.2f}")
+
+    #финальная модель лучшей конфигурации в обычном формате models/
+    create_and_train_model(df,params=best['params'],out_dir=args.out_dir,epochs=args.epochs)
+
+    with open(os.path.join(args.out_dir,'search_results.json'),'w',encoding='utf-8')as f:
+        json.dump({'best':best,'summary':summary,'runs':results,'timing':timing},f,ensure_ascii=False,indent=2)
+
+if __name__=="__main__":
+    main()
@@ -1,19 +1,77 @@
+import os
 import pandas as pd
 import numpy as np
 import json
 
-def prepare_data(df):
-    """подготовка данных"""
+UNIQUE_VALUES_PATH='data/unique_values.json'
+FEATURE_COLS=['brand','name','bodyType','color','fuelType','year','power']
+
+def filter_listings(df):
+    """нужные колонки и фильтр выбросов"""
     #нужные колонки
     columns=['brand','name','bodyType','color','fuelType','year','power','price']
     df=df[columns].dropna()
-    
+
     #фильтруем выбросы
     df=df[(df['price']>10000)&(df['price']<10000000)]
     df=df[(df['year']>1990)&(df['year']<=2024)]
     df=df[(df['power']>50)&(df['power']<1000)]
-    
-    #уникальные значения
+    return df
+
+def _weights(df):
+    return df['weight'].to_numpy(dtype=np.float64)if'weight'in df else np.ones(len(df))
+
+def deduplicate(df,price_tolerance=0.05):
+    """схлопывание повторных объявлений:одинаковые признаки и цена,отличающаяся
+    не больше чем на ~price_tolerance(одна корзина log цены).строки хэшируются векторно,
+    от группы остается одна строка с весом weight=числу объявлений и средней log ценой-
+    mse по log1p(price)с такими весами дает тот же градиент,что и все исходные строки"""
+    log_price=np.log1p(df['price'].to_numpy(dtype=np.float64))
+    bucket=np.floor(log_price/np.log1p(price_tolerance)).astype(np.int64)
+    keys=pd.util.hash_pandas_object(df[FEATURE_COLS].assign(price_bucket=bucket),index=False).to_numpy()
+    codes,uniques=pd.factorize(keys)
+
+    weight=_weights(df)
+    total=np.bincount(codes,weights=weight,minlength=len(uniques))
+    mean_log=np.bincount(codes,weights=log_price*weight,minlength=len(uniques))/total
+    #factorize нумерует группы в порядке первого появления
+    _,first=np.unique(codes,return_index=True)
+
+    out=df.iloc[first][FEATURE_COLS].copy()
+    out['price']=np.expm1(mean_log)
+    out['weight']=total
+    return out
+
+def stratified_sample(df,frac=0.1,by=('brand','name'),min_per_group=1,seed=42):
+    """доля frac строк внутри каждой группы by,но не меньше min_per_group:редкие модели
+    не пропадают.вес оставшихся строк делится на долю отбора в группе,
+    так что сумма весов по группе сохраняется в среднем"""
+    rng=np.random.default_rng(seed)
+    groups=df.groupby(list(by),sort=False).ngroup().to_numpy()
+    sizes=np.bincount(groups)
+    keep_n=np.minimum(np.maximum(np.ceil(sizes*frac),min_per_group),sizes).astype(np.int64)
+
+    #случайный ранг строки внутри группы
+    order=np.lexsort((rng.random(len(df)),groups))
+    starts=np.concatenate([[0],np.cumsum(sizes)[:-1]])
+    rank=np.arange(len(df))-starts[groups[order]]
+    keep=np.sort(order[rank<keep_n[groups[order]]])
+
+    out=df.iloc[keep].copy()
+    out['weight']=_weights(df)[keep]*(sizes/keep_n)[groups[keep]]
+    return out
+
+def compaction_report(before,after):
+    """насколько меньше стал набор"""
+    return{
+        'rows_before':int(len(before)),
+        'rows_after':int(len(after)),
+        'reduction':round(1-len(after)/max(len(before),1),4),
+        'weight_total':float(_weights(after).sum())
+    }
+
+def collect_unique_values(df):
+    """справочник значений для api"""
     unique_data={
         'brands':sorted(df['brand'].astype(str).unique().tolist()),
         'models':{},
@@ -24,14 +82,41 @@ def prepare_data(df):
         'min_power':int(df['power'].min()),
         'max_power':int(df['power'].max())
     }
-    
+
     #модели по маркам
     for brand in unique_data['brands']:
         brand_models=df[df['brand']==brand]['name'].astype(str).unique()
         unique_data['models'][brand]=sorted(brand_models.tolist())
-    
+    return unique_data
+
+def prepare_data(df):
+    """подготовка данных"""
+    df=filter_listings(df)
+
+    #уникальные значения
+    unique_data=collect_unique_values(df)
+
     #сохр для api
-    with open('data/unique_values.json','w',encoding='utf-8')as f:
+    with open(UNIQUE_VALUES_PATH,'w',encoding='utf-8')as f:
+        json.dump(unique_data,f,ensure_ascii=False,indent=2)
+
+    return df,unique_data
+
+def update_unique_values(df,path=UNIQUE_VALUES_PATH):
+    """дополнение справочника значениями из новых объявлений"""
+    new_data=collect_unique_values(df)
+    if not os.path.exists(path):
+        unique_data=new_data
+    else:
+        with open(path,'r',encoding='utf-8')as f:
+            unique_data=json.load(f)
+        for key in['brands','bodyTypes','colors','fuelTypes','years']:
+            unique_data[key]=sorted(set(unique_data[key])|set(new_data[key]))
+        for brand,models in new_data['models'].items():
+            unique_data['models'][brand]=sorted(set(unique_data['models'].get(brand,[]))|set(models))
+        unique_data['min_power']=min(unique_data['min_power'],new_data['min_power'])
+        unique_data['max_power']=max(unique_data['max_power'],new_data['max_power'])
+
+    with open(path,'w',encoding='utf-8')as f:
         json.dump(unique_data,f,ensure_ascii=False,indent=2)
-    
-    return df,unique_data
\ No newline at end of file
+    return unique_data